@@ -3,6 +3,9 @@ from dotenv import load_dotenv
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 
+from llm_dispatch import DEFAULT_CONCURRENCY, run_dispatch
+from response_cache import ResponseCache
+
 load_dotenv()
 
 os.environ['OPENAI_API_KEY'] = ''
@@ -57,35 +60,45 @@ def read_python_file(file_path):
         code = f.read()
     return code
 
-def fix_code_with_prompts(file_path, llm):
-    code = read_python_file(file_path)
-    results = {}
-    for prompt_name, prompt_template in [
-            ("zero_shot", ZERO_SHOT_PROMPT),
-            ("few_shot", FEW_SHOT_PROMPT),
-            ("chain_of_thought", CHAIN_OF_THOUGHT_PROMPT)
-        ]:
-        prompt = prompt_template.format(text=code)
-        response = llm(prompt)
-        if hasattr(response, "content"):
-            fixed_code = response.content
-        else:
-            fixed_code = response  
-        results[prompt_name] = fixed_code
+PROMPTS = [
+    ("zero_shot", ZERO_SHOT_PROMPT),
+    ("few_shot", FEW_SHOT_PROMPT),
+    ("chain_of_thought", CHAIN_OF_THOUGHT_PROMPT)
+]
+
+def fix_files_with_prompts(file_paths, llm, concurrency=DEFAULT_CONCURRENCY,
+                           requests_per_minute=None, tokens_per_minute=None, cache=None):
+    """
+    Run every prompt on every file concurrently.
+
+    Returns {file_path: {prompt_name: fixed_code}}; a failed request maps to None.
+    """
+    requests = []
+    for file_path in file_paths:
+        code = read_python_file(file_path)
+        for prompt_name, prompt_template in PROMPTS:
+            requests.append(((file_path, prompt_name), prompt_template.format(text=code)))
+
+    responses = run_dispatch(llm, requests, concurrency=concurrency,
+                             requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                             cache=cache)
+    results = {file_path: {} for file_path in file_paths}
+    for response in responses:
+        file_path, prompt_name = response.key
+        results[file_path][prompt_name] = response.text if response.ok else None
     return results
 
-llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
-
-results = fix_code_with_prompts("/Users/mazen_wael/Downloads/Codes_Master:Practice/Master's_Research/bug.py", llm)
-
-for prompt_type, fixed_code in results.items():
-    print(f"Prompt Type: {prompt_type}")
-    print("Fixed Code:")
-    print(fixed_code)
-    print("\n" + "="*50 + "\n")
-
-
-
+def fix_code_with_prompts(file_path, llm, concurrency=len(PROMPTS), cache=None):
+    return fix_files_with_prompts([file_path], llm, concurrency=concurrency, cache=cache)[file_path]
 
+if __name__ == "__main__":
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, max_retries=0)
 
+    results = fix_code_with_prompts("/Users/mazen_wael/Downloads/Codes_Master:Practice/Master's_Research/bug.py", llm,
+                                    cache=ResponseCache())
 
+    for prompt_type, fixed_code in results.items():
+        print(f"Prompt Type: {prompt_type}")
+        print("Fixed Code:")
+        print(fixed_code)
+        print("\n" + "="*50 + "\n")
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the pipeline's own overhead.
+
+Every scenario runs end to end without OpenAI, Gradle or Defects4J:
+
+    fix_code    fix_code_with_prompts (PromptEngineering_CodeFixing.py) on synthetic Python files
+    quixbugs    the QuixBugs harness loop (automate_bug_fixing) on a synthetic QuixBugs tree
+    defects4j   defects4j_pipeline.main() on synthetic Java projects, one bug after the other
+
+The model is StubChatModel, a deterministic in-process chat model that echoes
+the code of the prompt (inside the FIXED CODE markers for chain-of-thought
+prompts) after a configurable latency; --http_stub sends the requests through
+ChatOpenAI to stub_chat_server.py instead, so the client overhead is included.
+`gradle` and `defects4j` are stand-in executables put first on PATH: they
+sleep for --tool_latency, generate the synthetic project on checkout, answer
+queries and report passing builds and test runs.
+
+Sizes (small, medium, large) scale the number of files/problems/bugs and the
+size of every synthetic class. Each scenario runs in a fresh process, so its
+peak memory is its own. Per-stage latencies come from the spans of tracing.py.
+
+    python benchmark.py --sizes small medium --save_baseline
+    python benchmark.py --sizes small medium       # compares against benchmark_baseline.json
+
+A run compared against a baseline exits with status 1 if throughput dropped, a
+stage's p50/p99 latency grew or peak memory grew by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import shutil
+import statistics
+import stat
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import tracing
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+REPO_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE_FILE = REPO_DIR / "benchmark_baseline.json"
+BASELINE_FORMAT_VERSION = 1
+SCENARIOS = ("fix_code", "quixbugs", "defects4j")
+# units: Python files / QuixBugs problems / Defects4J bugs; classes and methods size the synthetic code.
+SIZES = {
+    "small": {"units": 4, "classes": 4, "methods": 8},
+    "medium": {"units": 12, "classes": 16, "methods": 16},
+    "large": {"units": 24, "classes": 48, "methods": 32},
+}
+BENCH_PROJECT = "Bench"
+BENCH_PACKAGE = "bench"
+TOOL_LATENCY_ENV = "BENCH_TOOL_LATENCY"
+PROJECT_SPEC_ENV = "BENCH_PROJECT_SPEC"
+# Stage timings below this many seconds are too small to call a change a regression.
+MIN_LATENCY_DELTA = 0.005
+
+CODE_PATTERN = re.compile(r"CODE:\n(.*?)\n\n(?:Provide|First)", re.DOTALL)
+CHAT_TRAILER = "\nThis change fixes the off-by-one error in the loop bound. " * 8
+TOOL_SCRIPT = """#!{python}
+import sys
+sys.path.insert(0, {repo!r})
+from benchmark import {entry}
+sys.exit({entry}(sys.argv[1:]))
+"""
+# gradle runs once per candidate, so it is a shell script: a Python stand-in would mostly measure its own startup.
+GRADLE_SCRIPT = """#!/bin/sh
+sleep "${BENCH_TOOL_LATENCY:-0}"
+echo "> Task :test"
+echo "BUILD SUCCESSFUL in 0s"
+"""
+
+
+# ----------------------------
+# Stub Chat Model
+# ----------------------------
+
+class StubMessage:
+    """Just enough of an AIMessage(Chunk) for llm_dispatch: content and usage_metadata."""
+
+    def __init__(self, content: str, usage_metadata: dict = None):
+        self.content = content
+        self.usage_metadata = usage_metadata
+
+
+def prompt_text(prompt) -> str:
+    if isinstance(prompt, str):
+        return prompt
+    return "".join(str(getattr(m, "content", m)) for m in prompt)
+
+def stub_reply(prompt) -> str:
+    """The code of the prompt, wrapped in FIXED CODE markers (plus chatter) when the prompt asks for them."""
+    text = prompt_text(prompt)
+    match = CODE_PATTERN.search(text)
+    code = match.group(1) if match else text
+    if "---FIXED CODE---" in text:
+        return f"Step 1: find the faulty loop bound.\n---FIXED CODE---\n{code}\n---END FIXED CODE---\n{CHAT_TRAILER}"
+    return code
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubChatModel:
+    """
+    Deterministic in-process chat model with the ainvoke/astream/invoke
+    interface llm_dispatch and the harness rely on. Every request waits
+    `latency` seconds; streamed replies are sent in `chunk_chars` pieces.
+    """
+
+    model_name = "stub-bench"
+
+    def __init__(self, latency: float = 0.05, chunk_chars: int = 16, stream_delay: float = 0.0):
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.stream_delay = stream_delay
+        self.requests = 0
+
+    def _usage(self, prompt, reply: str) -> dict:
+        prompt_tokens, completion_tokens = count_tokens(prompt_text(prompt)), count_tokens(reply)
+        return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def invoke(self, prompt) -> StubMessage:
+        self.requests += 1
+        time.sleep(self.latency)
+        reply = stub_reply(prompt)
+        return StubMessage(reply, self._usage(prompt, reply))
+
+    async def ainvoke(self, prompt) -> StubMessage:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        reply = stub_reply(prompt)
+        return StubMessage(reply, self._usage(prompt, reply))
+
+    async def astream(self, prompt):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        reply = stub_reply(prompt)
+        for start in range(0, len(reply), self.chunk_chars):
+            yield StubMessage(reply[start:start + self.chunk_chars])
+            await asyncio.sleep(self.stream_delay)
+        yield StubMessage("", self._usage(prompt, reply))
+
+
+# ----------------------------
+# Synthetic Projects
+# ----------------------------
+
+def synthetic_java_class(package: str, name: str, methods: int) -> str:
+    lines = [f"package {package};", "", f"public class {name} {{", ""]
+    for i in range(methods):
+        lines += [
+            f"    public int method{i}(int x) {{",
+            "        int total = x;",
+            f"        for (int j = 0; j < {i % 7 + 1}; j++) {{",
+            f"            total += j * {i + 1};",
+            "        }",
+            "        return total;",
+            "    }",
+            "",
+        ]
+    return "\n".join(lines) + "}\n"
+
+def synthetic_java_test(package: str, test_name: str, class_name: str, methods: int, imports=()) -> str:
+    lines = [f"package {package};", "", "import org.junit.Test;", "import static org.junit.Assert.*;",
+             *(f"import {name};" for name in imports), "", f"public class {test_name} {{", ""]
+    for i in range(methods):
+        lines += [
+            "    @Test",
+            f"    public void test{i}() {{",
+            f"        assertEquals({i}, new {class_name}().method{i}({i}) - new {class_name}().method{i}(0));",
+            "    }",
+            "",
+        ]
+    return "\n".join(lines) + "}\n"
+
+def synthetic_python_file(functions: int) -> str:
+    chunks = []
+    for i in range(functions):
+        chunks.append(f"def function_{i}(values):\n"
+                      f"    total = 0\n"
+                      f"    for value in values[:{i + 1}]:\n"
+                      f"        total -= value * {i + 1}\n"
+                      f"    return total\n")
+    return "\n\n".join(chunks)
+
+def write_python_files(root: Path, files: int, functions: int):
+    root.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(files):
+        path = root / f"buggy_{i:03d}.py"
+        path.write_text(synthetic_python_file(functions))
+        paths.append(str(path))
+    return paths
+
+def write_quixbugs_tree(root: Path, problems: int, methods: int):
+    """A QuixBugs-shaped tree (java_programs/, java_testcases/junit/) with synthetic problems."""
+    names = [f"PROBLEM_{i:03d}" for i in range(problems)]
+    (root / "java_programs").mkdir(parents=True, exist_ok=True)
+    (root / "java_testcases" / "junit").mkdir(parents=True, exist_ok=True)
+    (root / "build.gradle").write_text("apply plugin: 'java'\n")
+    for name in names:
+        (root / "java_programs" / f"{name}.java").write_text(synthetic_java_class("java_programs", name, methods))
+        (root / "java_testcases" / "junit" / f"{name}_TEST.java").write_text(
+            synthetic_java_test("java_testcases.junit", f"{name}_TEST", name, methods, [f"java_programs.{name}"]))
+    return names
+
+def write_synthetic_project(root: Path, classes: int, methods: int):
+    """A Maven-layout Java project with `classes` classes and a test class for each."""
+    src = root / "src" / "main" / "java" / BENCH_PACKAGE
+    test = root / "src" / "test" / "java" / BENCH_PACKAGE
+    src.mkdir(parents=True, exist_ok=True)
+    test.mkdir(parents=True, exist_ok=True)
+    for k in range(classes):
+        (src / f"Class{k}.java").write_text(synthetic_java_class(BENCH_PACKAGE, f"Class{k}", methods))
+        (test / f"Class{k}Test.java").write_text(synthetic_java_test(BENCH_PACKAGE, f"Class{k}Test", f"Class{k}", methods))
+
+def synthetic_query_output(bugs: int, classes: int) -> str:
+    """`defects4j query` rows (QUERY_FIELDS order) for bugs 1..bugs of the synthetic project."""
+    relevant_src = ";".join(f"{BENCH_PACKAGE}.Class{k}" for k in range(classes))
+    rows = []
+    for bug in range(1, bugs + 1):
+        modified = f"{BENCH_PACKAGE}.Class{bug % classes}"
+        rows.append(f"{bug},BENCH-{bug},{relevant_src},{modified}Test,{modified},{modified}Test::test0")
+    return "\n".join(rows)
+
+
+# ----------------------------
+# Stand-in Build Tools
+# ----------------------------
+
+def tool_latency() -> float:
+    return float(os.environ.get(TOOL_LATENCY_ENV, "0"))
+
+def fake_defects4j(argv) -> int:
+    """checkout / query / compile / test / export of the synthetic project described in BENCH_PROJECT_SPEC."""
+    if not argv:
+        print("usage: defects4j <command> [options]", file=sys.stderr)
+        return 1
+    command, options, rest = argv[0], {}, argv[1:]
+    for flag, value in zip(rest, rest[1:] + [""]):
+        if flag.startswith("-"):
+            options[flag] = value if not value.startswith("-") else ""
+    spec = json.loads(os.environ.get(PROJECT_SPEC_ENV, "{}"))
+    time.sleep(tool_latency())
+    if command == "checkout":
+        write_synthetic_project(Path(options["-w"]), spec.get("classes", 4), spec.get("methods", 8))
+    elif command == "query":
+        print(synthetic_query_output(spec.get("bugs", 1), spec.get("classes", 4)))
+    elif command == "compile":
+        print("Running ant (compile)...... OK")
+    elif command == "test":
+        print("Failing tests: 0")
+    elif command == "export":
+        print("")
+    else:
+        print(f"fake defects4j: unknown command {command}", file=sys.stderr)
+        return 1
+    return 0
+
+def install_fake_tools(bin_dir: Path, latency: float, project_spec: dict):
+    """Write the stand-in gradle/defects4j executables and put them first on PATH (this process and children)."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    scripts = {"gradle": GRADLE_SCRIPT,
+               "defects4j": TOOL_SCRIPT.format(python=sys.executable, repo=str(REPO_DIR), entry="fake_defects4j")}
+    for tool, script in scripts.items():
+        path = bin_dir / tool
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+    os.environ[TOOL_LATENCY_ENV] = str(latency)
+    os.environ[PROJECT_SPEC_ENV] = json.dumps(project_spec)
+
+
+# ----------------------------
+# Scenarios
+# ----------------------------
+
+def make_llm(settings: dict):
+    if not settings.get("http_stub"):
+        return StubChatModel(latency=settings["llm_latency"])
+    from langchain_openai import ChatOpenAI
+    from stub_chat_server import start_stub_server
+
+    def reply(messages):
+        return stub_reply("".join(str(m.get("content", "")) for m in messages if m.get("role") == "user"))
+
+    _, base_url = start_stub_server(latency=settings["llm_latency"], reply=reply)
+    return ChatOpenAI(model_name="stub-bench", base_url=base_url, api_key="stub", max_retries=0,
+                      stream_usage=bool(settings.get("stream")))
+
+def run_fix_code(work: Path, size: dict, settings: dict) -> int:
+    from PromptEngineering_CodeFixing import fix_code_with_prompts
+
+    llm = make_llm(settings)
+    files = write_python_files(work / "python", size["units"], size["methods"])
+    for path in files:
+        with tracing.span("fix_file", bytes=os.path.getsize(path)):
+            fix_code_with_prompts(path, llm)
+    return len(files)
+
+def run_quixbugs(work: Path, size: dict, settings: dict) -> int:
+    from quixbugs_harness import PROMPT_STRATEGIES, automate_bug_fixing
+    from results_store import ResultsStore
+
+    llm = make_llm(settings)
+    problems = write_quixbugs_tree(work / "QuixBugs", size["units"], size["methods"])
+    automate_bug_fixing(llm, problems, str(work / "QuixBugs"), concurrency=settings["concurrency"],
+                        validator="gradle", validation_workers=settings.get("validation_workers"),
+                        precheck="parse", results_store=ResultsStore(str(work / "results.db")),
+                        stream=bool(settings.get("stream")))
+    return len(problems) * len(PROMPT_STRATEGIES)
+
+def run_defects4j(work: Path, size: dict, settings: dict) -> int:
+    import defects4j_pipeline
+
+    saved_argv = sys.argv
+    try:
+        for bug in range(1, size["units"] + 1):
+            sys.argv = ["defects4j_pipeline.py", "--project", BENCH_PROJECT, "--version", f"{bug}b",
+                        "--workdir", str(work / f"{BENCH_PROJECT}_{bug}b"), "--index_dir", str(work / "index")]
+            with tracing.span("bug", version=f"{bug}b"):
+                defects4j_pipeline.main()
+    finally:
+        sys.argv = saved_argv
+    return size["units"]
+
+SCENARIO_RUNNERS = {"fix_code": run_fix_code, "quixbugs": run_quixbugs, "defects4j": run_defects4j}
+
+
+# ----------------------------
+# Measurement
+# ----------------------------
+
+def percentile(values, fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def stage_stats(durations: dict) -> dict:
+    return {name: {"count": len(values), "p50": percentile(values, 0.50), "p99": percentile(values, 0.99),
+                   "total": sum(values)}
+            for name, values in sorted(durations.items()) if values}
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_scenario(scenario: str, size_name: str, settings: dict) -> dict:
+    """Run one scenario once, in the calling (fresh) process; returns its raw measurements."""
+    size = SIZES[size_name]
+    work = Path(tempfile.mkdtemp(prefix=f"bench-{scenario}-{size_name}-"))
+    log_file = work / "run.log"
+    spec = {"bugs": size["units"], "classes": size["classes"], "methods": size["methods"]}
+    install_fake_tools(work / "bin", settings["tool_latency"], spec)
+    # The cache directories of the real runs must neither be read nor polluted.
+    os.environ["HOME"] = str(work / "home")
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_stdout, saved_stderr = os.dup(1), os.dup(2)
+    tracer = tracing.enable()
+    start = time.perf_counter()
+    try:
+        with open(log_file, "w") as log:
+            if not settings.get("verbose"):
+                os.dup2(log.fileno(), 1)
+                os.dup2(log.fileno(), 2)
+            try:
+                units = SCENARIO_RUNNERS[scenario](work, size, settings)
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os.dup2(saved_stdout, 1)
+                os.dup2(saved_stderr, 2)
+        wall = time.perf_counter() - start
+        durations = {}
+        for span in tracer.finished():
+            durations.setdefault(span.name, []).append(span.duration)
+        return {"units": units, "wall": wall, "durations": durations, "peak_rss_mb": peak_rss_mb()}
+    finally:
+        os.close(saved_stdout)
+        os.close(saved_stderr)
+        tracing.disable()
+        if settings.get("keep"):
+            print(f"DEBUG: Kept benchmark directory {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+def measure(scenario: str, size_name: str, settings: dict, repeat: int = 1) -> dict:
+    """Run a scenario `repeat` times, each in a fresh process, and aggregate the runs."""
+    runs = []
+    for _ in range(max(1, repeat)):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            runs.append(executor.submit(run_scenario, scenario, size_name, settings).result())
+    durations = {}
+    for run in runs:
+        for name, values in run["durations"].items():
+            durations.setdefault(name, []).extend(values)
+    throughputs = [run["units"] / run["wall"] for run in runs if run["wall"] > 0]
+    return {
+        "scenario": scenario, "size": size_name, "units": runs[0]["units"], "runs": len(runs),
+        "wall": statistics.median(run["wall"] for run in runs),
+        "throughput": statistics.median(throughputs) if throughputs else 0.0,
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "stages": stage_stats(durations),
+    }
+
+
+# ----------------------------
+# Reporting and Baselines
+# ----------------------------
+
+def result_key(result: dict) -> str:
+    return f"{result['scenario']}/{result['size']}"
+
+def print_report(results):
+    print("\n==================== Benchmark ====================")
+    for result in results:
+        print(f"{result_key(result):<20} {result['units']:>4} units  {result['wall']:8.2f}s  "
+              f"{result['throughput']:8.2f} units/s  peak {result['peak_rss_mb']:7.1f} MB  ({result['runs']} run(s))")
+        for name, stats in result["stages"].items():
+            print(f"    {name:<16} {stats['count']:>5} x  p50 {stats['p50'] * 1000:9.2f} ms  "
+                  f"p99 {stats['p99'] * 1000:9.2f} ms  total {stats['total']:8.2f}s")
+
+def load_baseline(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    payload = json.loads(path.read_text())
+    if payload.get("format") != BASELINE_FORMAT_VERSION:
+        print(f"DEBUG: Ignoring baseline {path} with unknown format {payload.get('format')}")
+        return {}
+    return payload.get("results", {})
+
+def save_baseline(path: Path, results, settings: dict):
+    payload = {"format": BASELINE_FORMAT_VERSION, "created": time.time(), "python": sys.version.split()[0],
+               "settings": settings, "results": {result_key(r): r for r in results}}
+    path.write_text(json.dumps(payload, indent=2))
+    print(f"Saved baseline of {len(results)} result(s) to {path}")
+
+def compare_to_baseline(results, baseline: dict, tolerance: float):
+    """Print the change of every metric against the baseline; returns the list of regressions."""
+    regressions = []
+
+    def check(key, metric, old, new, higher_is_better=False, min_delta=0.0):
+        if not old:
+            return
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance and abs(new - old) > min_delta:
+            flag = "  <-- REGRESSION"
+            regressions.append(f"{key} {metric}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+        print(f"    {metric:<28} {old:12.4g} -> {new:12.4g}  {change:+7.1%}{flag}")
+
+    print("\n============ Comparison with baseline ============")
+    for result in results:
+        key = result_key(result)
+        old = baseline.get(key)
+        if old is None:
+            print(f"{key}: not in the baseline")
+            continue
+        print(key)
+        check(key, "throughput (units/s)", old["throughput"], result["throughput"], higher_is_better=True)
+        check(key, "peak memory (MB)", old["peak_rss_mb"], result["peak_rss_mb"])
+        for name, stats in result["stages"].items():
+            old_stats = old["stages"].get(name)
+            if old_stats is None:
+                continue
+            for metric in ("p50", "p99"):
+                check(key, f"{name} {metric} (s)", old_stats[metric], stats[metric], min_delta=MIN_LATENCY_DELTA)
+    return regressions
+
+
+# ----------------------------
+# Main Script
+# ----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with a stub LLM and stand-in gradle/defects4j")
+    parser.add_argument("--scenarios", type=str, nargs="*", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--sizes", type=str, nargs="*", default=["small"], choices=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario and size (medians are reported)")
+    parser.add_argument("--llm_latency", type=float, default=0.05, help="Seconds the stub model takes per request")
+    parser.add_argument("--tool_latency", type=float, default=0.02,
+                        help="Seconds every stand-in gradle/defects4j invocation takes")
+    parser.add_argument("--concurrency", type=int, default=8, help="In-flight LLM requests in the QuixBugs harness")
+    parser.add_argument("--validation_workers", type=int, default=None, help="Parallel validations in the harness")
+    parser.add_argument("--stream", action="store_true", help="Stream the stub responses in the QuixBugs harness")
+    parser.add_argument("--http_stub", action="store_true",
+                        help="Send requests through ChatOpenAI to stub_chat_server.py instead of the in-process stub")
+    parser.add_argument("--baseline", type=str, default=str(DEFAULT_BASELINE_FILE), help="Baseline JSON file")
+    parser.add_argument("--save_baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative change of a metric that counts as a regression")
+    parser.add_argument("--output", type=str, default=None, help="Also write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark directories (and their run.log)")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the benchmarked code")
+    args = parser.parse_args()
+
+    settings = {"llm_latency": args.llm_latency, "tool_latency": args.tool_latency, "concurrency": args.concurrency,
+                "validation_workers": args.validation_workers, "stream": args.stream, "http_stub": args.http_stub,
+                "keep": args.keep, "verbose": args.verbose}
+    results = []
+    for size_name in args.sizes:
+        for scenario in args.scenarios:
+            print(f"DEBUG: Running {scenario}/{size_name} ({args.repeat} run(s))")
+            results.append(measure(scenario, size_name, settings, args.repeat))
+    print_report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    baseline_file = Path(args.baseline)
+    if args.save_baseline:
+        save_baseline(baseline_file, results, settings)
+        return
+    baseline = load_baseline(baseline_file)
+    if not baseline:
+        print(f"No baseline at {baseline_file}; run with --save_baseline to create one")
+        return
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        raise SystemExit(1)
+    print("\nNo regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Token and cost budgets for experiment sweeps.
+
+Before anything is dispatched every unit (one prompt, or one whole Defects4J
+prompt series) is registered with its estimated prompt tokens; the output is
+projected from the observed output/input ratio of the model (a conservative
+default until a few responses have come back). Units are ordered cheapest and
+most informative first: within a group (e.g. the three strategies of one
+QuixBugs problem, or the series of one Defects4J bug) each further unit is
+worth less, so every group is covered once before any group is covered twice.
+
+While the sweep runs, reserve(key) is asked right before a request is sent
+(plug it into llm_dispatch's `skip` hook, which an n>1 request asks once per
+sample) and settle(result) books the tokens the response actually used (call
+it from `on_result`, which gets one result per sample). A request that would
+take the global, per-model or per-dataset token budget (or the cost budget)
+over its limit is not sent. report() compares the projected with the actual
+tokens and cost per dataset and model.
+
+As a script it plans a sweep without dispatching anything:
+
+    python budget_scheduler.py --model gpt-4 --max_tokens 2000000 \
+        --quixbugs_path /content/QuixBugs --defects4j_workdirs d4j/Lang_1b d4j/Cli_2b \
+        --dataset_budget defects4j=500000
+"""
+import argparse
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llm_dispatch import estimate_tokens
+from token_chunking import encode, get_encoding
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+# USD per million (input, output) tokens; the longest matching model-name prefix wins.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+# Until MIN_RATIO_OBSERVATIONS responses of a model are in, a reply is assumed to be as long as its prompt.
+DEFAULT_OUTPUT_RATIO = 1.0
+MIN_RATIO_OBSERVATIONS = 3
+SERIES_FOLDER_SUFFIX = "_prompt_series"
+
+
+@dataclass
+class BudgetUnit:
+    """One schedulable request (or prompt series) and its accounting."""
+    key: Any
+    dataset: str
+    model: str
+    prompt_tokens: int
+    group: Any = None
+    requests: int = 1                  # prompts sent for the unit (the chunks of a series)
+    info: float = 1.0                  # set by order(): 1 for the first unit of a group, 1/2 for the second, ...
+    dispatched: int = 0
+    cached: int = 0
+    denied: int = 0
+    projected_tokens: int = 0          # projection of what was dispatched, booked at reserve time
+    projected_cost: float = 0.0
+    actual_tokens: int = 0
+    actual_cost: float = 0.0
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def model_price(model: str, prices: Dict[str, Tuple[float, float]] = MODEL_PRICES) -> Optional[Tuple[float, float]]:
+    matches = [name for name in prices if model.startswith(name)]
+    return prices[max(matches, key=len)] if matches else None
+
+def token_cost(model: str, input_tokens: int, output_tokens: int, prices=MODEL_PRICES) -> float:
+    price = model_price(model, prices)
+    if price is None:
+        return 0.0
+    return (input_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+
+def count_prompt_tokens(prompt: Any, model: str) -> int:
+    """Exact prompt tokens with the model's tiktoken encoding, or the dispatcher's estimate without tiktoken."""
+    text = prompt if isinstance(prompt, str) else "".join(str(getattr(m, "content", m)) for m in prompt)
+    try:
+        return len(encode(get_encoding(model), text))
+    except ImportError:
+        return estimate_tokens(text)
+
+def parse_budgets(values: Sequence[str]) -> Dict[str, int]:
+    """["gpt-4=500000", "quixbugs=2e5"] -> {"gpt-4": 500000, "quixbugs": 200000}"""
+    budgets = {}
+    for value in values or ():
+        name, _, limit = value.partition("=")
+        if not name or not limit:
+            raise ValueError(f"Invalid budget {value!r}; expected NAME=TOKENS")
+        budgets[name.strip()] = int(float(limit))
+    return budgets
+
+def prompt_series_parts(work_dir: Path) -> Dict[str, List[str]]:
+    """{series folder name: [prompt text of part_1, part_2, ...]} of one Defects4J working directory."""
+    series = {}
+    for folder in sorted(Path(work_dir).glob(f"*{SERIES_FOLDER_SUFFIX}")):
+        parts = sorted(folder.glob("part_*.txt"), key=lambda p: int(p.stem.split("_")[1]))
+        if parts:
+            series[folder.name] = [p.read_text() for p in parts]
+    return series
+
+
+class BudgetScheduler:
+    """Orders units by cost and information, and keeps dispatch within token and cost budgets."""
+
+    def __init__(self, max_tokens: Optional[int] = None, model_budgets: Optional[Dict[str, int]] = None,
+                 dataset_budgets: Optional[Dict[str, int]] = None, max_cost: Optional[float] = None,
+                 prices: Dict[str, Tuple[float, float]] = MODEL_PRICES,
+                 output_ratio: float = DEFAULT_OUTPUT_RATIO):
+        self.limits = {("total", ""): max_tokens}
+        self.limits.update({("model", name): limit for name, limit in (model_budgets or {}).items()})
+        self.limits.update({("dataset", name): limit for name, limit in (dataset_budgets or {}).items()})
+        self.max_cost = max_cost
+        self.prices = prices
+        self.output_ratio = output_ratio
+        self.units: Dict[Any, BudgetUnit] = {}
+        self.spent = defaultdict(int)           # scope -> tokens used by settled requests
+        self.reserved = defaultdict(int)        # scope -> projected tokens of requests in flight
+        self.spent_cost = 0.0
+        self.reserved_cost = 0.0
+        self._reservations: Dict[Any, List[Tuple[int, float]]] = defaultdict(list)
+        self._observed = defaultdict(lambda: [0, 0, 0])   # model -> [responses, input tokens, output tokens]
+        self._unpriced = set()
+        self._lock = threading.Lock()
+
+    # -- planning --
+
+    def add_unit(self, key, prompt: Any, dataset: str, model: str, group=None,
+                 prompt_tokens: Optional[int] = None, requests: int = 1) -> BudgetUnit:
+        """Register a unit; prompt_tokens overrides counting the prompt (e.g. the sum over a series)."""
+        tokens = prompt_tokens if prompt_tokens is not None else count_prompt_tokens(prompt, model)
+        unit = BudgetUnit(key=key, dataset=dataset, model=model, prompt_tokens=tokens, group=group,
+                          requests=requests)
+        with self._lock:
+            if model not in self._unpriced and model_price(model, self.prices) is None:
+                self._unpriced.add(model)
+                print(f"DEBUG: Budget: no price known for model {model}; its cost is counted as $0")
+            self.units[key] = unit
+        return unit
+
+    def ratio(self, model: str) -> float:
+        responses, input_tokens, output_tokens = self._observed[model]
+        if responses < MIN_RATIO_OBSERVATIONS or not input_tokens:
+            return self.output_ratio
+        return output_tokens / input_tokens
+
+    def projected_output(self, unit: BudgetUnit) -> int:
+        return int(unit.prompt_tokens * self.ratio(unit.model))
+
+    def projected_tokens(self, unit: BudgetUnit) -> int:
+        return unit.prompt_tokens + self.projected_output(unit)
+
+    def projected_cost(self, unit: BudgetUnit) -> float:
+        return token_cost(unit.model, unit.prompt_tokens, self.projected_output(unit), self.prices)
+
+    def order(self, requests: Sequence[Tuple[Any, Any]]) -> List[Tuple[Any, Any]]:
+        """
+        Sort (key, prompt) pairs by information per projected token: within a
+        group the n-th cheapest unit is worth 1/n, so cheap units and units of
+        groups not covered yet come first. Unregistered keys keep their place at the end.
+        """
+        with self._lock:
+            by_group = defaultdict(list)
+            for key, _ in requests:
+                unit = self.units.get(key)
+                if unit is not None:
+                    by_group[unit.group if unit.group is not None else key].append(unit)
+            for units in by_group.values():
+                for rank, unit in enumerate(sorted(units, key=self.projected_tokens)):
+                    unit.info = 1.0 / (rank + 1)
+
+            def priority(item):
+                unit = self.units.get(item[0])
+                if unit is None:
+                    return (1, 0.0)
+                return (0, -unit.info / max(1, self.projected_tokens(unit)))
+
+            return sorted(requests, key=priority)
+
+    def scopes(self, unit: BudgetUnit):
+        return [("total", ""), ("model", unit.model), ("dataset", unit.dataset)]
+
+    def _fits(self, unit: BudgetUnit, tokens: int, cost: float, planned=None, planned_cost: float = 0.0) -> bool:
+        """Whether tokens/cost more (on top of what is spent, reserved and planned) stay within every budget."""
+        for scope in self.scopes(unit):
+            limit = self.limits.get(scope)
+            used = self.spent[scope] + self.reserved[scope] + (planned or {}).get(scope, 0)
+            if limit is not None and used + tokens > limit:
+                return False
+        if self.max_cost is not None and self.spent_cost + self.reserved_cost + planned_cost + cost > self.max_cost:
+            return False
+        return True
+
+    def simulate(self, requests: Sequence[Tuple[Any, Any]]):
+        """Greedy dry run in order(): (units that fit, units that do not) at the current projections."""
+        selected, excluded = [], []
+        planned, planned_cost = defaultdict(int), 0.0
+        for key, _ in self.order(requests):
+            unit = self.units[key]
+            tokens, cost = self.projected_tokens(unit), self.projected_cost(unit)
+            if self._fits(unit, tokens, cost, planned, planned_cost):
+                selected.append(unit)
+                planned_cost += cost
+                for scope in self.scopes(unit):
+                    planned[scope] += tokens
+            else:
+                excluded.append(unit)
+        return selected, excluded
+
+    # -- enforcement --
+
+    def reserve(self, key) -> bool:
+        """Book the projected tokens of one request of key; False (and nothing booked) if a budget would be exceeded."""
+        with self._lock:
+            unit = self.units.get(key)
+            if unit is None:
+                return True
+            tokens, cost = self.projected_tokens(unit), self.projected_cost(unit)
+            if not self._fits(unit, tokens, cost):
+                unit.denied += 1
+                print(f"DEBUG: Budget: not sending {key!r} (~{tokens} tokens, ${cost:.4f}); it would exceed a budget")
+                return False
+            for scope in self.scopes(unit):
+                self.reserved[scope] += tokens
+            self.reserved_cost += cost
+            self._reservations[key].append((tokens, cost))
+            unit.dispatched += 1
+            unit.projected_tokens += tokens
+            unit.projected_cost += cost
+            return True
+
+    def take_denied(self, key) -> bool:
+        """Whether a skipped request of key was turned down by the budget (consumes that record)."""
+        with self._lock:
+            unit = self.units.get(key)
+            if unit is None or unit.denied <= 0:
+                return False
+            unit.denied -= 1
+            return True
+
+    def settle(self, result):
+        """Book the usage of a finished DispatchResult and release its reservation."""
+        with self._lock:
+            unit = self.units.get(result.key)
+            if unit is None:
+                return
+            if result.cached:
+                unit.cached += 1
+                return
+            if getattr(result, "skipped", False) or not self._reservations[result.key]:
+                return
+            tokens, cost = self._reservations[result.key].pop(0)
+            for scope in self.scopes(unit):
+                self.reserved[scope] -= tokens
+            self.reserved_cost -= cost
+            usage = result.usage or {}
+            input_tokens = usage.get("input_tokens", 0)
+            output_tokens = usage.get("output_tokens", 0)
+            total = usage.get("total_tokens") or input_tokens + output_tokens
+            actual_cost = token_cost(unit.model, input_tokens, output_tokens, self.prices)
+            for scope in self.scopes(unit):
+                self.spent[scope] += total
+            self.spent_cost += actual_cost
+            unit.actual_tokens += total
+            unit.actual_cost += actual_cost
+            if input_tokens and not usage.get("estimated"):
+                observed = self._observed[unit.model]
+                observed[0] += 1
+                observed[1] += input_tokens
+                observed[2] += output_tokens
+
+    def remaining(self) -> Dict[str, Optional[int]]:
+        with self._lock:
+            return {f"{kind}:{name}" if name else kind: (limit - self.spent[(kind, name)] if limit is not None else None)
+                    for (kind, name), limit in self.limits.items()}
+
+    # -- reporting --
+
+    def report(self) -> List[dict]:
+        """Projected against actual tokens and cost per (dataset, model)."""
+        rows = {}
+        with self._lock:
+            for unit in self.units.values():
+                row = rows.setdefault((unit.dataset, unit.model), {
+                    "dataset": unit.dataset, "model": unit.model, "units": 0, "dispatched": 0, "cached": 0,
+                    "over_budget": 0, "projected_tokens": 0, "actual_tokens": 0,
+                    "projected_cost": 0.0, "actual_cost": 0.0})
+                row["units"] += 1
+                row["dispatched"] += unit.dispatched
+                row["cached"] += unit.cached
+                row["over_budget"] += int(unit.dispatched == 0 and unit.cached == 0)
+                for name in ("projected_tokens", "actual_tokens", "projected_cost", "actual_cost"):
+                    row[name] += getattr(unit, name)
+        return sorted(rows.values(), key=lambda r: (r["dataset"], r["model"]))
+
+    def print_report(self):
+        print("\nBudget report (projected vs actual):")
+        for row in self.report():
+            print(f"  {row['dataset']} / {row['model']}: {row['dispatched']} request(s) sent for {row['units']} "
+                  f"unit(s), {row['cached']} cached, {row['over_budget']} unit(s) not sent; "
+                  f"tokens {row['projected_tokens']} projected / {row['actual_tokens']} actual; "
+                  f"cost ${row['projected_cost']:.4f} projected / ${row['actual_cost']:.4f} actual")
+        for scope, left in self.remaining().items():
+            if left is not None:
+                print(f"  {scope} budget: {left} token(s) left")
+        if self.max_cost is not None:
+            print(f"  cost budget: ${self.max_cost - self.spent_cost:.4f} left")
+
+
+# ----------------------------
+# Main Script
+# ----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan a sweep within token and cost budgets (nothing is sent)")
+    parser.add_argument("--model", type=str, default="gpt-4", help="Model the prompts would be sent to")
+    parser.add_argument("--quixbugs_path", type=str, default=None, help="QuixBugs checkout to plan all problems of")
+    parser.add_argument("--defects4j_workdirs", type=str, nargs="*", default=[],
+                        help="Defects4J working directories with generated prompt series")
+    parser.add_argument("--max_tokens", type=float, default=None, help="Token budget of the whole sweep")
+    parser.add_argument("--max_cost", type=float, default=None, help="Cost budget of the whole sweep (USD)")
+    parser.add_argument("--model_budget", type=str, nargs="*", default=[], help="Per-model budgets as MODEL=TOKENS")
+    parser.add_argument("--dataset_budget", type=str, nargs="*", default=[],
+                        help="Per-dataset budgets as DATASET=TOKENS (datasets: quixbugs, defects4j)")
+    parser.add_argument("--output_ratio", type=float, default=DEFAULT_OUTPUT_RATIO,
+                        help="Projected output tokens per prompt token")
+    args = parser.parse_args()
+
+    scheduler = BudgetScheduler(int(args.max_tokens) if args.max_tokens else None, parse_budgets(args.model_budget),
+                                parse_budgets(args.dataset_budget), args.max_cost, output_ratio=args.output_ratio)
+    requests = []
+    if args.quixbugs_path:
+        from quixbugs_harness import DATASET, PROBLEM_NAMES, PROMPT_STRATEGIES, get_java_files
+
+        for problem_name in PROBLEM_NAMES:
+            java_file, _ = get_java_files(problem_name, args.quixbugs_path)
+            code = Path(java_file).read_text()
+            for prompt_name, prompt in PROMPT_STRATEGIES:
+                key = (problem_name, prompt_name)
+                scheduler.add_unit(key, prompt.format(text=code), DATASET, args.model, group=problem_name)
+                requests.append((key, None))
+    for work_dir in args.defects4j_workdirs:
+        for series, parts in prompt_series_parts(Path(work_dir)).items():
+            key = (Path(work_dir).name, series)
+            tokens = sum(count_prompt_tokens(part, args.model) for part in parts)
+            scheduler.add_unit(key, None, "defects4j", args.model, group=Path(work_dir).name,
+                               prompt_tokens=tokens, requests=len(parts))
+            requests.append((key, None))
+    if not requests:
+        parser.error("nothing to plan; give --quixbugs_path and/or --defects4j_workdirs")
+
+    selected, excluded = scheduler.simulate(requests)
+    totals = defaultdict(lambda: [0, 0, 0.0, 0, 0])   # dataset -> [selected, tokens, cost, excluded, excluded tokens]
+    for unit in selected:
+        entry = totals[unit.dataset]
+        entry[0] += 1
+        entry[1] += scheduler.projected_tokens(unit)
+        entry[2] += scheduler.projected_cost(unit)
+    for unit in excluded:
+        totals[unit.dataset][3] += 1
+        totals[unit.dataset][4] += scheduler.projected_tokens(unit)
+    print(f"Plan for {args.model}: {len(selected)} of {len(requests)} unit(s) fit the budget")
+    for dataset, (count, tokens, cost, dropped, dropped_tokens) in sorted(totals.items()):
+        print(f"  {dataset}: {count} unit(s), ~{tokens} tokens, ~${cost:.2f}"
+              + (f"; {dropped} unit(s) (~{dropped_tokens} tokens) left out" if dropped else ""))
+    for unit in excluded:
+        print(f"  left out: {unit.key} ({unit.requests} prompt(s), ~{scheduler.projected_tokens(unit)} tokens)")
+
+if __name__ == "__main__":
+    main()
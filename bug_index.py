@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Parsed and indexed Defects4J query metadata.
+
+`defects4j query` prints one CSV line per bug. Instead of re-splitting that
+output every time a field is needed, BugIndex parses it once into typed
+BugRecords keyed by bug id, and stores the result on disk per project so later
+versions and reruns do not have to shell out to Defects4J again.
+"""
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+QUERY_FIELDS = ["bug.id", "report.id", "classes.relevant.src", "classes.relevant.test",
+                "classes.modified", "tests.trigger"]
+DEFAULT_INDEX_DIR = Path.home() / ".cache" / "defects4j_index"
+INDEX_FORMAT_VERSION = 1
+
+
+class TriggerTest(NamedTuple):
+    class_name: str
+    method: str
+
+    def __str__(self):
+        return f"{self.class_name}::{self.method}" if self.method else self.class_name
+
+
+@dataclass
+class BugRecord:
+    """Metadata of one Defects4J bug."""
+    bug_id: str
+    report_id: str = ""
+    relevant_src: List[str] = field(default_factory=list)
+    relevant_test: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    trigger_tests: List[TriggerTest] = field(default_factory=list)
+
+    @property
+    def trigger_test_classes(self) -> List[str]:
+        """Distinct classes containing trigger tests, in first-seen order."""
+        return list(dict.fromkeys(t.class_name for t in self.trigger_tests))
+
+    def trigger_methods(self, class_name: str) -> List[str]:
+        return [t.method for t in self.trigger_tests if t.class_name == class_name and t.method]
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def split_list(value: str) -> List[str]:
+    """Split a semicolon-separated Defects4J list field."""
+    return [item.strip() for item in value.split(";") if item.strip()]
+
+def parse_trigger_tests(value: str) -> List[TriggerTest]:
+    tests = []
+    for entry in split_list(value):
+        class_name, _, method = entry.partition("::")
+        tests.append(TriggerTest(class_name.strip(), method.strip()))
+    return tests
+
+def bug_id_from_version(version: str) -> str:
+    """Turn a Defects4J version id such as "1b" or "12f" into the bug id ("1", "12")."""
+    match = re.match(r"(\d+)", version)
+    return match.group(1) if match else version
+
+def parse_query_output(query_output: str) -> Dict[str, BugRecord]:
+    """Parse `defects4j query` CSV output (fields in QUERY_FIELDS order) into records keyed by bug id."""
+    records = {}
+    for row in csv.reader(io.StringIO(query_output.strip())):
+        if not row or not row[0].strip():
+            continue
+        row = row + [""] * (len(QUERY_FIELDS) - len(row))
+        bug_id = row[0].strip()
+        records[bug_id] = BugRecord(
+            bug_id=bug_id,
+            report_id=row[1].strip(),
+            relevant_src=split_list(row[2]),
+            relevant_test=split_list(row[3]),
+            modified=split_list(row[4]),
+            trigger_tests=parse_trigger_tests(row[5]),
+        )
+    return records
+
+
+class BugIndex:
+    """All bugs of one Defects4J project, with O(1) lookup by bug id."""
+
+    def __init__(self, project: str, records: Dict[str, BugRecord], query_output: str = ""):
+        self.project = project
+        self.records = records
+        self.query_output = query_output
+
+    @classmethod
+    def from_query_output(cls, project: str, query_output: str) -> "BugIndex":
+        return cls(project, parse_query_output(query_output), query_output)
+
+    def get(self, bug_id: str) -> Optional[BugRecord]:
+        return self.records.get(bug_id_from_version(str(bug_id)))
+
+    def __getitem__(self, bug_id: str) -> BugRecord:
+        record = self.get(bug_id)
+        if record is None:
+            raise KeyError(f"{self.project} has no bug {bug_id}")
+        return record
+
+    def __contains__(self, bug_id) -> bool:
+        return self.get(bug_id) is not None
+
+    def __len__(self):
+        return len(self.records)
+
+    def bug_ids(self) -> List[str]:
+        return sorted(self.records, key=lambda b: int(b) if b.isdigit() else b)
+
+    def save(self, path: Path):
+        payload = {
+            "format": INDEX_FORMAT_VERSION,
+            "project": self.project,
+            "created": time.time(),
+            "query_output": self.query_output,
+            "records": {bug_id: asdict(record) for bug_id, record in self.records.items()},
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A unique temporary file per writer, so concurrent runs indexing the same project cannot interleave.
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(json.dumps(payload))
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["BugIndex"]:
+        try:
+            payload = json.loads(path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if payload.get("format") != INDEX_FORMAT_VERSION:
+            return None
+        records = {}
+        for bug_id, data in payload["records"].items():
+            data["trigger_tests"] = [TriggerTest(*t) for t in data["trigger_tests"]]
+            records[bug_id] = BugRecord(**data)
+        return cls(payload["project"], records, payload.get("query_output", ""))
+
+    @classmethod
+    def load_or_query(cls, project: str, query_fn: Callable[[str], str],
+                      index_dir: Path = DEFAULT_INDEX_DIR, refresh: bool = False) -> "BugIndex":
+        """
+        Load the project's index from index_dir, or build it with query_fn(project)
+        and store it. A query that yields no bugs raises RuntimeError instead of
+        caching an empty index.
+        """
+        path = Path(index_dir) / f"{project}.json"
+        if not refresh:
+            index = cls.load(path)
+            if index is not None:
+                print(f"Loaded bug index for {project} from {path} ({len(index)} bugs)")
+                return index
+        index = cls.from_query_output(project, query_fn(project))
+        if not index.records:
+            raise RuntimeError(f"defects4j query for {project} returned no bugs; not saving an index")
+        index.save(path)
+        print(f"Saved bug index for {project} to {path} ({len(index)} bugs)")
+        return index
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Cache of pristine Defects4J checkouts.
+
+`defects4j checkout` + `defects4j compile` re-export and rebuild the same
+project version for every prompt experiment and every rerun. This cache keeps
+one pristine, compiled tree per (project, version) and hands out working
+copies of it, cloned with reflinks (copy-on-write) when the filesystem
+supports them and with plain copies otherwise. Hardlinks are available as an
+opt-in for callers that never modify files in place.
+
+Every pristine tree has a manifest (size, mtime and SHA-256 of every file)
+that is checked before a working copy is made: a quick size/mtime check by
+default, a full hash check on request. A corrupted tree is rebuilt. When the
+total size of the cache exceeds `max_bytes`, the least recently used versions
+are evicted.
+
+Cache layout:
+
+    <cache_root>/<project>/<version>/tree/           pristine compiled checkout
+    <cache_root>/<project>/<version>/manifest.json   integrity manifest + last use
+    <cache_root>/<project>/<version>.lock            per-version lock file
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from workspace_pool import clone_tree, reflink_supported
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+DEFAULT_CACHE_ROOT = Path.home() / ".cache" / "defects4j_checkouts"
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+MANIFEST_NAME = "manifest.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def build_manifest(tree: Path) -> dict:
+    """Record size, mtime and SHA-256 of every file in the tree."""
+    files = {}
+    for dirpath, _, filenames in os.walk(tree):
+        for name in filenames:
+            path = Path(dirpath) / name
+            stat = path.stat()
+            files[str(path.relative_to(tree))] = [stat.st_size, stat.st_mtime_ns, file_sha256(path)]
+    return {"files": files, "bytes": sum(entry[0] for entry in files.values())}
+
+def verify_tree(tree: Path, manifest: dict, full: bool = False) -> list:
+    """Return the relative paths that are missing or differ from the manifest."""
+    bad = []
+    for rel_path, (size, mtime_ns, sha256) in manifest["files"].items():
+        path = tree / rel_path
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            bad.append(rel_path)
+            continue
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            bad.append(rel_path)
+        elif full and file_sha256(path) != sha256:
+            bad.append(rel_path)
+    return bad
+
+@contextmanager
+def file_lock(path: Path):
+    """Exclusive advisory lock, so concurrent pipeline runs do not build the same version twice."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class CheckoutCache:
+    """
+    Pristine compiled checkouts keyed by (project, version).
+
+    `link_mode` is "auto" (reflink when supported, otherwise copy), "reflink",
+    "copy" or "hardlink". Hardlinked working copies share inodes with the
+    pristine tree, so anything that rewrites a file in place (e.g. a rebuild
+    overwriting class files) corrupts the cache; the integrity check will
+    notice and rebuild, but only use hardlinks for read-mostly workflows.
+    """
+
+    def __init__(self, cache_root=DEFAULT_CACHE_ROOT, max_bytes: int = DEFAULT_MAX_BYTES,
+                 link_mode: str = "auto", defects4j: str = "defects4j"):
+        self.cache_root = Path(cache_root).resolve()
+        self.cache_root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.link_mode = link_mode
+        self.defects4j = defects4j
+
+    def entry_dir(self, project: str, version: str) -> Path:
+        return self.cache_root / project / version
+
+    def _lock(self, project: str, version: str):
+        return file_lock(self.cache_root / project / f"{version}.lock")
+
+    def _read_manifest(self, entry: Path):
+        manifest_file = entry / MANIFEST_NAME
+        if not manifest_file.exists():
+            return None
+        try:
+            return json.loads(manifest_file.read_text())
+        except json.JSONDecodeError:
+            return None
+
+    def _write_manifest(self, entry: Path, manifest: dict):
+        tmp = entry / f"{MANIFEST_NAME}.tmp"
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, entry / MANIFEST_NAME)
+
+    def _build(self, project: str, version: str, entry: Path) -> dict:
+        """Check out and compile a pristine tree, then write its manifest."""
+        staging = entry / "staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.parent.mkdir(parents=True, exist_ok=True)
+        checkout_cmd = [self.defects4j, "checkout", "-p", project, "-v", version, "-w", str(staging)]
+        print(f"Checking out project into cache with command: {' '.join(checkout_cmd)}")
+        subprocess.run(checkout_cmd, check=True)
+        compile_cmd = [self.defects4j, "compile", "-w", str(staging)]
+        print(f"Compiling cached checkout with command: {' '.join(compile_cmd)}")
+        subprocess.run(compile_cmd, check=True)
+
+        tree = entry / "tree"
+        shutil.rmtree(tree, ignore_errors=True)
+        os.replace(staging, tree)
+        manifest = build_manifest(tree)
+        manifest.update({"project": project, "version": version, "created": time.time(), "last_used": time.time()})
+        self._write_manifest(entry, manifest)
+        print(f"DEBUG: Cached {project}-{version} ({len(manifest['files'])} files, {manifest['bytes']} bytes)")
+        return manifest
+
+    def _ensure_locked(self, project: str, version: str, full_verify: bool) -> Path:
+        entry = self.entry_dir(project, version)
+        manifest = self._read_manifest(entry)
+        tree = entry / "tree"
+        if manifest is not None and tree.is_dir():
+            bad = verify_tree(tree, manifest, full=full_verify)
+            if bad:
+                print(f"DEBUG: Cached {project}-{version} failed integrity check "
+                      f"({len(bad)} file(s), e.g. {bad[0]}); rebuilding")
+                manifest = None
+            else:
+                print(f"DEBUG: Cache hit for {project}-{version}")
+        if manifest is None:
+            manifest = self._build(project, version, entry)
+        manifest["last_used"] = time.time()
+        self._write_manifest(entry, manifest)
+        return tree
+
+    def ensure(self, project: str, version: str, full_verify: bool = False) -> Path:
+        """Return the pristine tree for (project, version), building or repairing it if needed."""
+        with self._lock(project, version):
+            tree = self._ensure_locked(project, version, full_verify)
+        self.evict(keep=(project, version))
+        return tree
+
+    def working_copy(self, project: str, version: str, work_dir, full_verify: bool = False) -> Path:
+        """Materialize a working copy of the cached checkout at work_dir."""
+        work_dir = Path(work_dir).resolve()
+        work_dir.mkdir(parents=True, exist_ok=True)
+        # Hold the lock while cloning so the tree cannot be evicted or rebuilt underneath us.
+        with self._lock(project, version):
+            tree = self._ensure_locked(project, version, full_verify)
+            mode = self.link_mode
+            if mode == "auto":
+                mode = "reflink" if reflink_supported(tree, work_dir) else "copy"
+            count = clone_tree(tree, work_dir, mode, excludes=())
+        print(f"Created working copy of {project}-{version} at {work_dir} ({count} files, mode={mode})")
+        self.evict(keep=(project, version))
+        return work_dir
+
+    def entries(self):
+        """Yield (project, version, manifest) for every cached version."""
+        for manifest_file in self.cache_root.glob(f"*/*/{MANIFEST_NAME}"):
+            entry = manifest_file.parent
+            manifest = self._read_manifest(entry)
+            if manifest is not None:
+                yield entry.parent.name, entry.name, manifest
+
+    def evict(self, keep=None):
+        """Remove least recently used versions until the cache fits in max_bytes."""
+        entries = sorted(self.entries(), key=lambda e: e[2].get("last_used", 0))
+        total = sum(manifest["bytes"] for _, _, manifest in entries)
+        for project, version, manifest in entries:
+            if total <= self.max_bytes:
+                break
+            if (project, version) == keep:
+                continue
+            with self._lock(project, version):
+                shutil.rmtree(self.entry_dir(project, version), ignore_errors=True)
+            total -= manifest["bytes"]
+            print(f"DEBUG: Evicted cached checkout {project}-{version} ({manifest['bytes']} bytes)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the cache of pristine Defects4J checkouts")
+    parser.add_argument("--cache_dir", type=str, default=str(DEFAULT_CACHE_ROOT))
+    parser.add_argument("--verify", action="store_true", help="Fully verify every cached tree against its manifest")
+    args = parser.parse_args()
+
+    cache = CheckoutCache(args.cache_dir)
+    for project, version, manifest in cache.entries():
+        status = ""
+        if args.verify:
+            bad = verify_tree(cache.entry_dir(project, version) / "tree", manifest, full=True)
+            status = "OK" if not bad else f"CORRUPT ({len(bad)} file(s))"
+        print(f"{project}-{version}: {len(manifest['files'])} files, {manifest['bytes']} bytes {status}")
+
+if __name__ == "__main__":
+    main()
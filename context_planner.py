@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Token-budget-aware selection of the context that goes into a Defects4J prompt.
+
+For large projects (Chart, Closure) the relevant src and test classes add up
+to far more than one context window, so the prompt series becomes dozens of
+chunk files. The planner instead builds one prompt that fits a token budget:
+
+1. The class to modify is always included in full; the trigger tests (with
+   it, the seeds) come next, in full or as a skeleton if that is all that fits.
+2. The other relevant files are ranked by how closely they are connected to
+   the seeds in the import/reference graph (a personalized PageRank over
+   "file A mentions a type declared in file B" edges).
+3. Files are packed in rank order: in full while they fit, then as a
+   skeleton (declarations only, member bodies elided), and the rest are only
+   listed by name.
+"""
+from dataclasses import dataclass, field
+from math import log1p
+from typing import Callable, Dict, List, Optional, Sequence
+
+from java_source import code_tokens, declared_types, skeleton
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+ROLE_MODIFIED = "modified"
+ROLE_TRIGGER_TEST = "trigger_test"
+ROLE_SRC = "src"
+ROLE_TEST = "test"
+SEED_WEIGHTS = {ROLE_MODIFIED: 2.0, ROLE_TRIGGER_TEST: 1.0}
+RESTART_PROBABILITY = 0.3
+RANK_ITERATIONS = 30
+OMITTED_HEADER = "===== OMITTED FILES (not included to fit the context budget) =====\n"
+
+
+@dataclass
+class ContextFile:
+    name: str               # file name, e.g. "StringUtils.java"
+    header: str             # label line, e.g. "===== CLASS TO MODIFY (StringUtils.java) =====\n"
+    code: str
+    role: str               # ROLE_MODIFIED, ROLE_TRIGGER_TEST, ROLE_SRC or ROLE_TEST
+
+    @property
+    def is_seed(self) -> bool:
+        return self.role in SEED_WEIGHTS
+
+
+@dataclass
+class ContextEntry:
+    file: ContextFile
+    mode: str               # "full", "skeleton" or "omitted"
+    tokens: int = 0
+    score: float = 0.0
+
+    @property
+    def text(self) -> str:
+        if self.mode == "full":
+            return self.file.header + self.file.code
+        if self.mode == "skeleton":
+            header = self.file.header.replace(" =====\n", " - SUMMARY, method bodies omitted =====\n", 1)
+            return header + skeleton(self.file.code)
+        return ""
+
+
+@dataclass
+class ContextPlan:
+    entries: List[ContextEntry]
+    budget: int
+    used_tokens: int
+    omitted_note: str = ""
+    scores: Dict[str, float] = field(default_factory=dict)
+
+    def parts(self) -> List[tuple]:
+        """(name, text) parts to feed to the prompt series, most relevant first."""
+        parts = [(e.file.name, e.text) for e in self.entries if e.mode != "omitted"]
+        if self.omitted_note:
+            parts.append(("omitted", self.omitted_note))
+        return parts
+
+    def report(self) -> dict:
+        return {
+            "budget": self.budget,
+            "used_tokens": self.used_tokens,
+            "files": [{"name": e.file.name, "role": e.file.role, "mode": e.mode,
+                       "tokens": e.tokens, "score": round(e.score, 6)} for e in self.entries],
+        }
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def reference_graph(files: Sequence[ContextFile]) -> Dict[str, Dict[str, float]]:
+    """
+    Undirected weighted graph between files: the weight of A-B grows with how
+    often A mentions types declared in B (imports included) and vice versa.
+    """
+    declared = {}
+    for f in files:
+        names = {name.rsplit(".", 1)[-1] for name in declared_types(f.code)}
+        names.add(f.name[:-len(".java")] if f.name.endswith(".java") else f.name)
+        for name in names:
+            declared.setdefault(name, set()).add(f.name)
+
+    graph = {f.name: {} for f in files}
+    for f in files:
+        counts = {}
+        for token in code_tokens(f.code):
+            if token.kind == "ident" and token.text in declared:
+                for target in declared[token.text]:
+                    if target != f.name:
+                        counts[target] = counts.get(target, 0) + 1
+        for target, count in counts.items():
+            weight = log1p(count)
+            graph[f.name][target] = graph[f.name].get(target, 0.0) + weight
+            graph[target][f.name] = graph[target].get(f.name, 0.0) + weight
+    return graph
+
+def rank_files(files: Sequence[ContextFile], graph: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """Personalized PageRank of every file, restarting at the seeds."""
+    restart = {f.name: SEED_WEIGHTS.get(f.role, 0.0) for f in files}
+    total = sum(restart.values())
+    if total == 0:
+        restart = {name: 1.0 for name in restart}
+        total = len(restart)
+    restart = {name: weight / total for name, weight in restart.items()}
+
+    scores = dict(restart)
+    for _ in range(RANK_ITERATIONS):
+        new_scores = {name: RESTART_PROBABILITY * weight for name, weight in restart.items()}
+        dangling = 0.0
+        for name, score in scores.items():
+            neighbours = graph.get(name, {})
+            out_weight = sum(neighbours.values())
+            if out_weight == 0:
+                dangling += score
+                continue
+            for target, weight in neighbours.items():
+                new_scores[target] += (1 - RESTART_PROBABILITY) * score * weight / out_weight
+        for name, weight in restart.items():
+            new_scores[name] += (1 - RESTART_PROBABILITY) * dangling * weight
+        scores = new_scores
+    return scores
+
+def default_token_counter() -> Callable[[str], int]:
+    from token_chunking import encode, get_encoding
+    encoding = get_encoding()
+    return lambda text: len(encode(encoding, text))
+
+def plan_context(files: Sequence[ContextFile], budget: int, count_tokens: Optional[Callable[[str], int]] = None,
+                 separator_tokens: int = 1) -> ContextPlan:
+    """
+    Choose for every file whether it goes in full, as a skeleton or not at all
+    so that the combined text (including one separator per part) fits budget.
+    """
+    count_tokens = count_tokens or default_token_counter()
+    scores = rank_files(files, reference_graph(files))
+    role_order = {ROLE_MODIFIED: 0, ROLE_TRIGGER_TEST: 1}
+    ordered = sorted(files, key=lambda f: (role_order.get(f.role, 2), -scores[f.name], f.name))
+
+    entries, used = [], 0
+    for f in ordered:
+        entry = ContextEntry(f, "full", score=scores[f.name])
+        entry.tokens = count_tokens(entry.text) + separator_tokens
+        if f.role == ROLE_MODIFIED:
+            # The class to modify is never shortened or dropped, even if it alone exceeds the budget.
+            if used + entry.tokens > budget:
+                print(f"DEBUG: {f.name} needs {entry.tokens} tokens; context budget of {budget} exceeded")
+        elif used + entry.tokens > budget:
+            entry.mode = "skeleton"
+            entry.tokens = count_tokens(entry.text) + separator_tokens
+            if used + entry.tokens > budget:
+                entry.mode, entry.tokens = "omitted", 0
+        used += entry.tokens
+        entries.append(entry)
+
+    # List the omitted files by name; make room for that list by demoting the lowest ranked files.
+    plan = ContextPlan(entries, budget, used, scores=scores)
+    while True:
+        omitted = [e.file.name for e in entries if e.mode == "omitted"]
+        plan.omitted_note = OMITTED_HEADER + "\n".join(omitted) + "\n" if omitted else ""
+        note_tokens = count_tokens(plan.omitted_note) + separator_tokens if omitted else 0
+        plan.used_tokens = sum(e.tokens for e in entries) + note_tokens
+        if plan.used_tokens <= budget:
+            break
+        demotable = [e for e in entries if e.mode != "omitted" and not e.file.is_seed]
+        if not demotable:
+            break
+        victim = min(demotable, key=lambda e: e.score)
+        if victim.mode == "full":
+            victim.mode = "skeleton"
+            victim.tokens = count_tokens(victim.text) + separator_tokens
+        else:
+            victim.mode, victim.tokens = "omitted", 0
+
+    counts = {mode: sum(1 for e in entries if e.mode == mode) for mode in ("full", "skeleton", "omitted")}
+    print(f"DEBUG: Context plan uses {plan.used_tokens}/{budget} tokens: {counts['full']} full, "
+          f"{counts['skeleton']} summarized, {counts['omitted']} omitted")
+    return plan
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+"""
+API mode of the Defects4J prompt series: one conversation per (bug, strategy).
+
+create_prompt_series writes part_N.txt files to be pasted into the ChatGPT UI
+by hand, and repeats the whole instruction template (with the bug's class names
+filled in at the top) in front of every chunk. Here the chunks are sent as the
+successive user turns of one conversation instead, and the prompt is laid out
+for provider-side prompt caching:
+
+    system:  static prefix of the strategy (no bug-specific text at all)
+    user:    bug details + PART 1/N + chunk 1 + continuation notice
+    assistant: OK
+    user:    PART 2/N + chunk 2 + ...                 (... + <<<END_OF_INPUT>>>)
+
+Every request of a conversation starts with the previous one, and the static
+prefix is byte-identical for every bug of a strategy, so the provider can serve
+the history (and, across bugs, the prefix) from its cache. Turns are sent in
+rounds through llm_dispatch: round k sends turn k of every open conversation
+concurrently. With synthetic_acks the intermediate "OK" replies are written in
+instead of requested, and each conversation is a single request.
+
+The report compares what was sent with the pasted series: instruction tokens
+no longer repeated per part, history tokens re-sent in later turns, and the
+input tokens the provider reported as cached.
+
+With --output_mode patch the final reply is SEARCH/REPLACE edits to the class
+to modify instead of the whole class (far fewer output tokens); they are
+applied to the copied original with patch_apply.py.
+
+    python conversation_runner.py --bugs Lang:1b Chart:3b --workdir d4j --model gpt-4o
+"""
+import argparse
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from budget_scheduler import BudgetScheduler, count_prompt_tokens
+from bug_index import DEFAULT_INDEX_DIR, BugIndex
+from defects4j_batch import parse_bug_spec
+from defects4j_pipeline import (TARGET_FOLDER_NAME, bug_prompt_details, load_context_files, package_to_path,
+                                query_defects4j, run_pipeline)
+from fixed_code_stream import FixedCodeStream
+from java_slicer import unslice
+from java_source import top_level_types
+from llm_dispatch import DEFAULT_CONCURRENCY, DispatchResult, cached_input_tokens, run_dispatch
+from patch_apply import PatchError, candidate_from_response, describe
+from response_cache import DEFAULT_CACHE_DIR, ResponseCache
+from token_chunking import (CONTINUATION_NOTICE, DEFAULT_MAX_PROMPT_TOKENS, FINAL_MARKER, FINAL_SUFFIX,
+                            TokenizedCorpus, get_encoding, plan_chunks)
+import tracing
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+ACK = "OK"
+CONVERSATION_FOLDER = "conversations"
+REPORT_FILE = "conversation_report.json"
+DEFAULT_CONTEXT_WINDOW = 128_000
+PART_HEADER = "PART {index}/{count}\n"
+DATASET = "defects4j"
+OVER_BUDGET = "over budget"
+
+# Bug-independent system prompts. The class names are given once, in the first user turn (BUG_DETAILS).
+INPUT_RULES = f"""
+The input arrives over several messages, labeled PART i/N. Files are labeled with headers such as
+===== CLASS TO MODIFY (<file>) ===== and ===== TRIGGER TEST (<file>) - Failing Method: <method> =====.
+
+⚠️ VERY IMPORTANT:
+- Until you see the marker {FINAL_MARKER}, reply to every message with exactly: {ACK}
+- ❌ DO NOT generate any analysis or code before {FINAL_MARKER}.
+- ONLY modify the Java file labeled CLASS TO MODIFY named in the bug details.
+- ONLY fix the bug that makes the named failing method of the TRIGGER TEST fail.
+- Do NOT modify any other files.
+"""
+
+STATIC_PREFIXES = {
+    "zero_shot": f"""You are an expert Java 8 developer.
+
+You will receive multiple Java files from a buggy project.
+{INPUT_RULES}
+Once you see {FINAL_MARKER}, think step-by-step:
+1. Review the CLASS TO MODIFY and locate the root cause of the bug.
+2. Fix the bug so that the failing test method passes.
+3. ✅ Return ONLY the corrected contents of the CLASS TO MODIFY — no markdown, no explanation, just raw code starting from the `package` declaration.
+""",
+    "few_shot": f"""You are an expert Java developer.
+Below is an example of a bug and its fix:
+
+EXAMPLE BUG:
+int add(int a, int b) {{
+    return a - b;
+}}
+
+EXAMPLE FIX:
+int add(int a, int b) {{
+    return a + b;
+}}
+
+You will now receive another buggy Java project.
+{INPUT_RULES}
+Once you see {FINAL_MARKER}, respond with ONLY the corrected code of the CLASS TO MODIFY, starting from the package declaration, without any markdown formatting.
+""",
+    "chain_of_thought": f"""You are an expert Java developer.
+You will be given a buggy Java project.
+
+First, think step by step to identify the bug, then provide a fix — BUT ONLY after you have received all necessary files.
+{INPUT_RULES}
+Once you see {FINAL_MARKER}:
+1. Think through the bug logically.
+2. Then present the corrected Java code using this format:
+
+---FIXED CODE---
+<your fixed code here>
+---END FIXED CODE---
+
+Present your explanation and thought process before the fixed code.
+""",
+}
+STRATEGIES = tuple(STATIC_PREFIXES)
+
+# Patch mode: the same prefixes, asking for edits to the CLASS TO MODIFY instead of the whole class.
+OUTPUT_MODES = ("full", "patch")
+PATCH_FORMAT = """Return ONLY your edits to the CLASS TO MODIFY, never the whole class, as one or more SEARCH/REPLACE blocks:
+
+<<<<<<< SEARCH
+(lines copied exactly from the CLASS TO MODIFY, enough of them to occur only once in it)
+=======
+(the lines that replace them)
+>>>>>>> REPLACE
+
+No markdown formatting."""
+
+PATCH_PREFIXES = {
+    "zero_shot": f"""You are an expert Java 8 developer.
+
+You will receive multiple Java files from a buggy project.
+{INPUT_RULES}
+Once you see {FINAL_MARKER}, think step-by-step:
+1. Review the CLASS TO MODIFY and locate the root cause of the bug.
+2. Fix the bug so that the failing test method passes.
+3. ✅ {PATCH_FORMAT} No explanation.
+""",
+    "few_shot": f"""You are an expert Java developer.
+Below is an example of a bug and its fix:
+
+EXAMPLE BUG:
+int add(int a, int b) {{
+    return a - b;
+}}
+
+EXAMPLE FIX:
+<<<<<<< SEARCH
+    return a - b;
+=======
+    return a + b;
+>>>>>>> REPLACE
+
+You will now receive another buggy Java project.
+{INPUT_RULES}
+Once you see {FINAL_MARKER}, fix the bug. {PATCH_FORMAT}
+""",
+    "chain_of_thought": f"""You are an expert Java developer.
+You will be given a buggy Java project.
+
+First, think step by step to identify the bug, then provide a fix — BUT ONLY after you have received all necessary files.
+{INPUT_RULES}
+Once you see {FINAL_MARKER}:
+1. Think through the bug logically.
+2. Then present your edits using this format:
+
+---FIXED CODE---
+<your SEARCH/REPLACE blocks here>
+---END FIXED CODE---
+
+{PATCH_FORMAT}
+Present your explanation and thought process before the edits.
+""",
+}
+
+BUG_DETAILS = """BUG DETAILS:
+- CLASS TO MODIFY: {class_to_modify}
+- TRIGGER TEST: {test_file}
+- Failing Method: {failing_method}
+
+"""
+
+
+@dataclass
+class Conversation:
+    """The user turns of one (bug, strategy) conversation and what came back so far."""
+    bug: str
+    strategy: str
+    turns: List[str]
+    details_tokens: int = 0
+    chunk_tokens: List[int] = field(default_factory=list)
+    replies: List[str] = field(default_factory=list)
+    results: List[DispatchResult] = field(default_factory=list)
+    error: Optional[str] = None
+    output_mode: str = "full"
+    originals: dict = field(default_factory=dict)   # file name -> original code of each class to modify
+
+    @property
+    def prefix(self) -> str:
+        return (PATCH_PREFIXES if self.output_mode == "patch" else STATIC_PREFIXES)[self.strategy]
+
+    @property
+    def key(self):
+        return (self.bug, self.strategy)
+
+    @property
+    def done(self) -> bool:
+        return self.error is not None or len(self.replies) == len(self.turns)
+
+    @property
+    def final_reply(self) -> str:
+        return self.replies[-1] if self.done and self.error is None else ""
+
+    def messages(self, upto: int) -> list:
+        """System prefix, turns 0..upto and the replies in between (the request for turn `upto`)."""
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        messages = [SystemMessage(content=self.prefix)]
+        for i in range(upto + 1):
+            messages.append(HumanMessage(content=self.turns[i]))
+            if i < upto:
+                messages.append(AIMessage(content=self.replies[i] if i < len(self.replies) else ACK))
+        return messages
+
+    def transcript(self) -> List[dict]:
+        messages = [{"role": "system", "content": self.prefix}]
+        for i, turn in enumerate(self.turns):
+            messages.append({"role": "user", "content": turn})
+            if i < len(self.replies):
+                messages.append({"role": "assistant", "content": self.replies[i]})
+        return messages
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def bug_turns(details: dict, parts, max_turn_tokens: int = DEFAULT_MAX_PROMPT_TOKENS, encoding=None):
+    """
+    (user turns, tokens per chunk, tokens of the bug details) of one bug; the
+    turns are shared by every strategy. The first turn carries the bug details,
+    and chunks are cut so that it, the largest turn, fits max_turn_tokens.
+    """
+    details_text = BUG_DETAILS.format(**details)
+    corpus = TokenizedCorpus.from_parts(parts, encoding)
+    plan = plan_chunks(corpus, {"turn": details_text + PART_HEADER.format(index=99, count=99) + "{text}"},
+                       max_turn_tokens)
+    count = len(plan.chunks)
+    turns = []
+    for chunk in plan.chunks:
+        suffix = FINAL_SUFFIX if chunk.index == count - 1 else CONTINUATION_NOTICE
+        header = PART_HEADER.format(index=chunk.index + 1, count=count)
+        turns.append((details_text if chunk.index == 0 else "") + header
+                     + corpus.decode(chunk.start, chunk.end) + suffix)
+    return turns, [c.tokens for c in plan.chunks], corpus.count(details_text)
+
+def prepare_conversations(bugs: Sequence[tuple], work_root: Path, strategies: Sequence[str] = STRATEGIES,
+                          max_turn_tokens: int = DEFAULT_MAX_PROMPT_TOKENS, index_dir: Path = DEFAULT_INDEX_DIR,
+                          without_context: bool = False, slice_methods: bool = False,
+                          model: str = "gpt-4o", output_mode: str = "full") -> List[Conversation]:
+    """
+    Make sure every bug has been checked out and copied (run_pipeline, resumed
+    from its journal), then build its turns once and open one conversation per strategy.
+    """
+    encoding = get_encoding(model)
+    conversations = []
+    for project, version in bugs:
+        work_dir = (Path(work_root) / f"{project}_{version}").resolve()
+        run_pipeline(project, version, work_dir, without_context, Path(index_dir), slice_methods=slice_methods)
+        bug = BugIndex.load_or_query(project, query_defects4j, Path(index_dir))[version]
+        with tracing.span("combine", sliced=bool(slice_methods)) as span:
+            context_files = load_context_files(bug, work_dir / TARGET_FOLDER_NAME, without_context, slice_methods)
+            span.set(files=len(context_files))
+        parts = [(f.name, f.header + f.code) for f in context_files]
+        with tracing.span("split") as span:
+            turns, chunk_tokens, details_tokens = bug_turns(bug_prompt_details(bug), parts, max_turn_tokens, encoding)
+            span.set(tokens=sum(chunk_tokens), chunks=len(turns))
+        print(f"DEBUG: {project}_{version}: {len(turns)} turn(s), {sum(chunk_tokens)} code tokens")
+        originals = {}
+        for cls in bug.modified:
+            original = work_dir / TARGET_FOLDER_NAME / package_to_path(cls).name
+            if original.exists():
+                originals[original.name] = original.read_text()
+        for strategy in strategies:
+            conversations.append(Conversation(f"{project}_{version}", strategy, turns, details_tokens, chunk_tokens,
+                                              output_mode=output_mode, originals=originals))
+    return conversations
+
+def run_conversations(llm, conversations: Sequence[Conversation], concurrency: int = DEFAULT_CONCURRENCY,
+                      cache: ResponseCache = None, synthetic_acks: bool = False,
+                      budget: Optional[BudgetScheduler] = None, model: str = "gpt-4o", **dispatch_options):
+    """
+    Send every conversation turn by turn. Round k dispatches turn k of all open
+    conversations at once; a failed turn ends its conversation. With
+    synthetic_acks only the last turn is requested, with ACK written in as the
+    earlier replies.
+
+    With a budget (budget_scheduler.BudgetScheduler) every request is booked
+    against it: within a round the cheapest turns go first, one strategy of
+    each bug before a second one, and a turn that would exceed the budget is
+    not sent and ends its conversation with OVER_BUDGET.
+    """
+    rounds = 0
+    while True:
+        pending = [c for c in conversations if not c.done]
+        if not pending:
+            break
+        prompts, by_key = [], {}
+        for c in pending:
+            turn = len(c.turns) - 1 if synthetic_acks else len(c.replies)
+            by_key[c.key + (turn,)] = c
+            prompts.append((c.key + (turn,), c.messages(turn)))
+        options = dict(dispatch_options)
+        if budget is not None:
+            for key, messages in prompts:
+                budget.add_unit(key, messages, DATASET, model, group=by_key[key].bug)
+            prompts = budget.order(prompts)
+            on_result = options.get("on_result")
+
+            def settle(result, on_result=on_result):
+                budget.settle(result)
+                if on_result is not None:
+                    on_result(result)
+
+            options.update(skip=lambda key, sample: not budget.reserve(key), on_result=settle)
+        rounds += 1
+        print(f"DEBUG: Round {rounds}: sending {len(prompts)} turn(s)")
+        results = run_dispatch(llm, prompts, concurrency=concurrency, cache=cache, **options)
+        for result in results:
+            c = by_key[result.key]
+            c.results.append(result)
+            if not result.ok:
+                c.error = OVER_BUDGET if result.skipped else result.error
+                continue
+            if synthetic_acks:
+                c.replies.extend([ACK] * (len(c.turns) - 1))
+            c.replies.append(result.text)
+    return conversations
+
+def conversation_metrics(c: Conversation, model: str) -> dict:
+    """
+    Tokens of one conversation next to the pasted series it replaces:
+    - instruction_tokens_saved: prefix and bug details are sent once instead of in every part
+    - resent_history_tokens: earlier turns and replies repeated in later requests
+    - cached_input_tokens: input tokens the provider served from its prompt cache
+    """
+    prefix_tokens = count_prompt_tokens(c.prefix, model)
+    instruction_tokens = prefix_tokens + c.details_tokens
+    sent = [r for r in c.results if r.ok and not r.cached]
+    input_tokens = sum(r.usage.get("input_tokens", 0) for r in sent)
+    # Everything in front of the new user turn was already sent by the conversation's previous request.
+    resent = sum(count_prompt_tokens(c.messages(r.key[-1]), model) - count_prompt_tokens(c.turns[r.key[-1]], model)
+                 for r in sent[1:])
+    return {
+        "bug": c.bug,
+        "strategy": c.strategy,
+        "output_mode": c.output_mode,
+        "parts": len(c.turns),
+        "requests": len(sent),
+        "cached_responses": sum(1 for r in c.results if r.cached),
+        "error": c.error,
+        "prefix_tokens": prefix_tokens,
+        "instruction_tokens": instruction_tokens,
+        "instruction_tokens_saved": (len(c.turns) - 1) * instruction_tokens,
+        "series_input_tokens": len(c.turns) * instruction_tokens + sum(c.chunk_tokens),
+        "input_tokens": input_tokens,
+        "resent_history_tokens": resent,
+        "cached_input_tokens": sum(cached_input_tokens(r.usage) for r in sent),
+        "output_tokens": sum(r.usage.get("output_tokens", 0) for r in sent),
+    }
+
+def restore_stubs(c: Conversation, code: str) -> str:
+    """
+    A whole-class reply with the bodies the sliced prompt stubbed out (see
+    java_slicer) put back from the original class of the same name; members the
+    model left as /* ... */ would otherwise be saved and validated empty.
+    """
+    types = top_level_types(code)
+    original = c.originals.get(f"{types[0]}.java") if types else None
+    if original is None and len(c.originals) == 1:
+        original = next(iter(c.originals.values()))
+    return unslice(code, original) if original is not None else code
+
+def apply_reply(c: Conversation, reply: str):
+    """
+    (file name, patched class, description) for a patch-mode reply: the edits
+    are applied to each original class to modify until one takes all of them.
+    PatchError if none does.
+    """
+    errors = []
+    for name, original in c.originals.items():
+        try:
+            code, patch = candidate_from_response(original, reply)
+        except PatchError as e:
+            errors.append(f"{name}: {e}")
+            continue
+        if patch is None:
+            return name, unslice(code, original), "whole class returned"
+        return name, code, describe(patch)
+    raise PatchError("; ".join(errors) or "original class to modify not found")
+
+def save_conversations(conversations: Sequence[Conversation], work_root: Path, model: str) -> List[dict]:
+    """
+    Write every transcript and fixed code next to the bug's prompt series;
+    returns the per-conversation metrics. In patch mode the fixed code is the
+    patched original, and the metrics say whether the patch applied; a whole
+    class gets the bodies a sliced prompt stubbed out restored.
+    """
+    metrics = []
+    for c in conversations:
+        folder = Path(work_root) / c.bug / CONVERSATION_FOLDER
+        folder.mkdir(parents=True, exist_ok=True)
+        entry = conversation_metrics(c, model)
+        metrics.append(entry)
+        code = None
+        if c.final_reply:
+            extractor = FixedCodeStream()
+            extractor.feed(c.final_reply)
+            code = extractor.code if extractor.complete else c.final_reply
+        if code is not None and c.output_mode == "patch":
+            try:
+                name, code, entry["patch"] = apply_reply(c, code)
+                print(f"DEBUG: {c.bug} / {c.strategy}: applied patch to {name}: {entry['patch']}")
+            except PatchError as e:
+                print(f"[ERROR] {c.bug} / {c.strategy}: patch rejected: {e}")
+                entry["patch_error"] = str(e)
+                code = None
+        elif code is not None:
+            code = restore_stubs(c, code)
+        (folder / f"{c.strategy}.json").write_text(json.dumps(
+            {"metrics": entry, "messages": c.transcript()}, indent=2, ensure_ascii=False))
+        if code is not None:
+            (folder / f"{c.strategy}_fixed.java").write_text(code.rstrip("\n") + "\n")
+    return metrics
+
+def print_report(metrics: Sequence[dict], context_window: int = DEFAULT_CONTEXT_WINDOW):
+    totals = {key: sum(m[key] for m in metrics) for key in
+              ("requests", "input_tokens", "series_input_tokens", "instruction_tokens_saved",
+               "resent_history_tokens", "cached_input_tokens", "output_tokens")}
+    for m in metrics:
+        status = f"failed ({m['error']})" if m["error"] else "done"
+        if m.get("patch_error"):
+            status = f"patch rejected ({m['patch_error']})"
+        print(f"{m['bug']} / {m['strategy']}: {status}; {m['parts']} part(s), {m['requests']} request(s), "
+              f"{m['input_tokens']} input ({m['cached_input_tokens']} cached), {m['output_tokens']} output")
+        if m["series_input_tokens"] > context_window:
+            print(f"WARNING: {m['bug']} / {m['strategy']} holds ~{m['series_input_tokens']} tokens, "
+                  f"more than the {context_window}-token context window; early parts may be truncated")
+    input_tokens = totals["input_tokens"]
+    print(f"Conversations: {len(metrics)}, requests: {totals['requests']}")
+    print(f"Instructions sent once per conversation instead of with every part: "
+          f"{totals['instruction_tokens_saved']} tokens saved (pasted series: ~{totals['series_input_tokens']} tokens)")
+    print(f"History re-sent in later turns: {totals['resent_history_tokens']} tokens")
+    print(f"Input tokens: {input_tokens}, served from the provider's prompt cache: {totals['cached_input_tokens']}"
+          + (f" ({100 * totals['cached_input_tokens'] / input_tokens:.1f}%)" if input_tokens else ""))
+    return totals
+
+# ----------------------------
+# Main Script
+# ----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Send the Defects4J prompt series as multi-turn API conversations")
+    parser.add_argument("--bugs", type=str, nargs="+", required=True, help="Bugs as Project:version (e.g. Lang:1b)")
+    parser.add_argument("--workdir", type=str, required=True,
+                        help="Root directory; each bug is checked out to WORKDIR/<Project>_<version>")
+    parser.add_argument("--strategies", type=str, nargs="*", default=list(STRATEGIES), choices=STRATEGIES)
+    parser.add_argument("--model", type=str, default="gpt-4o")
+    parser.add_argument("--base_url", type=str, default=None,
+                        help="OpenAI-compatible endpoint (e.g. stub_chat_server.py --prompt_cache)")
+    parser.add_argument("--max_turn_tokens", type=int, default=DEFAULT_MAX_PROMPT_TOKENS,
+                        help="Token limit of one user turn (bug details, part header and chunk)")
+    parser.add_argument("--context_window", type=int, default=DEFAULT_CONTEXT_WINDOW,
+                        help="Warn about conversations that outgrow the model's context window")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--synthetic_acks", action="store_true",
+                        help="Write the intermediate OK replies in instead of requesting them (one request per conversation)")
+    parser.add_argument("--cache_dir", type=str, default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--no_cache", action="store_true", help="Do not read responses from the cache")
+    parser.add_argument("--index_dir", type=str, default=str(DEFAULT_INDEX_DIR))
+    parser.add_argument("--without_context", action="store_true", help="Only send the class to modify and the tests")
+    parser.add_argument("--slice_methods", action="store_true",
+                        help="Keep only the failing test methods and the members they use; stub the rest")
+    parser.add_argument("--output_mode", type=str, default="full", choices=OUTPUT_MODES,
+                        help="full: the final reply is the whole class to modify; patch: only SEARCH/REPLACE edits")
+    parser.add_argument("--max_tokens", type=float, default=None,
+                        help="Token budget of all conversations; turns beyond it are not sent")
+    parser.add_argument("--max_cost", type=float, default=None, help="Cost budget of all conversations in USD")
+    parser.add_argument("--trace", type=str, required=False,
+                        help="Record per-stage spans and write them to TRACE.spans.jsonl and TRACE.trace.json")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable()
+
+    from langchain_openai import ChatOpenAI
+
+    work_root = Path(args.workdir)
+    try:
+        conversations = prepare_conversations([parse_bug_spec(spec) for spec in args.bugs], work_root,
+                                              args.strategies, args.max_turn_tokens, Path(args.index_dir),
+                                              args.without_context, args.slice_methods, args.model,
+                                              args.output_mode)
+        llm = ChatOpenAI(model_name=args.model, base_url=args.base_url, temperature=0, max_retries=0)
+        budget = None
+        if args.max_tokens is not None or args.max_cost is not None:
+            budget = BudgetScheduler(int(args.max_tokens) if args.max_tokens is not None else None,
+                                     max_cost=args.max_cost)
+        run_conversations(llm, conversations, args.concurrency, ResponseCache(args.cache_dir, bypass=args.no_cache),
+                          args.synthetic_acks, budget, args.model)
+        metrics = save_conversations(conversations, work_root, args.model)
+        totals = print_report(metrics, args.context_window)
+        if budget is not None:
+            budget.print_report()
+        report_file = work_root / REPORT_FILE
+        report_file.write_text(json.dumps({"model": args.model, "synthetic_acks": args.synthetic_acks,
+                                           "output_mode": args.output_mode,
+                                           "totals": totals, "conversations": metrics}, indent=2))
+        print(f"Saved conversation report to {report_file}")
+    finally:
+        if args.trace:
+            tracing.print_summary()
+            tracing.export(args.trace)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Batch mode for defects4j_pipeline.py.
+
+Runs the full per-bug pipeline (checkout, query, file collection, prompt
+series generation) for many (project, version) pairs in a bounded process
+pool. Every bug gets its own working directory and log file, a failing bug
+does not stop the others, and one summary is printed (and written as JSON) at
+the end.
+
+Bugs are given as a manifest file with one entry per line:
+
+    # project version
+    Lang 1b
+    Cli 2b
+    Codec all        <- every bug of the project (buggy versions)
+
+or directly on the command line with --bugs Lang:1b Cli:2b Codec:all.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from bug_index import DEFAULT_INDEX_DIR, BugIndex
+from defects4j_pipeline import query_defects4j, run_pipeline
+import tracing
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+ALL_BUGS = "all"
+SUMMARY_FILE = "batch_summary.json"
+TRACE_DIR = "traces"
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def parse_bug_spec(spec: str):
+    """Parse "Project:version" or "Project version" into a (project, version) tuple."""
+    parts = spec.replace(":", " ").split()
+    if len(parts) != 2:
+        raise ValueError(f"Invalid bug spec {spec!r}; expected 'Project version' or 'Project:version'")
+    return parts[0], parts[1]
+
+def read_manifest(manifest_path: Path):
+    """Read (project, version) entries from a manifest file, skipping blank lines and comments."""
+    entries = []
+    for line in Path(manifest_path).read_text().splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            entries.append(parse_bug_spec(line))
+    return entries
+
+def expand_entries(entries, index_dir: Path):
+    """Replace "all" entries with every bug id of the project (as buggy versions), keeping order and dropping duplicates."""
+    expanded = []
+    for project, version in entries:
+        if version.lower() == ALL_BUGS:
+            index = BugIndex.load_or_query(project, query_defects4j, index_dir)
+            expanded.extend((project, f"{bug_id}b") for bug_id in index.bug_ids())
+        else:
+            expanded.append((project, version))
+    return list(dict.fromkeys(expanded))
+
+def run_one(project: str, version: str, work_root: str, options: dict, trace: bool = False) -> dict:
+    """
+    Worker entry point: run the pipeline for one bug with stdout/stderr
+    (including child processes such as defects4j) redirected to its log file.
+    With trace, the bug's spans are written to <work_root>/traces/<Project>_<version>.*.
+    """
+    work_dir = Path(work_root) / f"{project}_{version}"
+    log_dir = Path(work_root) / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_file = log_dir / f"{project}_{version}.log"
+    start = time.perf_counter()
+    result = {"project": project, "version": version, "work_dir": str(work_dir), "log": str(log_file)}
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_stdout, saved_stderr = os.dup(1), os.dup(2)
+    with open(log_file, "w") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        if trace:
+            tracing.enable()
+        try:
+            run_pipeline(project, version, work_dir, **options)
+            result["status"] = "ok"
+        except BaseException as e:  # noqa: BLE001 - one bug must not take the batch down
+            traceback.print_exc()
+            result["status"] = "failed"
+            result["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            if trace:
+                tracing.print_summary()
+                _, chrome = tracing.export(Path(work_root) / TRACE_DIR / f"{project}_{version}")
+                result["trace"] = str(chrome)
+                tracing.disable()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_stdout, 1)
+            os.dup2(saved_stderr, 2)
+            os.close(saved_stdout)
+            os.close(saved_stderr)
+    result["duration"] = time.perf_counter() - start
+    return result
+
+def run_batch(entries, work_root: Path, workers: int = None, options: dict = None, trace: bool = False):
+    """
+    Run the pipeline for every (project, version) entry in a process pool; returns the per-bug results.
+    With trace, the workers' Chrome traces are also merged into <work_root>/traces/batch.trace.json.
+    """
+    work_root = Path(work_root).resolve()
+    work_root.mkdir(parents=True, exist_ok=True)
+    options = options or {}
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_one, project, version, str(work_root), options, trace): (project, version)
+                   for project, version in entries}
+        for future in as_completed(futures):
+            project, version = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                result = {"project": project, "version": version, "status": "failed",
+                          "error": f"worker process died: {e}", "duration": 0.0}
+            results.append(result)
+            status = "OK    " if result["status"] == "ok" else "FAILED"
+            print(f"[{len(results)}/{len(entries)}] {status} {project} {version} ({result['duration']:.1f}s)")
+
+    order = {entry: i for i, entry in enumerate(entries)}
+    results.sort(key=lambda r: order[(r["project"], r["version"])])
+    traces = [r["trace"] for r in results if r.get("trace")]
+    if traces:
+        tracing.merge_chrome_traces(traces, work_root / TRACE_DIR / f"batch{tracing.CHROME_SUFFIX}")
+    return results
+
+def print_summary(results, summary_file: Path):
+    failed = [r for r in results if r["status"] != "ok"]
+    print("\n==================== Batch Summary ====================")
+    print(f"{len(results) - len(failed)} succeeded, {len(failed)} failed, "
+          f"{sum(r['duration'] for r in results):.1f}s total pipeline time")
+    for r in failed:
+        print(f"  FAILED {r['project']} {r['version']}: {r.get('error', '')} (log: {r.get('log', '-')})")
+    summary_file.write_text(json.dumps(results, indent=2))
+    print(f"Summary written to {summary_file}")
+
+# ----------------------------
+# Main Script
+# ----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Defects4J prompt pipeline for many bugs in parallel")
+    parser.add_argument("--manifest", type=str, help="File with one 'Project version' (or 'Project all') per line")
+    parser.add_argument("--bugs", type=str, nargs="*", default=[], help="Bugs as Project:version or Project:all")
+    parser.add_argument("--workdir", type=str, required=True, help="Root directory; each bug gets <workdir>/<Project>_<version>")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--without_context", type=bool, required=False, help="")
+    parser.add_argument("--index_dir", type=str, default=str(DEFAULT_INDEX_DIR))
+    parser.add_argument("--checkout_cache", type=str, required=False,
+                        help="Directory of cached pristine checkouts shared by all workers")
+    parser.add_argument("--context_budget", type=int, required=False,
+                        help="Token budget of one prompt; the most relevant files are packed into it instead of chunking")
+    parser.add_argument("--slice_methods", action="store_true",
+                        help="Keep only the failing test methods and the members they use; stub the rest")
+    parser.add_argument("--localize", type=int, required=False, metavar="TOP_K",
+                        help="Run the tests under coverage and focus each prompt on the TOP_K most suspicious methods")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the stage journals of previous runs and redo every stage of every bug")
+    parser.add_argument("--trace", action="store_true",
+                        help=f"Record per-stage spans of every bug under <workdir>/{TRACE_DIR}")
+    args = parser.parse_args()
+
+    entries = [parse_bug_spec(spec) for spec in args.bugs]
+    if args.manifest:
+        entries.extend(read_manifest(Path(args.manifest)))
+    if not entries:
+        parser.error("no bugs given; use --manifest and/or --bugs")
+
+    # Build the per-project indexes up front so the workers only read them from disk.
+    index_dir = Path(args.index_dir)
+    entries = expand_entries(entries, index_dir)
+    for project in dict.fromkeys(project for project, _ in entries):
+        BugIndex.load_or_query(project, query_defects4j, index_dir)
+
+    print(f"Running pipeline for {len(entries)} bug(s) with {args.workers or os.cpu_count()} worker(s)")
+    options = {"without_context": args.without_context, "index_dir": index_dir,
+               "checkout_cache": args.checkout_cache, "context_budget": args.context_budget,
+               "slice_methods": args.slice_methods, "resume": not args.restart, "localize_top_k": args.localize}
+    results = run_batch(entries, Path(args.workdir), args.workers, options, trace=args.trace)
+    print_summary(results, Path(args.workdir).resolve() / SUMMARY_FILE)
+    raise SystemExit(1 if any(r["status"] != "ok" for r in results) else 0)
+
+if __name__ == "__main__":
+    main()
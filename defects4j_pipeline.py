@@ -1,21 +1,31 @@
 #!/usr/bin/env python3
-import os
 import subprocess
 import shutil
 from pathlib import Path
+from typing import List
 import argparse
-import re
-
-# --- LangChain imports for text splitting ---
-from langchain.text_splitter import CharacterTextSplitter, TokenTextSplitter
+import json
+
+from bug_index import DEFAULT_INDEX_DIR, QUERY_FIELDS, BugIndex, BugRecord, bug_id_from_version, parse_query_output
+from checkout_cache import CheckoutCache
+from context_planner import ROLE_MODIFIED, ROLE_SRC, ROLE_TEST, ROLE_TRIGGER_TEST, ContextFile, plan_context
+from fault_localization import DEFAULT_TOP_K, focus_context_files, localize
+from java_slicer import slice_context_files
+from run_journal import ConfigMismatch, RunJournal
+from source_index import SourceIndex
+import tracing
+from token_chunking import (DEFAULT_MAX_PROMPT_TOKENS, PART_SEPARATOR, TokenizedCorpus, encode, get_encoding, plan_chunks,
+                            template_static_tokens)
 
 # ----------------------------
 # Configuration Constants
 # ----------------------------
 # We assume 128k tokens is roughly 512,000 characters.
 CHUNK_CHAR_LIMIT = 512_000  
-# Final marker added to the last chunk so that ChatGPT knows when the input is complete.
-FINAL_MARKER = "<<<END_OF_INPUT>>>"
+TOKEN_REPORT_FILE = "token_report.json"
+CONTEXT_PLAN_FILE = "context_plan.json"
+TARGET_FOLDER_NAME = "classes_to_feed_to_chatgpt"
+SERIES_FOLDER_NAMES = ("zero_shot_prompt_series", "few_shot_prompt_series", "chain_of_thought_prompt_series")
 
 # ----------------------------
 # Helper Functions
@@ -38,66 +48,34 @@ def checkout_defects4j_bug(project: str, version: str, work_dir: Path):
 
 def query_defects4j(project: str) -> str:
     """Query the Defects4J project for bug info."""
-    query_cmd = f'defects4j query -p {project} -q "bug.id,report.id,classes.relevant.src,classes.relevant.test,classes.modified,tests.trigger"'
+    query_cmd = f'defects4j query -p {project} -q "{",".join(QUERY_FIELDS)}"'
     print(f"Querying project info with: {query_cmd}")
-    output = run_command(query_cmd)
-    return output
+    result = subprocess.run(query_cmd, shell=True, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"defects4j query for {project} failed:\n{result.stderr}")
+    return result.stdout.strip()
 
 def parse_field(query_output: str, field_name: str, bug_version: str = "") -> str:
     """
     Extracts a specific field from a multi-line comma-separated Defects4J query output.
-    
-    Expected CSV fields for each line:
-        index 0: Bug version number (e.g., "1")
-        index 1: Report ID
-        index 2: classes.relevant.src
-        index 3: classes.relevant.test
-        index 4: classes.modified
-        index 5: tests.trigger
-
-    If bug_version is provided, only the first line where the first field equals bug_version is considered.
-    Surrounding quotation marks are removed.
+
+    Kept for callers of the old string-based interface; new code should use
+    BugIndex/BugRecord directly. List fields are returned semicolon-joined, and
+    the first bug is used when bug_version is empty or unknown.
     """
-    lines = query_output.strip().splitlines()
-    selected_line = None
-    if bug_version:
-        for line in lines:
-            fields = line.split(",")
-            if len(fields) >= 1 and fields[0].strip() == bug_version:
-                selected_line = line
-                break
-    if not selected_line and lines:
-        # Fallback: use the first line if no match is found
-        selected_line = lines[0]
-    
-    parts = selected_line.split(',')
-    
-    if field_name == "classes.relevant.src":
-        if len(parts) > 2:
-            return parts[2].strip().strip('"')
-        else:
-            print("DEBUG: Not enough fields for classes.relevant.src")
-            return ""
-    elif field_name == "classes.relevant.test":
-        if len(parts) > 3:
-            return parts[3].strip().strip('"')
-        else:
-            print("DEBUG: Not enough fields for classes.relevant.test")
-            return ""
-    elif field_name == "classes.modified":
-        if len(parts) > 4:
-            return parts[4].strip().strip('"')
-        else:
-            print("DEBUG: Not enough fields for classes.modified")
-            return ""
-    elif field_name == "tests.trigger":
-        if len(parts) > 5:
-            return parts[5].strip().strip('"')
-        else:
-            print("DEBUG: Not enough fields for tests.trigger")
-            return ""
-    else:
+    records = parse_query_output(query_output)
+    record = records.get(bug_id_from_version(bug_version)) if bug_version else None
+    if record is None and records:
+        record = next(iter(records.values()))
+    if record is None:
         return ""
+    values = {
+        "classes.relevant.src": record.relevant_src,
+        "classes.relevant.test": record.relevant_test,
+        "classes.modified": record.modified,
+        "tests.trigger": [str(t) for t in record.trigger_tests],
+    }
+    return ";".join(values.get(field_name, []))
 
 def package_to_path(package_name: str) -> Path:
     """Convert a dot-separated package or class name to a relative file path with a .java extension."""
@@ -106,64 +84,53 @@ def package_to_path(package_name: str) -> Path:
     rel_path = Path(*parts[:-1]) / filename
     return rel_path
 
-def find_and_copy_file(work_dir: Path, package_class: str, target_dir: Path):
+def find_and_copy_file(work_dir: Path, package_class: str, target_dir: Path, index: SourceIndex = None):
     """
-    Find the Java file corresponding to package_class in src/main/java or src/test/java,
-    then copy it into target_dir.
+    Find the Java file declaring package_class via the checkout's source index
+    (any project layout, nested and non-public classes included), then copy it
+    into target_dir.
     """
     print(f"DEBUG: Processing package_class: {package_class}")
-    rel_path = package_to_path(package_class)
-    print(f"DEBUG: Converted package '{package_class}' to relative path: {rel_path}")
-    
-    # Lang - src_paths = [work_dir / "src" / "main" / "java", work_dir / "src" / "test" / "java"]
-    # Cli / Codec
-    src_paths = [work_dir / "src" / "java", work_dir / "src" / "test"]
-
-    # Closure
-    # src_paths = [work_dir / "src" , work_dir / "test"]
-    # Chart - src_paths = [work_dir / "source" , work_dir / "tests"]
-    source_file = None
-    for base in src_paths:
-        candidate = base / rel_path
-        print(f"DEBUG: Checking candidate file: {candidate}")
-        if candidate.exists():
-            print(f"DEBUG: Found file at {candidate}")
-            source_file = candidate
-            break
-        else:
-            print(f"DEBUG: File does not exist at: {candidate}")
+    index = index or SourceIndex.load_or_build(work_dir)
+    source_file = index.find(package_class)
+    if source_file is not None and not source_file.exists():
+        print(f"DEBUG: Indexed file {source_file} no longer exists; rebuilding source index")
+        index = SourceIndex.load_or_build(work_dir, refresh=True)
+        source_file = index.find(package_class)
     if source_file:
         target_dir.mkdir(parents=True, exist_ok=True)
         target_file = target_dir / source_file.name
         print(f"DEBUG: Copying file from {source_file} to {target_file}")
-        shutil.copy(source_file, target_file)
+        with tracing.span("copy_file", file=source_file.name) as span:
+            shutil.copy(source_file, target_file)
+            span.set(bytes=target_file.stat().st_size)
         print(f"DEBUG: Successfully copied {source_file} to {target_file}")
     else:
-        print(f"DEBUG: File for '{package_class}' not found in expected directories: {src_paths}")
+        print(f"DEBUG: File for '{package_class}' not found in any source root: {list(index.roots)}")
 
-def process_classes(query_output: str, work_dir: Path, target_folder_name="classes_to_feed_to_chatgpt"):
+def process_classes(bug: BugRecord, work_dir: Path, target_folder_name=TARGET_FOLDER_NAME):
     """
     Copy all relevant source and test files (from "classes.relevant.src" and "classes.relevant.test")
     into the target folder.
     """
     target_dir = work_dir / target_folder_name
-    src_field = parse_field(query_output, "classes.relevant.src")
-    test_field = parse_field(query_output, "classes.relevant.test")
+    with tracing.span("process_classes", classes=len(bug.relevant_src) + len(bug.relevant_test)) as span:
+        # Build (or load) the checkout's source index once; every lookup below is a dict hit.
+        SourceIndex.load_or_build(work_dir)
 
-    src_classes = [cls.strip() for cls in src_field.split(';') if cls.strip()]
-    test_classes = [cls.strip() for cls in test_field.split(';') if cls.strip()]
+        print("Processing relevant source classes:")
+        for cls in bug.relevant_src:
+            find_and_copy_file(work_dir, cls, target_dir)
 
-    print("Processing relevant source classes:")
-    for cls in src_classes:
-        find_and_copy_file(work_dir, cls, target_dir)
-    
-    print("Processing relevant test classes:")
-    for cls in test_classes:
-        find_and_copy_file(work_dir, cls, target_dir)
+        print("Processing relevant test classes:")
+        for cls in bug.relevant_test:
+            find_and_copy_file(work_dir, cls, target_dir)
+        copied = list(target_dir.glob("*.java")) if target_dir.exists() else []
+        span.set(files=len(copied), bytes=sum(p.stat().st_size for p in copied))
 
-def combine_relevant_files(query_output: str, target_folder: Path, only_modified_and_test: bool = False) -> str:
+def relevant_context_files(bug: BugRecord, target_folder: Path, only_modified_and_test: bool = False):
     """
-    Combine the contents of files from the target_folder.
+    Read and label the files from the target_folder as ContextFiles.
     
     If only_modified_and_test is True, include only the file corresponding to "classes.modified"
     and any test files present in "tests.trigger". Otherwise, include all relevant source and test files,
@@ -173,61 +140,80 @@ def combine_relevant_files(query_output: str, target_folder: Path, only_modified
         test methods (if there are more than one, they are combined).
       - Any other files are labeled as RELEVANT SRC FILE or RELEVANT TEST FILE (if the filename ends with 'Test.java').
     """
-    # Extract modified class info.
-    mod_class = parse_field(query_output, "classes.modified")
-    mod_filename = package_to_path(mod_class).name if mod_class else ""
-    
-    # Extract trigger test info; there may be multiple tests separated by semicolons.
-    trigger_test_field = parse_field(query_output, "tests.trigger")
-    test_info_list = []  # list of tuples: (test_filename, failing_method)
-    if trigger_test_field:
-        for test_entry in trigger_test_field.split(';'):
-            test_entry = test_entry.strip()
-            if not test_entry:
-                continue
-            if "::" in test_entry:
-                test_class, test_method = test_entry.split("::", 1)
-            else:
-                test_class = test_entry
-                test_method = ""
-            test_filename = package_to_path(test_class).name if test_class else ""
-            test_info_list.append((test_filename, test_method))
-    
-    # Build a dictionary mapping each test filename to a list of failing methods.
+    mod_filenames = {package_to_path(cls).name for cls in bug.modified}
+
+    # Map each trigger test filename to its failing methods.
     test_dict = {}
-    for test_filename, test_method in test_info_list:
-        if test_filename:
-            if test_filename in test_dict:
-                test_dict[test_filename].append(test_method)
-            else:
-                test_dict[test_filename] = [test_method]
+    for test_class in bug.trigger_test_classes:
+        test_dict[package_to_path(test_class).name] = bug.trigger_methods(test_class)
 
-    parts = []
+    files = []
     # Iterate over every Java file in the target folder.
     for file in sorted(target_folder.glob("*.java")):
         try:
             code = file.read_text()
         except Exception as e:
             code = f"Error reading file: {e}"
-        header = ""
-        if file.name == mod_filename:
+        if file.name in mod_filenames:
             header = f"===== CLASS TO MODIFY ({file.name}) =====\n"
+            role = ROLE_MODIFIED
         elif file.name in test_dict:
             # Combine multiple failing method names if present.
             methods = ", ".join(test_dict[file.name])
             header = f"===== TRIGGER TEST ({file.name}) - Failing Method: {methods} =====\n"
+            role = ROLE_TRIGGER_TEST
         else:
             if file.name.endswith("Test.java"):
                 header = f"===== RELEVANT TEST FILE ({file.name}) =====\n"
+                role = ROLE_TEST
             else:
                 header = f"===== RELEVANT SRC FILE ({file.name}) =====\n"
+                role = ROLE_SRC
         # If only_modified_and_test flag is true, skip files that are not mod or a test file.
         if only_modified_and_test:
-            if file.name != mod_filename and file.name not in test_dict:
+            if file.name not in mod_filenames and file.name not in test_dict:
                 continue
-        parts.append(header + code)
-    combined = "\n\n".join(parts)
-    return combined
+        files.append(ContextFile(file.name, header, code, role))
+    return files
+
+def load_context_files(bug: BugRecord, target_folder: Path, without_context: bool = False,
+                       slice_methods: bool = False, localization=None, top_k: int = DEFAULT_TOP_K) -> List[ContextFile]:
+    """
+    The labeled context files of a bug, cut down to what the failing tests need
+    with slice_methods, and to the top_k suspicious regions of a fault localization.
+    """
+    context_files = relevant_context_files(bug, target_folder, without_context)
+    if slice_methods:
+        # Keep only the failing test methods, what they call in the class to modify, and stubs for the rest.
+        trigger_methods = {package_to_path(cls).name: bug.trigger_methods(cls) for cls in bug.trigger_test_classes}
+        context_files = slice_context_files(context_files, trigger_methods)
+    if localization is not None:
+        context_files = focus_context_files(context_files, localization, top_k)
+    return context_files
+
+def collect_relevant_files(bug: BugRecord, target_folder: Path, only_modified_and_test: bool = False,
+                           localization=None, top_k: int = DEFAULT_TOP_K):
+    """Return (filename, labeled contents) for the files from the target_folder (see load_context_files)."""
+    files = load_context_files(bug, target_folder, only_modified_and_test, localization=localization, top_k=top_k)
+    return [(f.name, f.header + f.code) for f in files]
+
+def combine_relevant_files(bug: BugRecord, target_folder: Path, only_modified_and_test: bool = False,
+                           localization=None, top_k: int = DEFAULT_TOP_K) -> str:
+    """Combine the labeled contents of the files from the target_folder (see collect_relevant_files)."""
+    parts = collect_relevant_files(bug, target_folder, only_modified_and_test, localization, top_k)
+    return PART_SEPARATOR.join(text for _, text in parts)
+
+def bug_prompt_details(bug: BugRecord) -> dict:
+    """The per-bug values the prompt templates are filled with: class_to_modify, test_file, failing_method."""
+    mod_filename = ", ".join(package_to_path(cls).name for cls in bug.modified) or "UNKNOWN_MODIFIED_CLASS"
+    if bug.trigger_tests:
+        test_class = bug.trigger_tests[0].class_name
+        failing_method = ", ".join(t.method for t in bug.trigger_tests if t.method) or "UNKNOWN_FAILING_METHOD"
+    else:
+        test_class = ""
+        failing_method = "UNKNOWN_FAILING_METHOD"
+    test_filename = package_to_path(test_class).name if test_class else "UNKNOWN_TEST_FILE"
+    return {"class_to_modify": mod_filename, "test_file": test_filename, "failing_method": failing_method}
 
 def write_prompt_files(work_dir: Path):
     """
@@ -286,87 +272,164 @@ def write_prompt_files(work_dir: Path):
             f.write(content)
         print(f"Prompt template written to {prompt_file}")
 
-def create_prompt_series(prompt_template: str, combined_text: str, output_folder: Path, chunk_tokens: int = 30000):
-    """
-    Split the combined_text into chunks of up to `chunk_tokens` tokens using TokenTextSplitter,
-    then write each chunk as a text file in output_folder.
-    
-    For every chunk except the last, append a notice that more input follows.
-    For the final chunk, append the final marker (FINAL_MARKER).
-    """
+def write_prompt_series(prompts, output_folder: Path):
+    """Write each prompt of a series as part_<n>.txt in output_folder."""
     output_folder.mkdir(parents=True, exist_ok=True)
-    token_splitter = TokenTextSplitter(model_name="gpt-4o", chunk_size=chunk_tokens, chunk_overlap=0)
-    chunks = token_splitter.split_text(combined_text)
-    print(f"DEBUG: Combined text split into {len(chunks)} chunk(s) for folder {output_folder}")
-    
-    for i, chunk in enumerate(chunks):
-        # Use replace instead of format to inject the code chunk into the template.
-        prompt_text = prompt_template.replace("{text}", chunk)
-        if i < len(chunks) - 1:
-            prompt_text += ("\n\nIMPORTANT: More input follows. "
-                            "Do not generate the final solution until you receive the final marker '<<<END_OF_INPUT>>>'.")
-        else:
-            prompt_text += f"\n\n{FINAL_MARKER}"
+    for i, prompt_text in enumerate(prompts):
         file_path = output_folder / f"part_{i+1}.txt"
         with open(file_path, "w") as f:
             f.write(prompt_text)
         print(f"DEBUG: Wrote prompt chunk {i+1} to {file_path}")
 
+def create_prompt_series_set(templates: dict, parts, max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+                             report_file: Path = None):
+    """
+    Create the prompt series for several templates ({output_folder: template})
+    from one tokenization of the combined parts ((filename, text) pairs).
+
+    The chunk boundaries are computed once so that every prompt, including the
+    largest template's static text, fits in max_prompt_tokens. For every chunk
+    except the last, a notice that more input follows is appended; the final
+    chunk gets the final marker (FINAL_MARKER). Token counts per file and per
+    chunk are written to report_file if given.
+    """
+    corpus = TokenizedCorpus.from_parts(parts)
+    with tracing.span("split", templates=len(templates)) as span:
+        plan = plan_chunks(corpus, {str(folder): template for folder, template in templates.items()}, max_prompt_tokens)
+        span.set(tokens=len(corpus), chunks=len(plan.chunks))
+    print(f"DEBUG: Combined text ({len(corpus)} tokens in {len(corpus.files)} file(s)) split into "
+          f"{len(plan.chunks)} chunk(s) of at most {plan.budget} tokens")
+    for span in corpus.files:
+        print(f"DEBUG:   {span.name}: {span.tokens} tokens")
+    for folder, template in templates.items():
+        write_prompt_series(plan.render(template), Path(folder))
+    if report_file is not None:
+        report_file.write_text(json.dumps(plan.report(), indent=2))
+        print(f"Saved token report to {report_file}")
+    return plan
+
+def create_prompt_series(prompt_template: str, combined_text: str, output_folder: Path, chunk_tokens: int = 30000):
+    """
+    Split the combined_text into chunks so that each prompt stays within
+    `chunk_tokens` tokens, then write each chunk as a text file in output_folder.
+    Use create_prompt_series_set to create several series from one tokenization.
+    """
+    plan = create_prompt_series_set({output_folder: prompt_template}, [("combined", combined_text)], chunk_tokens)
+    print(f"DEBUG: Combined text split into {len(plan.chunks)} chunk(s) for folder {output_folder}")
+
+def journal_path(work_dir: Path) -> Path:
+    """The stage journal of a bug lives next to its working directory (which a re-checkout deletes)."""
+    return work_dir.parent / f".{work_dir.name}.journal.jsonl"
+
+def remove_paths(*paths: Path):
+    for path in paths:
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+
+def run_stage(journal: RunJournal, name: str, fn, cleanup=None, config: dict = None, force: bool = False) -> bool:
+    """
+    Run one pipeline stage unless the journal says it already finished with the
+    same config. Whatever an interrupted or outdated earlier attempt left
+    behind is removed with cleanup() first. Returns whether the stage ran.
+    """
+    unit, config = (name,), config or {}
+    if not force and journal.is_done(unit) and journal.result(unit) == config:
+        print(f"DEBUG: Stage '{name}' already done; skipping")
+        return False
+    if cleanup is not None and (journal.was_interrupted(unit) or journal.is_done(unit)):
+        print(f"DEBUG: Cleaning up after the previous '{name}' stage")
+        cleanup()
+    journal.mark_started(unit)
+    fn()
+    journal.mark_done(unit, config)
+    return True
+
 # ----------------------------
 # Main Script
 # ----------------------------
 
-def main():
-    parser = argparse.ArgumentParser(description="Defects4J Automation Script with Prompt Series Generation")
-    parser.add_argument("--project", type=str, required=True, help="Defects4J project name (e.g., Lang)")
-    parser.add_argument("--version", type=str, required=True, help="Version id (e.g., 1b for buggy version or 1f for fixed version)")
-    parser.add_argument("--workdir", type=str, required=True, help="Working directory where the project will be checked out")
-    parser.add_argument("--without_context", type=bool, required=False, help="")
-    
-    args = parser.parse_args()
-    work_dir = Path(args.workdir).resolve()
-    
+def run_pipeline(project: str, version: str, work_dir: Path, without_context: bool = False,
+                 index_dir: Path = DEFAULT_INDEX_DIR, refresh_index: bool = False, checkout_cache=None,
+                 context_budget: int = None, slice_methods: bool = False, resume: bool = True,
+                 localize_top_k: int = None):
+    """
+    Run every stage for one bug: checkout, query, file collection, prompt templates and prompt series.
+
+    With context_budget (tokens per prompt), the relevant files are ranked and
+    packed into a single prompt of that size instead of being split into chunks.
+    With slice_methods, the trigger tests and the class to modify are cut down
+    to the members the failing tests need (see java_slicer). With localize_top_k,
+    the trigger and passing tests are run under coverage once per version and
+    the context is focused on the top-k suspicious methods (see fault_localization).
+
+    Finished stages are recorded in a journal next to work_dir; a rerun with
+    resume (the default) skips them and cleans up after an interrupted one.
+    """
+    work_dir = Path(work_dir).resolve()
+    journal = RunJournal(journal_path(work_dir))
+    if not resume:
+        journal.reset()
+    journal.start_run(f"{project}_{version}", {"project": project, "version": version})
+
     # 1. Checkout the project version.
-    checkout_defects4j_bug(args.project, args.version, work_dir)
+    def checkout():
+        with tracing.span("checkout", project=project, version=version, cached=bool(checkout_cache)):
+            if checkout_cache:
+                CheckoutCache(checkout_cache).working_copy(project, version, work_dir)
+            else:
+                checkout_defects4j_bug(project, version, work_dir)
+
+    checked_out = run_stage(journal, "checkout", checkout, cleanup=lambda: remove_paths(work_dir),
+                            force=not work_dir.exists())
     
-    # 2. Retrieve and save bug info.
-    query_output = query_defects4j(args.project)
+    # 2. Retrieve and save bug info (parsed once per project and cached on disk).
+    queried = []
+
+    def query(name):
+        queried.append(name)
+        return query_defects4j(name)
+
+    with tracing.span("query", project=project) as span:
+        bug_index = BugIndex.load_or_query(project, query, Path(index_dir), refresh_index)
+        span.set(cache_hit=not queried, bytes=len(bug_index.query_output))
+    bug = bug_index[version]
     query_file = work_dir / "defects4j_query_output.txt"
     with open(query_file, 'w') as f:
-        f.write(query_output)
+        f.write(bug_index.query_output)
     print(f"Saved query output to {query_file}")
     
     # 3. Process and copy all relevant source and test files into the target folder.
-    process_classes(query_output, work_dir)
+    target_folder = work_dir / TARGET_FOLDER_NAME
+    copied = run_stage(journal, "copy", lambda: process_classes(bug, work_dir),
+                       cleanup=lambda: remove_paths(target_folder), force=checked_out)
     
     # 4. Write prompt template files (for manual reference).
     write_prompt_files(work_dir)
+
+    series_config = {"without_context": bool(without_context), "context_budget": context_budget,
+                     "slice_methods": bool(slice_methods), "localize_top_k": localize_top_k}
+    if not copied and journal.is_done(("prompt_series",)) and journal.result(("prompt_series",)) == series_config:
+        print("DEBUG: Stage 'prompt_series' already done; skipping")
+        return
     
-    # 5. Combine code from the target folder.
-    target_folder = work_dir / "classes_to_feed_to_chatgpt"
-    combined_code = combine_relevant_files(query_output, target_folder, args.without_context)
-    print("DEBUG: Combined code length:", len(combined_code))
+    # 5. Rank suspicious regions by test coverage (cached per version), then combine code from the target folder.
+    localization = localize(bug, project, version, work_dir) if localize_top_k else None
+    with tracing.span("combine", sliced=bool(slice_methods), localized=bool(localize_top_k)) as span:
+        context_files = load_context_files(bug, target_folder, without_context, slice_methods,
+                                           localization, localize_top_k or DEFAULT_TOP_K)
+        span.set(files=len(context_files), bytes=sum(len(f.header) + len(f.code) for f in context_files))
+    print("DEBUG: Combined code length:", sum(len(f.header) + len(f.code) for f in context_files)
+          + len(PART_SEPARATOR) * max(len(context_files) - 1, 0))
     
     # 6. Create prompt series folders for each prompt type.
-    zero_shot_folder = work_dir / "zero_shot_prompt_series"
-    few_shot_folder = work_dir / "few_shot_prompt_series"
-    cot_folder = work_dir / "chain_of_thought_prompt_series"
+    zero_shot_folder, few_shot_folder, cot_folder = (work_dir / name for name in SERIES_FOLDER_NAMES)
     
-    # Extract dynamic values from query_output.
-    # Assume version string is something like "1b" and we extract the number.
-    bug_version_match = re.match(r"(\d+)", args.version)
-    bug_version = bug_version_match.group(1) if bug_version_match else ""
-    
-    mod_class = parse_field(query_output, "classes.modified", bug_version)
-    mod_filename = package_to_path(mod_class).name if mod_class else "UNKNOWN_MODIFIED_CLASS"
-
-    trigger_test_full = parse_field(query_output, "tests.trigger", bug_version)
-    if "::" in trigger_test_full:
-        test_class, failing_method = trigger_test_full.split("::", 1)
-    else:
-        test_class = trigger_test_full
-        failing_method = "UNKNOWN_FAILING_METHOD"
-    test_filename = package_to_path(test_class).name if test_class else "UNKNOWN_TEST_FILE"
+    # Extract dynamic values from the bug record.
+    details = bug_prompt_details(bug)
+    mod_filename, test_filename, failing_method = (details["class_to_modify"], details["test_file"],
+                                                   details["failing_method"])
     
     # Define dynamic zero-shot prompt template.
     zero_shot_prompt_template_for_file_input = (
@@ -578,10 +641,70 @@ CODE FILES BELOW (WAIT FOR <<<END_OF_INPUT>>> BEFORE ACTING):
         failing_method=failing_method
     )
     
-    # 7. Create series of prompt text files for each prompt type.
-    create_prompt_series(zero_shot_prompt_template, combined_code, zero_shot_folder)
-    create_prompt_series(few_shot_prompt_template, combined_code, few_shot_folder)
-    create_prompt_series(chain_of_thought_prompt_template, combined_code, cot_folder)
+    templates = {
+        zero_shot_folder: zero_shot_prompt_template,
+        few_shot_folder: few_shot_prompt_template,
+        cot_folder: chain_of_thought_prompt_template,
+    }
+
+    def prompt_series():
+        # 7. With a context budget, pick the most relevant files (full or summarized) so one prompt fits it.
+        if context_budget:
+            encoding = get_encoding()
+            static_tokens = max(template_static_tokens({str(k): v for k, v in templates.items()}, encoding).values())
+            plan = plan_context(context_files, context_budget - static_tokens,
+                                separator_tokens=len(encode(encoding, PART_SEPARATOR)))
+            plan_file = work_dir / CONTEXT_PLAN_FILE
+            plan_file.write_text(json.dumps(plan.report(), indent=2))
+            print(f"Saved context plan to {plan_file}")
+            relevant_files = plan.parts()
+        else:
+            relevant_files = [(f.name, f.header + f.code) for f in context_files]
+
+        # 8. Create series of prompt text files for each prompt type (tokenized once, shared chunk spans).
+        create_prompt_series_set(templates, relevant_files, max_prompt_tokens=context_budget or DEFAULT_MAX_PROMPT_TOKENS,
+                                 report_file=work_dir / TOKEN_REPORT_FILE)
+
+    # Stale chunks of an interrupted or differently configured series must not survive next to the new ones.
+    series_outputs = [*templates, work_dir / CONTEXT_PLAN_FILE, work_dir / TOKEN_REPORT_FILE]
+    run_stage(journal, "prompt_series", prompt_series, cleanup=lambda: remove_paths(*series_outputs),
+              config=series_config, force=copied)
+
+def main():
+    parser = argparse.ArgumentParser(description="Defects4J Automation Script with Prompt Series Generation")
+    parser.add_argument("--project", type=str, required=True, help="Defects4J project name (e.g., Lang)")
+    parser.add_argument("--version", type=str, required=True, help="Version id (e.g., 1b for buggy version or 1f for fixed version)")
+    parser.add_argument("--workdir", type=str, required=True, help="Working directory where the project will be checked out")
+    parser.add_argument("--without_context", type=bool, required=False, help="")
+    parser.add_argument("--index_dir", type=str, default=str(DEFAULT_INDEX_DIR),
+                        help="Directory where parsed Defects4J query metadata is cached per project")
+    parser.add_argument("--refresh_index", action="store_true", help="Re-run defects4j query even if a cached index exists")
+    parser.add_argument("--checkout_cache", type=str, required=False,
+                        help="Directory of cached pristine checkouts; the working copy is cloned from it instead of re-running defects4j checkout")
+    parser.add_argument("--context_budget", type=int, required=False,
+                        help="Token budget of one prompt; the most relevant files are packed into it instead of chunking")
+    parser.add_argument("--slice_methods", action="store_true",
+                        help="Keep only the failing test methods and the members they use; stub the rest")
+    parser.add_argument("--localize", type=int, required=False, metavar="TOP_K",
+                        help="Run the tests under coverage and focus the prompt on the TOP_K most suspicious methods")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the stage journal of a previous run and redo every stage")
+    parser.add_argument("--trace", type=str, required=False,
+                        help="Record per-stage spans and write them to TRACE.spans.jsonl and TRACE.trace.json")
+    
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable()
+    try:
+        run_pipeline(args.project, args.version, Path(args.workdir), args.without_context,
+                     Path(args.index_dir), args.refresh_index, args.checkout_cache, args.context_budget,
+                     args.slice_methods, resume=not args.restart, localize_top_k=args.localize)
+    except ConfigMismatch as e:
+        raise SystemExit(f"[ERROR] {e}; rerun with --restart to discard the journal")
+    finally:
+        if args.trace:
+            tracing.print_summary()
+            tracing.export(args.trace)
 
 if __name__ == "__main__":
     main()
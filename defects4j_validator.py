@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Staged validation of candidate fixes for a Defects4J bug.
+
+Running the whole test suite for every candidate is slow, and most
+candidates do not even fix the failing test. A candidate is therefore written
+into its own workspace (see workspace_pool.py), compiled with
+`defects4j compile`, and tested in stages that stop at the first failure:
+
+1. trigger  - only the `tests.trigger` methods of the bug, one by one;
+2. relevant - the relevant tests (`defects4j test -r`);
+3. full     - the complete test suite.
+
+In the relevant and full stages a candidate fails only on *new* failures:
+tests that already fail on the buggy version are not held against it. Those
+baseline failures are computed once per bug (a full run of the unmodified
+buggy version) and cached on disk, so later candidates and later runs reuse
+them.
+
+With a validation cache (validation_cache.py) a candidate that only differs
+from an already validated one in whitespace or comments is resolved from the
+stored outcome without compiling anything.
+
+A candidate written against a sliced or focused prompt (java_slicer.py,
+fault_localization.py) may still hold /* ... */ stubs; their bodies are taken
+from the buggy class before anything is written.
+"""
+import argparse
+import json
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Set
+
+from bug_index import DEFAULT_INDEX_DIR, BugIndex, BugRecord
+from checkout_cache import file_lock
+from java_slicer import unslice
+from jvm_runner import TestOutcome, ValidationResult
+from source_index import SourceIndex
+from validation_cache import DEFAULT_CACHE_DIR as DEFAULT_VALIDATION_CACHE_DIR, ValidationCache
+from workspace_pool import WorkspacePool
+import tracing
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+STAGES = ("trigger", "relevant", "full")
+DEFAULT_BASELINE_DIR = Path.home() / ".cache" / "defects4j_baseline"
+COMPILE_TIMEOUT = 600
+TEST_TIMEOUT = 3600
+# The compiled classes have to come along into every workspace; only VCS metadata is skipped.
+WORKSPACE_EXCLUDES = (".git",)
+BASELINE_FORMAT_VERSION = 1
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def parse_failing_tests(output: str) -> Optional[List[str]]:
+    """
+    The "Failing tests: N" list printed by `defects4j test` (entries such as
+    "org.apache.commons.lang3.StringUtilsTest::testLang747"); None if the
+    output has no such list, i.e. the test run itself failed.
+    """
+    failing, in_list, found = [], False, False
+    for line in output.splitlines():
+        if line.startswith("Failing tests:"):
+            in_list = found = True
+            continue
+        if in_list:
+            match = re.match(r"\s+-\s+(\S+)", line)
+            if match:
+                failing.append(match.group(1))
+            elif line.strip():
+                in_list = False
+    return failing if found else None
+
+def run_defects4j(args: Sequence[str], timeout: float, defects4j: str = "defects4j"):
+    """Run a defects4j command; returns (returncode, combined output, timed_out)."""
+    try:
+        result = subprocess.run([defects4j, *args], capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout if isinstance(e.stdout, str) else (e.stdout or b"").decode(errors="replace")
+        return None, output, True
+    return result.returncode, result.stdout + result.stderr, False
+
+def cache_status(result: ValidationResult) -> str:
+    """The validation-cache status of a staged outcome; runner errors and timeouts are never cached."""
+    if result.passed:
+        return "passed"
+    if result.timed_out:
+        return "timeout"
+    if result.compiled is False:
+        return "rejected"
+    return "failed" if result.failed_tests and result.error is None else "error"
+
+def test_outcomes(failing: Sequence[str], passing: Sequence[str] = ()) -> List[TestOutcome]:
+    return [TestOutcome(name, "FAIL") for name in failing] + [TestOutcome(name, "PASS") for name in passing]
+
+
+class Defects4JValidator:
+    """
+    Validates candidate versions of one modified class of a Defects4J bug.
+
+    `source_root` is a checkout of the buggy version (compiled, e.g. a working
+    copy from checkout_cache, saves the first build); `size` workspaces are
+    cloned from it so that several candidates can be validated in parallel.
+    validate() is safe to call from several threads.
+    """
+
+    def __init__(self, project: str, version: str, source_root, bug: BugRecord, size: Optional[int] = None,
+                 pool_root=None, baseline_dir=DEFAULT_BASELINE_DIR, stages: Sequence[str] = STAGES,
+                 defects4j: str = "defects4j", compile_timeout: float = COMPILE_TIMEOUT,
+                 test_timeout: float = TEST_TIMEOUT, cache: Optional[ValidationCache] = None):
+        unknown = [s for s in stages if s not in STAGES]
+        if unknown:
+            raise ValueError(f"unknown stage(s) {unknown}; choose from {STAGES}")
+        self.project = project
+        self.version = version
+        self.source_root = Path(source_root).resolve()
+        self.bug = bug
+        self.stages = tuple(stages)
+        self.defects4j = defects4j
+        self.compile_timeout = compile_timeout
+        self.test_timeout = test_timeout
+        self.baseline_file = Path(baseline_dir) / project / f"{version}.json"
+        self.cache = cache
+        self.index = SourceIndex.load_or_build(self.source_root)
+        # Hardlinks are not an option: compiling rewrites class files in place.
+        self.pool = WorkspacePool(self.source_root, size=size, pool_root=pool_root, mode="auto",
+                                  excludes=WORKSPACE_EXCLUDES, auto_fallback="copy")
+        self._baseline: Optional[Set[str]] = None
+        self._baseline_lock = threading.Lock()
+
+    def source_path(self, class_name: str) -> Path:
+        """Path of a class's source file relative to the checkout."""
+        path = self.index.find(class_name)
+        if path is None:
+            raise FileNotFoundError(f"no source file for {class_name} in {self.source_root}")
+        return path.relative_to(self.index.root)
+
+    def _compile(self, workspace) -> Optional[ValidationResult]:
+        """Compile the workspace; a ValidationResult if that failed, None if it compiled."""
+        with tracing.span("compile", project=self.project, version=self.version) as span:
+            returncode, output, timed_out = run_defects4j(["compile", "-w", str(workspace.root)],
+                                                          self.compile_timeout, self.defects4j)
+            span.set(passed=returncode == 0, timed_out=timed_out)
+        if returncode == 0:
+            return None
+        diagnostics = [line for line in output.splitlines() if "error:" in line or "[javac]" in line][-50:]
+        return ValidationResult(passed=False, compiled=False, diagnostics=diagnostics or output.splitlines()[-20:],
+                                timed_out=timed_out, stage="compile",
+                                error="compile timed out" if timed_out else "compilation failed")
+
+    def _run_tests(self, workspace, selector: Sequence[str] = ()):
+        """Run `defects4j test` with selector args; returns (failing tests or None, output, timed_out)."""
+        with tracing.span("test", project=self.project, version=self.version, selector=" ".join(selector)) as span:
+            returncode, output, timed_out = run_defects4j(["test", "-w", str(workspace.root), *selector],
+                                                          self.test_timeout, self.defects4j)
+            failing = None if timed_out else parse_failing_tests(output)
+            span.set(timed_out=timed_out)
+            if failing is not None:
+                span.set(failing=len(failing))
+        return failing, output, timed_out
+
+    def baseline(self) -> Set[str]:
+        """Tests failing on the unmodified buggy version (full suite), computed once and cached on disk."""
+        with self._baseline_lock:
+            if self._baseline is not None:
+                return self._baseline
+            with file_lock(self.baseline_file.with_suffix(".lock")):
+                try:
+                    payload = json.loads(self.baseline_file.read_text())
+                    if payload.get("format") == BASELINE_FORMAT_VERSION:
+                        self._baseline = set(payload["failing"])
+                        print(f"DEBUG: Loaded baseline of {self.project}-{self.version} from {self.baseline_file} "
+                              f"({len(self._baseline)} failing test(s))")
+                        return self._baseline
+                except (FileNotFoundError, json.JSONDecodeError):
+                    pass
+                self._baseline = self._compute_baseline()
+                self.baseline_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.baseline_file.with_suffix(".tmp")
+                tmp.write_text(json.dumps({"format": BASELINE_FORMAT_VERSION, "project": self.project,
+                                           "version": self.version, "created": time.time(),
+                                           "failing": sorted(self._baseline)}))
+                tmp.replace(self.baseline_file)
+            return self._baseline
+
+    def _compute_baseline(self) -> Set[str]:
+        print(f"DEBUG: Computing baseline failing tests of {self.project}-{self.version} (full suite, once)")
+        start = time.perf_counter()
+        # A throwaway clone: the pool's workspaces may be busy (possibly with the candidate that needs
+        # the baseline) and may hold classes compiled from earlier candidates.
+        with WorkspacePool(self.source_root, size=1, mode=self.pool.mode, excludes=WORKSPACE_EXCLUDES) as pool:
+            with pool.workspace() as workspace:
+                compile_error = self._compile(workspace)
+                if compile_error is not None:
+                    raise RuntimeError(f"{self.project}-{self.version} does not compile: {compile_error.diagnostics}")
+                failing, output, timed_out = self._run_tests(workspace)
+        if failing is None:
+            raise RuntimeError(f"baseline test run of {self.project}-{self.version} failed"
+                               + (" (timed out)" if timed_out else f":\n{output[-2000:]}"))
+        print(f"DEBUG: Baseline of {self.project}-{self.version}: {len(failing)} failing test(s) "
+              f"in {time.perf_counter() - start:.0f}s")
+        return set(failing)
+
+    def _trigger_stage(self, workspace) -> Optional[ValidationResult]:
+        passing = []
+        for test in self.bug.trigger_tests:
+            failing, output, timed_out = self._run_tests(workspace, ["-t", str(test)])
+            if failing is None or failing:
+                return ValidationResult(passed=False, compiled=True, timed_out=timed_out, stage="trigger",
+                                        tests=test_outcomes(failing or [str(test)], passing),
+                                        error=None if failing else "trigger test run failed",
+                                        diagnostics=[] if failing else output.splitlines()[-20:])
+            passing.append(str(test))
+        return None
+
+    def _suite_stage(self, workspace, stage: str) -> Optional[ValidationResult]:
+        failing, output, timed_out = self._run_tests(workspace, ["-r"] if stage == "relevant" else [])
+        if failing is None:
+            return ValidationResult(passed=False, compiled=True, timed_out=timed_out, stage=stage,
+                                    error=f"{stage} test run failed", diagnostics=output.splitlines()[-20:])
+        new_failures = sorted(set(failing) - self.baseline())
+        if new_failures:
+            print(f"DEBUG: {len(new_failures)} test(s) fail in the {stage} stage that pass on the buggy version")
+            return ValidationResult(passed=False, compiled=True, stage=stage, tests=test_outcomes(new_failures))
+        return None
+
+    def validate(self, fixed_code: str, class_name: Optional[str] = None) -> ValidationResult:
+        """
+        Validate a candidate version of class_name (default: the bug's first
+        modified class). The result's stage says where it stopped. Members
+        the candidate left stubbed get the buggy class's bodies back.
+        """
+        class_name = class_name or self.bug.modified[0]
+        original = self.index.root / self.source_path(class_name)
+        fixed_code = unslice(fixed_code, original.read_text(errors="replace"))
+        if self.cache is None:
+            return self._validate(fixed_code, class_name)
+
+        def validate():
+            result = self._validate(fixed_code, class_name)
+            return result, cache_status(result)
+
+        selection = f"{class_name}|{','.join(self.stages)}"
+        result, status, cached = self.cache.resolve(f"{self.project}-{self.version}", fixed_code, selection, validate)
+        if cached:
+            print(f"DEBUG: {self.project}-{self.version}: candidate matches a validated one; reusing '{status}'")
+        return result
+
+    def _validate(self, fixed_code: str, class_name: str) -> ValidationResult:
+        rel_path = self.source_path(class_name)
+        start = time.perf_counter()
+        with self.pool.workspace() as workspace:
+            workspace.write_file(rel_path, fixed_code)
+            result = self._compile(workspace)
+            for stage in self.stages:
+                if result is not None:
+                    break
+                print(f"DEBUG: {self.project}-{self.version}: running {stage} stage")
+                result = self._trigger_stage(workspace) if stage == "trigger" else self._suite_stage(workspace, stage)
+        if result is None:
+            result = ValidationResult(passed=True, compiled=True, stage=self.stages[-1] if self.stages else "compile",
+                                      tests=test_outcomes([], [str(t) for t in self.bug.trigger_tests]))
+        result.duration = time.perf_counter() - start
+        return result
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    from defects4j_pipeline import query_defects4j
+
+    parser = argparse.ArgumentParser(description="Validate candidate fixes of a Defects4J bug in stages")
+    parser.add_argument("--project", type=str, required=True, help="Defects4J project name (e.g., Lang)")
+    parser.add_argument("--version", type=str, required=True, help="Buggy version id (e.g., 1b)")
+    parser.add_argument("--workdir", type=str, required=True, help="Checkout of the buggy version")
+    parser.add_argument("--candidates", type=str, nargs="+", required=True, help="Candidate .java files")
+    parser.add_argument("--class_name", type=str, default=None,
+                        help="Fully qualified class the candidates replace (default: the bug's first modified class)")
+    parser.add_argument("--stages", type=str, default=",".join(STAGES),
+                        help=f"Comma-separated stages to run, in order ({', '.join(STAGES)})")
+    parser.add_argument("--workers", type=int, default=1, help="Candidates validated in parallel")
+    parser.add_argument("--index_dir", type=str, default=str(DEFAULT_INDEX_DIR))
+    parser.add_argument("--baseline_dir", type=str, default=str(DEFAULT_BASELINE_DIR),
+                        help="Where the failing tests of each buggy version are cached")
+    parser.add_argument("--validation_cache_dir", type=str, default=DEFAULT_VALIDATION_CACHE_DIR,
+                        help="Cache of validation outcomes per normalized candidate, shared across runs")
+    parser.add_argument("--no_validation_cache", action="store_true",
+                        help="Validate every candidate (outcomes are still stored)")
+    args = parser.parse_args()
+
+    bug = BugIndex.load_or_query(args.project, query_defects4j, Path(args.index_dir))[args.version]
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    cache = ValidationCache(args.validation_cache_dir, bypass=args.no_validation_cache)
+    with Defects4JValidator(args.project, args.version, args.workdir, bug, size=args.workers,
+                            baseline_dir=args.baseline_dir, stages=stages, cache=cache) as validator:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = {candidate: executor.submit(validator.validate, Path(candidate).read_text(), args.class_name)
+                       for candidate in args.candidates}
+        for candidate, future in futures.items():
+            result = future.result()
+            verdict = "PASSED" if result.passed else f"FAILED at {result.stage}"
+            print(f"{candidate}: {verdict} in {result.duration:.0f}s"
+                  + (f" ({', '.join(result.failed_tests)})" if result.failed_tests else "")
+                  + (f" - {result.error}" if result.error else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Coverage-based fault localization for Defects4J bugs.
+
+The prompts carry every relevant source class, or at least the whole class to
+modify, although the fault usually sits in a few lines. This pre-pass runs the
+trigger tests and a sample of passing tests one by one under coverage, either
+with `defects4j coverage` (Cobertura XML) or with a local JaCoCo agent run in
+a JUnitWorker JVM (jvm_runner.py). Every covered statement is then scored
+spectrum-style:
+
+    ochiai(s)    = ef / sqrt(nf * (ef + ep))
+    tarantula(s) = (ef / nf) / (ef / nf + ep / np)
+
+where ef/ep are the failing/passing tests that execute s and nf/np the
+failing/passing tests in total. Scored lines are grouped by the member
+(method, constructor, field, ...) that contains them, giving a ranked list of
+suspicious methods with their line ranges. focus_context_files() uses the
+top-k of them to cut the prompt down: suspicious methods stay in full, the
+other members of their classes are stubbed, relevant classes without any
+suspicious region are summarized, and the ranked list goes into the header of
+the class to modify.
+
+The result is cached per bug version (like the validator's baseline), so the
+coverage runs are paid once.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from bug_index import DEFAULT_INDEX_DIR, BugIndex, BugRecord
+from checkout_cache import file_lock
+from context_planner import ROLE_MODIFIED, ROLE_SRC, ContextFile
+from defects4j_validator import parse_failing_tests, run_defects4j
+from java_slicer import is_test_method, member_label, slice_modified_class
+from java_source import members, skeleton
+from jvm_runner import JVMWorker, build_worker
+from source_index import SourceIndex
+import tracing
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "defects4j_localization"
+LOCALIZATION_FORMAT_VERSION = 1
+COVERAGE_FILE = "coverage.xml"
+INSTRUMENT_FILE = ".localization_classes"
+COVERAGE_TIMEOUT = 1800
+DEFAULT_TOP_K = 5
+DEFAULT_MAX_PASSING = 30
+REGIONS_HEADER = "===== SUSPICIOUS REGIONS (coverage-based fault localization, most suspicious first) =====\n"
+FOCUSED_NOTE = " - FOCUSED: only the suspicious methods are shown in full, other bodies are stubbed as /* ... */, keep them unchanged"
+SUMMARY_NOTE = " - SUMMARY, method bodies omitted"
+
+
+@dataclass
+class TestSpectrum:
+    """Lines one test executed: class name -> covered line numbers."""
+    test: str
+    failed: bool
+    lines: Dict[str, Set[int]] = field(default_factory=dict)
+
+
+@dataclass
+class SuspiciousRegion:
+    class_name: str     # e.g. "org.apache.commons.lang3.math.NumberUtils"
+    file: str           # file name, e.g. "NumberUtils.java"
+    member: str         # member label, e.g. "createNumber(String)"
+    method: str         # bare member name, e.g. "createNumber" ("" for code outside any member)
+    start_line: int     # first and last suspicious line within the member
+    end_line: int
+    score: float        # highest score of its lines
+    lines: List[int] = field(default_factory=list)
+
+    def describe(self) -> str:
+        lines = f"line {self.start_line}" if self.start_line == self.end_line else f"lines {self.start_line}-{self.end_line}"
+        return f"{self.file} {self.member or '<class body>'} {lines} (score {self.score:.3f})"
+
+
+@dataclass
+class Localization:
+    project: str
+    version: str
+    formula: str
+    tests: List[dict]                   # {"test", "failed", "lines"} per coverage run
+    regions: List[SuspiciousRegion]     # most suspicious first
+    config: dict = field(default_factory=dict)
+
+    def top(self, k: Optional[int] = DEFAULT_TOP_K) -> List[SuspiciousRegion]:
+        return self.regions[:k] if k else list(self.regions)
+
+    def regions_text(self, k: Optional[int] = DEFAULT_TOP_K) -> str:
+        return "".join(f"{i}. {region.describe()}\n" for i, region in enumerate(self.top(k), 1))
+
+    def to_json(self) -> dict:
+        return {"format": LOCALIZATION_FORMAT_VERSION, "project": self.project, "version": self.version,
+                "formula": self.formula, "config": self.config, "created": time.time(), "tests": self.tests,
+                "regions": [asdict(r) for r in self.regions]}
+
+    @classmethod
+    def from_json(cls, payload: dict) -> "Localization":
+        return cls(payload["project"], payload["version"], payload["formula"], payload["tests"],
+                   [SuspiciousRegion(**r) for r in payload["regions"]], payload.get("config", {}))
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def ochiai(ef: int, ep: int, nf: int, np: int) -> float:
+    denominator = math.sqrt(nf * (ef + ep))
+    return ef / denominator if denominator else 0.0
+
+def tarantula(ef: int, ep: int, nf: int, np: int) -> float:
+    failed = ef / nf if nf else 0.0
+    passed = ep / np if np else 0.0
+    return failed / (failed + passed) if failed + passed else 0.0
+
+FORMULAS: Dict[str, Callable[[int, int, int, int], float]] = {"ochiai": ochiai, "tarantula": tarantula}
+
+def parse_cobertura(xml_text: str) -> Dict[str, Set[int]]:
+    """Covered lines per top-level class from a Cobertura report (what `defects4j coverage` writes)."""
+    covered = {}
+    for cls in ET.fromstring(xml_text).iter("class"):
+        name = cls.get("name", "").split("$", 1)[0]
+        lines = cls.find("lines")
+        for line in lines if lines is not None else ():
+            if int(line.get("hits", "0")) > 0:
+                covered.setdefault(name, set()).add(int(line.get("number")))
+    return covered
+
+def parse_jacoco(xml_text: str) -> Dict[str, Set[int]]:
+    """Covered lines per top-level class (named after its source file) from a JaCoCo XML report."""
+    covered = {}
+    for package in ET.fromstring(xml_text).iter("package"):
+        prefix = package.get("name", "").replace("/", ".")
+        for source in package.iter("sourcefile"):
+            name = (prefix + "." if prefix else "") + source.get("name", "").rsplit(".", 1)[0]
+            for line in source.iter("line"):
+                if int(line.get("ci", "0")) > 0:
+                    covered.setdefault(name, set()).add(int(line.get("nr")))
+    return covered
+
+def score_lines(spectra: Sequence[TestSpectrum], formula: str = "ochiai") -> Dict[str, Dict[int, float]]:
+    """Suspiciousness of every line executed by a failing test (other lines score 0 with either formula)."""
+    score = FORMULAS[formula]
+    nf = sum(1 for s in spectra if s.failed)
+    np = len(spectra) - nf
+    counts = {}
+    for s in spectra:
+        for class_name, lines in s.lines.items():
+            for line in lines:
+                entry = counts.setdefault((class_name, line), [0, 0])
+                entry[0 if s.failed else 1] += 1
+    scores = {}
+    for (class_name, line), (ef, ep) in counts.items():
+        if ef:
+            scores.setdefault(class_name, {})[line] = score(ef, ep, nf, np)
+    return scores
+
+def member_lines(source: str) -> List[Tuple[str, str, int, int]]:
+    """(label, name, first line, last line) of every member of the top-level type."""
+    result = []
+    for m in members(source):
+        first = source.count("\n", 0, m.start) + 1
+        last = source.count("\n", 0, max(m.start, m.end - 1)) + 1
+        result.append((member_label(m), m.name, first, last))
+    return result
+
+def group_regions(class_name: str, file_name: str, source: str, line_scores: Dict[int, float]) -> List[SuspiciousRegion]:
+    """One region per member holding suspicious lines; lines outside every member form one more region."""
+    spans = member_lines(source)
+    grouped = {}
+    for line, value in line_scores.items():
+        if value <= 0:
+            continue
+        owner = next((s for s in spans if s[2] <= line <= s[3]), ("", "", 0, 0))
+        grouped.setdefault(owner, []).append(line)
+    regions = []
+    for (label, name, _, _), lines in grouped.items():
+        lines.sort()
+        regions.append(SuspiciousRegion(class_name, file_name, label, name, lines[0], lines[-1],
+                                        max(line_scores[line] for line in lines), lines))
+    return regions
+
+def source_test_methods(index: SourceIndex, class_name: str) -> List[str]:
+    """Test method names of a test class, read from its source (empty if it cannot be found)."""
+    path = index.find(class_name)
+    if path is None:
+        return []
+    return [m.name for m in members(path.read_text(errors="replace")) if is_test_method(m)]
+
+def select_tests(bug: BugRecord, index: SourceIndex, max_passing: int = DEFAULT_MAX_PASSING):
+    """
+    (failing, passing) tests as "Class::method". The passing sample starts with
+    the siblings of the failing methods in the trigger test classes, which run
+    through the same code, then the relevant test classes.
+    """
+    failing = [str(t) for t in bug.trigger_tests]
+    passing, seen = [], set(failing)
+    classes = list(bug.trigger_test_classes) + [c for c in bug.relevant_test if c not in bug.trigger_test_classes]
+    for class_name in classes:
+        for method in source_test_methods(index, class_name):
+            test = f"{class_name}::{method}"
+            if len(passing) >= max_passing:
+                return failing, passing
+            if test not in seen:
+                seen.add(test)
+                passing.append(test)
+    return failing, passing
+
+
+class Defects4JCoverage:
+    """Per-test line coverage from `defects4j coverage`, instrumenting the given classes."""
+
+    name = "defects4j"
+
+    def __init__(self, work_dir, classes: Sequence[str], defects4j: str = "defects4j",
+                 timeout: float = COVERAGE_TIMEOUT):
+        self.work_dir = Path(work_dir).resolve()
+        self.defects4j = defects4j
+        self.timeout = timeout
+        self.instrument_file = self.work_dir / INSTRUMENT_FILE
+        self.instrument_file.write_text("\n".join(classes) + "\n")
+
+    def run(self, test: str) -> Tuple[Dict[str, Set[int]], Optional[bool]]:
+        """(covered lines, whether the test failed or None if the output does not say) of one test."""
+        returncode, output, timed_out = run_defects4j(
+            ["coverage", "-w", str(self.work_dir), "-t", test, "-i", str(self.instrument_file)],
+            self.timeout, self.defects4j)
+        if returncode != 0:
+            raise RuntimeError(f"defects4j coverage of {test} failed" + (" (timed out)" if timed_out else
+                                                                         f":\n{output[-2000:]}"))
+        failing = parse_failing_tests(output)
+        return parse_cobertura((self.work_dir / COVERAGE_FILE).read_text()), None if failing is None else bool(failing)
+
+    def close(self):
+        self.instrument_file.unlink(missing_ok=True)
+
+
+class JacocoCoverage:
+    """
+    Per-test line coverage from a local JaCoCo run: every test runs in a fresh
+    JUnitWorker JVM with the JaCoCo agent, and jacococli turns the dump into
+    an XML report. The classpath comes from `defects4j export`, the project is
+    compiled once up front.
+    """
+
+    name = "jacoco"
+
+    def __init__(self, work_dir, classes: Sequence[str], agent_jar, cli_jar, defects4j: str = "defects4j",
+                 java: str = "java", timeout: float = COVERAGE_TIMEOUT):
+        self.work_dir = Path(work_dir).resolve()
+        self.agent_jar = str(Path(agent_jar).resolve())
+        self.cli_jar = str(Path(cli_jar).resolve())
+        self.includes = ":".join(classes)
+        self.java = java
+        self.timeout = timeout
+        self.scratch = Path(tempfile.mkdtemp(prefix="jacoco-"))
+        returncode, output, _ = run_defects4j(["compile", "-w", str(self.work_dir)], timeout, defects4j)
+        if returncode != 0:
+            raise RuntimeError(f"{self.work_dir} does not compile:\n{output[-2000:]}")
+        classpath = self._export("cp.test", defects4j).split(":")
+        self.jars = [e for e in classpath if e.endswith(".jar")]
+        self.class_dirs = [e for e in classpath if e and not e.endswith(".jar")]
+        self.bin_dir = str(self.work_dir / self._export("dir.bin.classes", defects4j))
+        self.worker_classpath = [str(build_worker(self.jars))] + self.jars
+
+    def _export(self, prop: str, defects4j: str) -> str:
+        returncode, output, _ = run_defects4j(["export", "-p", prop, "-w", str(self.work_dir)], self.timeout, defects4j)
+        if returncode != 0:
+            raise RuntimeError(f"defects4j export -p {prop} failed:\n{output[-2000:]}")
+        return output.strip().splitlines()[-1]
+
+    def run(self, test: str) -> Tuple[Dict[str, Set[int]], Optional[bool]]:
+        test_class, _, method = test.partition("::")
+        exec_file, report = self.scratch / "jacoco.exec", self.scratch / "jacoco.xml"
+        exec_file.unlink(missing_ok=True)
+        agent = f"-javaagent:{self.agent_jar}=destfile={exec_file},includes={self.includes}"
+        worker = JVMWorker(self.java, self.worker_classpath, self.scratch / "worker.log", jvm_args=[agent])
+        try:
+            response = worker.request("RUN", os.pathsep.join(self.class_dirs), test_class, method, timeout=self.timeout)
+        finally:
+            worker.close()  # the agent writes the exec file when the JVM exits
+        end = response[-1]
+        if end[1] == "ERROR":
+            raise RuntimeError(f"running {test} failed: {end[2] if len(end) > 2 else ''}")
+        subprocess.run([self.java, "-jar", self.cli_jar, "report", str(exec_file), "--classfiles", self.bin_dir,
+                        "--xml", str(report)], check=True, capture_output=True, timeout=self.timeout)
+        return parse_jacoco(report.read_text()), end[1] == "FAIL"
+
+    def close(self):
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+
+def collect_spectra(runner, failing: Sequence[str], passing: Sequence[str]) -> List[TestSpectrum]:
+    """Run every test under coverage. The test's own outcome wins over the expected one when it is reported."""
+    spectra = []
+    for test in [*failing, *passing]:
+        expected = test in failing
+        with tracing.span("coverage", backend=runner.name, expected_failure=expected) as span:
+            lines, failed = runner.run(test)
+            failed = expected if failed is None else failed
+            span.set(failed=failed, lines=sum(len(v) for v in lines.values()))
+        if failed != expected:
+            print(f"DEBUG: {test} {'failed' if failed else 'passed'} under coverage, expected the opposite")
+        spectra.append(TestSpectrum(test, failed, lines))
+    return spectra
+
+def localization_file(cache_dir: Path, project: str, version: str) -> Path:
+    return Path(cache_dir) / project / f"{version}.json"
+
+def localize(bug: BugRecord, project: str, version: str, work_dir, make_runner=None, formula: str = "ochiai",
+             max_passing: int = DEFAULT_MAX_PASSING, cache_dir=DEFAULT_CACHE_DIR, refresh: bool = False) -> Localization:
+    """
+    Rank the suspicious regions of a bug's relevant source classes. work_dir is
+    a checkout of the buggy version; make_runner(work_dir, classes) builds the
+    coverage backend (default: Defects4JCoverage), only if nothing is cached.
+    The result is cached per bug version and reused while formula and test
+    sample size are unchanged; a run in which no test failed is not cached.
+    """
+    if formula not in FORMULAS:
+        raise ValueError(f"unknown formula {formula!r}; choose from {sorted(FORMULAS)}")
+    config = {"formula": formula, "max_passing": max_passing}
+    cache_file = localization_file(cache_dir, project, version)
+    with file_lock(cache_file.with_suffix(".lock")):
+        if not refresh:
+            try:
+                payload = json.loads(cache_file.read_text())
+                if payload.get("format") == LOCALIZATION_FORMAT_VERSION and payload.get("config") == config:
+                    print(f"DEBUG: Loaded fault localization of {project}-{version} from {cache_file}")
+                    return Localization.from_json(payload)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+        work_dir = Path(work_dir).resolve()
+        index = SourceIndex.load_or_build(work_dir)
+        failing, passing = select_tests(bug, index, max_passing)
+        classes = list(dict.fromkeys([*bug.modified, *bug.relevant_src]))
+        print(f"DEBUG: Localizing {project}-{version}: {len(failing)} failing and {len(passing)} passing test(s) "
+              f"under coverage, {len(classes)} instrumented class(es)")
+        start = time.perf_counter()
+        runner = (make_runner or Defects4JCoverage)(work_dir, classes)
+        try:
+            spectra = collect_spectra(runner, failing, passing)
+        finally:
+            runner.close()
+        localized = any(s.failed for s in spectra)
+        if not localized:
+            print(f"DEBUG: No test failed under coverage; {project}-{version} cannot be localized")
+
+        regions = []
+        for class_name, line_scores in score_lines(spectra, formula).items():
+            path = index.find(class_name)
+            if path is None:
+                continue
+            regions.extend(group_regions(class_name, path.name, path.read_text(errors="replace"), line_scores))
+        regions.sort(key=lambda r: (-r.score, r.file, r.start_line))
+        tests = [{"test": s.test, "failed": s.failed, "lines": sum(len(v) for v in s.lines.values())} for s in spectra]
+        localization = Localization(project, version, formula, tests, regions, config)
+        print(f"DEBUG: Localized {project}-{version} in {time.perf_counter() - start:.0f}s: "
+              f"{len(regions)} suspicious region(s)")
+
+        if not localized:
+            # Most likely a broken checkout or coverage run; not worth remembering, try again next time.
+            return localization
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(localization.to_json(), indent=2))
+        tmp.replace(cache_file)
+    return localization
+
+def focus_context_files(files: Sequence[ContextFile], localization: Localization,
+                        top_k: int = DEFAULT_TOP_K) -> List[ContextFile]:
+    """
+    Cut the context down to the top_k suspicious regions: in classes holding
+    one, only the suspicious methods keep their bodies; other relevant source
+    classes are summarized. The ranked regions are listed in the header of the
+    class to modify. Test files are left alone.
+    """
+    regions = localization.top(top_k)
+    if not regions:
+        return list(files)
+    suspicious = {}
+    for region in regions:
+        if region.method:
+            suspicious.setdefault(region.file, set()).add(region.method)
+    listing = REGIONS_HEADER + localization.regions_text(top_k)
+
+    focused, listed = [], False
+    for f in files:
+        if f.role in (ROLE_MODIFIED, ROLE_SRC) and f.name in suspicious:
+            result = slice_modified_class(f.code, suspicious[f.name], call_depth=0)
+            if result is not None:
+                print(f"DEBUG: Focused {f.name} on {sorted(suspicious[f.name])}: {len(f.code)} -> {len(result.code)} chars")
+                f = replace(f, header=f.header.replace(" =====\n", FOCUSED_NOTE + " =====\n", 1), code=result.code)
+        elif f.role == ROLE_SRC:
+            f = replace(f, header=f.header.replace(" =====\n", SUMMARY_NOTE + " =====\n", 1), code=skeleton(f.code))
+        if f.role == ROLE_MODIFIED and not listed:
+            f = replace(f, header=f.header + listing)
+            listed = True
+        focused.append(f)
+    return focused
+
+# ----------------------------
+# Main Script
+# ----------------------------
+
+def main():
+    from defects4j_pipeline import query_defects4j
+
+    parser = argparse.ArgumentParser(description="Rank the suspicious methods of a Defects4J bug by test coverage")
+    parser.add_argument("--project", type=str, required=True, help="Defects4J project name (e.g., Lang)")
+    parser.add_argument("--version", type=str, required=True, help="Buggy version id (e.g., 1b)")
+    parser.add_argument("--workdir", type=str, required=True, help="Checkout of the buggy version")
+    parser.add_argument("--formula", type=str, default="ochiai", choices=sorted(FORMULAS))
+    parser.add_argument("--top_k", type=int, default=DEFAULT_TOP_K, help="Regions to print")
+    parser.add_argument("--max_passing", type=int, default=DEFAULT_MAX_PASSING,
+                        help="Passing tests run under coverage next to the trigger tests")
+    parser.add_argument("--jacoco_agent", type=str, default=None,
+                        help="jacocoagent.jar; with --jacoco_cli, use a local JaCoCo run instead of defects4j coverage")
+    parser.add_argument("--jacoco_cli", type=str, default=None, help="jacococli.jar")
+    parser.add_argument("--cache_dir", type=str, default=str(DEFAULT_CACHE_DIR))
+    parser.add_argument("--index_dir", type=str, default=str(DEFAULT_INDEX_DIR))
+    parser.add_argument("--refresh", action="store_true", help="Ignore a cached localization of this version")
+    args = parser.parse_args()
+
+    bug = BugIndex.load_or_query(args.project, query_defects4j, Path(args.index_dir))[args.version]
+    make_runner = None
+    if args.jacoco_agent or args.jacoco_cli:
+        if not (args.jacoco_agent and args.jacoco_cli):
+            parser.error("--jacoco_agent and --jacoco_cli go together")
+        make_runner = lambda work_dir, classes: JacocoCoverage(work_dir, classes, args.jacoco_agent, args.jacoco_cli)
+    localization = localize(bug, args.project, args.version, args.workdir, make_runner, args.formula,
+                            args.max_passing, Path(args.cache_dir), args.refresh)
+    print(f"Tests run under coverage: {len(localization.tests)} "
+          f"({sum(1 for t in localization.tests if t['failed'])} failing)")
+    print(localization.regions_text(args.top_k) or "No suspicious regions found")
+
+if __name__ == "__main__":
+    main()
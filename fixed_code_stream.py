@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Incremental extraction of the fixed code from a streamed chain-of-thought
+response.
+
+The chain-of-thought prompts ask the model to put its code between
+---FIXED CODE--- and ---END FIXED CODE---. Fed the response chunk by chunk,
+FixedCodeStream finds both markers as soon as they arrive (also when a marker
+is split across chunks), exposes the code received so far and reports when
+the block is complete, so the request can be cancelled instead of paying for
+whatever the model writes after the end marker.
+"""
+from typing import Optional
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+START_MARKER = "---FIXED CODE---"
+END_MARKER = "---END FIXED CODE---"
+
+
+class FixedCodeStream:
+    """Feed it response chunks; complete turns True once the end marker has arrived."""
+
+    def __init__(self, start_marker: str = START_MARKER, end_marker: str = END_MARKER):
+        self.start_marker = start_marker
+        self.end_marker = end_marker
+        self.text = ""
+        self.code_start: Optional[int] = None
+        self.code_end: Optional[int] = None
+        self._scan_from = 0
+
+    @property
+    def started(self) -> bool:
+        return self.code_start is not None
+
+    @property
+    def complete(self) -> bool:
+        return self.code_end is not None
+
+    @property
+    def code(self) -> str:
+        """The code block so far (all of it once complete); "" before the start marker."""
+        if self.code_start is None:
+            return ""
+        end = self.code_end if self.code_end is not None else len(self.text)
+        return self.text[self.code_start:end].strip()
+
+    def feed(self, chunk: str) -> bool:
+        """Append a chunk; returns True when the code block is complete and the stream can stop."""
+        if self.complete:
+            return True
+        self.text += chunk
+        if self.code_start is None:
+            index = self.text.find(self.start_marker, self._scan_from)
+            if index < 0:
+                # Rescan the tail next time in case the marker is split across chunks.
+                self._scan_from = max(0, len(self.text) - len(self.start_marker) + 1)
+                return False
+            self.code_start = index + len(self.start_marker)
+            self._scan_from = self.code_start
+        index = self.text.find(self.end_marker, self._scan_from)
+        if index < 0:
+            self._scan_from = max(self.code_start, len(self.text) - len(self.end_marker) + 1)
+            return False
+        self.code_end = index
+        return True
+
+    def truncated_text(self) -> str:
+        """The response up to and including the end marker (the whole text while incomplete)."""
+        if self.code_end is None:
+            return self.text
+        return self.text[:self.code_end + len(self.end_marker)]
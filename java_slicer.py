@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Method-level slicing of the Java files that go into a Defects4J prompt.
+
+A trigger test such as testLang747 pulls in its whole test class, often
+thousands of lines of unrelated tests. The slicer keeps only what the failing
+tests need:
+
+- in a trigger test class: the failing test methods, set-up/tear-down
+  methods, constructors, fields and the helper methods they call; the other
+  test methods are dropped and other helpers are stubbed;
+- in the class to modify: the methods (and constructors) the kept test code
+  calls, plus the methods those call within the class up to `call_depth`
+  levels; fields are kept, other methods and unused nested types are stubbed.
+
+A stub keeps the member's declaration and replaces its body with STUB_BODY,
+so the signatures the model sees are complete. unslice() puts the original
+bodies back into a candidate class that was written against a sliced one.
+"""
+import argparse
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from java_source import Member, code_tokens, members
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+STUB_BODY = " /* ... */ "
+DEFAULT_CALL_DEPTH = 2
+TEST_ANNOTATIONS = {"Test", "ParameterizedTest", "RepeatedTest", "TestFactory"}
+FIXTURE_ANNOTATIONS = {"Before", "After", "BeforeClass", "AfterClass", "BeforeEach", "AfterEach",
+                       "BeforeAll", "AfterAll", "Rule", "ClassRule"}
+FIXTURE_METHODS = {"setUp", "tearDown", "suite"}
+NOT_CALLS = {"if", "for", "while", "switch", "catch", "synchronized", "return", "throw", "super", "this"}
+SLICED_NOTE = " - SLICED: members not needed for the failing test are stubbed as /* ... */, keep them unchanged"
+
+
+@dataclass
+class SliceResult:
+    code: str
+    kept: List[str] = field(default_factory=list)
+    stubbed: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def called_names(code: str) -> Set[str]:
+    """Names of the methods and constructors called in code (identifiers followed by "(")."""
+    tokens = code_tokens(code)
+    return {t.text for t, nxt in zip(tokens, tokens[1:])
+            if t.kind == "ident" and nxt.text == "(" and t.text not in NOT_CALLS}
+
+def referenced_names(code: str) -> Set[str]:
+    return {t.text for t in code_tokens(code) if t.kind == "ident"}
+
+def is_test_method(member: Member) -> bool:
+    return member.kind == "method" and (bool(TEST_ANNOTATIONS & set(member.annotations))
+                                        or member.name.startswith("test"))
+
+def is_fixture(member: Member) -> bool:
+    return bool(FIXTURE_ANNOTATIONS & set(member.annotations)) or member.name in FIXTURE_METHODS
+
+def member_label(member: Member) -> str:
+    return f"{member.name}({member.params})" if member.kind in ("method", "constructor") else member.name
+
+def _expand_calls(source: str, all_members: Sequence[Member], keep: Set[int], depth: Optional[int]) -> Set[int]:
+    """Add the methods/constructors called from kept members, transitively up to depth levels (None = no limit)."""
+    frontier = set(keep)
+    level = 0
+    while frontier and (depth is None or level < depth):
+        calls = set()
+        for i in frontier:
+            calls |= called_names(source[all_members[i].start:all_members[i].end])
+        frontier = {i for i, m in enumerate(all_members)
+                    if i not in keep and m.kind in ("method", "constructor") and m.name in calls}
+        keep |= frontier
+        level += 1
+    return keep
+
+def render(source: str, all_members: Sequence[Member], decisions: Sequence[str], dropped_note: str = "") -> str:
+    """Rebuild the source with every member kept, stubbed or dropped as decided."""
+    if not all_members:
+        return source
+    pieces = [source[:all_members[0].start]]
+    noted = False
+    for member, decision in zip(all_members, decisions):
+        if decision == "keep" or (decision == "stub" and member.body_start < 0):
+            pieces.append(source[member.start:member.end])
+        elif decision == "stub":
+            pieces.append(source[member.start:member.body_start] + STUB_BODY + source[member.body_end:member.end])
+        elif dropped_note and not noted:
+            pieces.append(dropped_note)
+            noted = True
+    pieces.append(source[all_members[-1].end:])
+    return "".join(pieces)
+
+def _result(source: str, all_members: Sequence[Member], decisions: List[str], dropped_note: str = "") -> SliceResult:
+    result = SliceResult(render(source, all_members, decisions, dropped_note))
+    for member, decision in zip(all_members, decisions):
+        label = member_label(member)
+        if decision == "keep" or (decision == "stub" and member.body_start < 0):
+            result.kept.append(label)
+        elif decision == "stub":
+            result.stubbed.append(label)
+        else:
+            result.dropped.append(label)
+    return result
+
+
+# ----------------------------
+# Slicing
+# ----------------------------
+
+def slice_test_class(source: str, failing_methods: Iterable[str],
+                     call_depth: Optional[int] = None) -> Optional[SliceResult]:
+    """Keep the failing test methods and what they need; None if none of them is found."""
+    failing_methods = set(failing_methods)
+    all_members = members(source)
+    keep = {i for i, m in enumerate(all_members) if m.kind == "method" and m.name in failing_methods}
+    if not keep:
+        return None
+    keep |= {i for i, m in enumerate(all_members)
+             if m.kind in ("field", "constructor", "initializer", "enum_constants") or is_fixture(m)}
+    keep = _expand_calls(source, all_members, keep, call_depth)
+    used = set()
+    for i in keep:
+        used |= referenced_names(source[all_members[i].start:all_members[i].end])
+
+    decisions = []
+    for i, m in enumerate(all_members):
+        if i in keep or (m.kind == "type" and m.name in used):
+            decisions.append("keep")
+        elif is_test_method(m):
+            decisions.append("drop")
+        else:
+            decisions.append("stub")
+    dropped = decisions.count("drop")
+    note = f"\n\n    // ... {dropped} other test method(s) omitted ...\n" if dropped else ""
+    return _result(source, all_members, decisions, note)
+
+def slice_modified_class(source: str, called: Set[str],
+                         call_depth: Optional[int] = DEFAULT_CALL_DEPTH) -> Optional[SliceResult]:
+    """
+    Keep the methods of the class to modify that the test code calls (and
+    their callees up to call_depth); None if the tests call none of them.
+    """
+    all_members = members(source)
+    keep = {i for i, m in enumerate(all_members) if m.kind in ("method", "constructor") and m.name in called}
+    if not keep:
+        return None
+    keep = _expand_calls(source, all_members, keep, call_depth)
+    keep |= {i for i, m in enumerate(all_members) if m.kind in ("field", "initializer", "enum_constants")}
+    used = set()
+    for i in keep:
+        used |= referenced_names(source[all_members[i].start:all_members[i].end])
+    decisions = ["keep" if i in keep or (m.kind == "type" and m.name in used) else "stub"
+                 for i, m in enumerate(all_members)]
+    return _result(source, all_members, decisions)
+
+def unslice(candidate: str, original: str) -> str:
+    """
+    Restore the bodies of members that are still stubs in candidate from the
+    original class, matching by kind, name and parameters (or arity when the
+    parameter names changed).
+    """
+    by_signature, by_arity = {}, {}
+    for m in members(original):
+        if m.body_start >= 0:
+            by_signature.setdefault((m.kind, m.name, m.params), m)
+            by_arity.setdefault((m.kind, m.name, m.arity), []).append(m)
+
+    pieces, pos = [], 0
+    for m in members(candidate):
+        if m.body_start < 0 or candidate[m.body_start:m.body_end].strip() != STUB_BODY.strip():
+            continue
+        source_member = by_signature.get((m.kind, m.name, m.params))
+        if source_member is None:
+            same_arity = by_arity.get((m.kind, m.name, m.arity), [])
+            source_member = same_arity[0] if len(same_arity) == 1 else None
+        if source_member is None:
+            continue
+        pieces.append(candidate[pos:m.body_start])
+        pieces.append(original[source_member.body_start:source_member.body_end])
+        pos = m.body_end
+    pieces.append(candidate[pos:])
+    return "".join(pieces)
+
+def slice_context_files(files, trigger_methods: Dict[str, List[str]], call_depth: int = DEFAULT_CALL_DEPTH):
+    """
+    Slice the trigger test and class-to-modify ContextFiles (see
+    context_planner); trigger_methods maps test file names to failing methods.
+    Files that cannot be sliced are returned unchanged.
+    """
+    from context_planner import ROLE_MODIFIED, ROLE_TRIGGER_TEST
+
+    sliced, called = [], set()
+    for f in files:
+        if f.role == ROLE_TRIGGER_TEST and trigger_methods.get(f.name):
+            result = slice_test_class(f.code, trigger_methods[f.name])
+            if result is not None:
+                print(f"DEBUG: Sliced {f.name}: kept {len(result.kept)}, stubbed {len(result.stubbed)}, "
+                      f"dropped {len(result.dropped)} member(s); {len(f.code)} -> {len(result.code)} chars")
+                called |= called_names(result.code)
+                f = replace(f, code=result.code)
+            else:
+                called |= called_names(f.code)
+        sliced.append(f)
+
+    for i, f in enumerate(sliced):
+        if f.role == ROLE_MODIFIED:
+            result = slice_modified_class(f.code, called, call_depth)
+            if result is None:
+                print(f"DEBUG: Trigger tests call no method of {f.name} directly; keeping it whole")
+                continue
+            print(f"DEBUG: Sliced {f.name}: kept {len(result.kept)}, stubbed {len(result.stubbed)} member(s); "
+                  f"{len(f.code)} -> {len(result.code)} chars")
+            header = f.header.replace(" =====\n", SLICED_NOTE + " =====\n", 1)
+            sliced[i] = replace(f, header=header, code=result.code)
+    return sliced
+
+def main():
+    parser = argparse.ArgumentParser(description="Slice a class to modify and its trigger test down to what the failing tests need")
+    parser.add_argument("--source", type=str, required=True, help="The class to modify (.java)")
+    parser.add_argument("--test", type=str, required=True, help="The trigger test class (.java)")
+    parser.add_argument("--methods", type=str, nargs="+", required=True, help="Failing test method names")
+    parser.add_argument("--call_depth", type=int, default=DEFAULT_CALL_DEPTH)
+    args = parser.parse_args()
+
+    test_code = Path(args.test).read_text()
+    source_code = Path(args.source).read_text()
+    test_slice = slice_test_class(test_code, args.methods)
+    if test_slice is None:
+        raise SystemExit(f"None of {args.methods} found in {args.test}")
+    source_slice = slice_modified_class(source_code, called_names(test_slice.code), args.call_depth)
+    for name, original, result in ((args.test, test_code, test_slice), (args.source, source_code, source_slice)):
+        print(f"===== {name} =====")
+        if result is None:
+            print("(not sliced: no called members)")
+            continue
+        print(result.code)
+        print(f"// kept {len(result.kept)}, stubbed {len(result.stubbed)}, dropped {len(result.dropped)}; "
+              f"{len(original)} -> {len(result.code)} chars")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Lightweight Java source helpers shared by the pre-check and prompt-building stages.
+
+This is not a full Java parser: it tokenizes well enough to tell code from
+comments and string literals, which is all that is needed to check bracket
+balance, find the package and type declarations and locate member bodies.
+"""
+import re
+from typing import List, NamedTuple
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+OPENING = {"{": "}", "(": ")", "[": "]"}
+CLOSING = {v: k for k, v in OPENING.items()}
+TYPE_KEYWORDS = ("class", "interface", "enum", "record")
+# Tokens a compilation unit may legitimately start with.
+COMPILATION_UNIT_STARTS = {"package", "import", "public", "protected", "private", "abstract", "final",
+                           "static", "strictfp", "sealed", "class", "interface", "enum",
+                           "record", "@"}
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+    |(?P<textblock>\"\"\".*?(?:\"\"\"|\Z))
+    |(?P<string>"(?:\\.|[^"\\\n])*(?:"|$))
+    |(?P<char>'(?:\\.|[^'\\\n])*(?:'|$))
+    |(?P<ident>[A-Za-z_$][A-Za-z0-9_$]*)
+    |(?P<number>\d[\w.]*)
+    |(?P<space>\s+)
+    |(?P<op>.)
+    """,
+    re.DOTALL | re.VERBOSE | re.MULTILINE,
+)
+
+
+class Token(NamedTuple):
+    kind: str      # comment, textblock, string, char, ident, number, op
+    text: str
+    start: int     # character offset
+    line: int      # 1-based line number
+
+
+def tokenize(source: str) -> List[Token]:
+    """Split Java source into tokens (whitespace is dropped)."""
+    tokens = []
+    line = 1
+    for match in _TOKEN_RE.finditer(source):
+        kind = match.lastgroup
+        text = match.group()
+        if kind != "space":
+            tokens.append(Token(kind, text, match.start(), line))
+        line += text.count("\n")
+    return tokens
+
+def code_tokens(source: str) -> List[Token]:
+    """Tokens without comments."""
+    return [t for t in tokenize(source) if t.kind != "comment"]
+
+def mask_comments_and_strings(source: str) -> str:
+    """
+    Return the source with comments and the contents of string/char literals
+    replaced by spaces (newlines kept), so offsets and line numbers still match
+    but regexes and bracket matching only see real code.
+    """
+    chars = list(source)
+    for token in tokenize(source):
+        if token.kind in ("comment", "string", "char", "textblock"):
+            keep = 0 if token.kind == "comment" else 1
+            for i in range(token.start + keep, token.start + len(token.text) - keep):
+                if chars[i] != "\n":
+                    chars[i] = " "
+    return "".join(chars)
+
+def check_brackets(source: str) -> List[str]:
+    """Report unbalanced brackets and unterminated comments/literals, with line numbers."""
+    problems = []
+    stack = []
+    for token in tokenize(source):
+        if token.kind == "comment" and token.text.startswith("/*") and not token.text.endswith("*/"):
+            problems.append(f"line {token.line}: unterminated block comment")
+        elif token.kind == "string" and (len(token.text) < 2 or not token.text.endswith('"')):
+            problems.append(f"line {token.line}: unterminated string literal")
+        elif token.kind == "op" and token.text in OPENING:
+            stack.append(token)
+        elif token.kind == "op" and token.text in CLOSING:
+            if not stack:
+                problems.append(f"line {token.line}: unmatched '{token.text}'")
+            elif stack[-1].text != CLOSING[token.text]:
+                opener = stack.pop()
+                problems.append(f"line {token.line}: '{token.text}' does not match '{opener.text}' "
+                                f"opened on line {opener.line}")
+            else:
+                stack.pop()
+    for opener in stack:
+        problems.append(f"line {opener.line}: '{opener.text}' is never closed")
+    return problems
+
+def package_name(source: str) -> str:
+    """The declared package, or "" for the default package."""
+    tokens = code_tokens(source)
+    for i, token in enumerate(tokens):
+        if token.kind == "ident" and token.text == "package":
+            parts = []
+            for t in tokens[i + 1:]:
+                if t.text == ";":
+                    break
+                parts.append(t.text)
+            return "".join(parts)
+        if token.kind == "ident" and token.text in TYPE_KEYWORDS:
+            break
+    return ""
+
+def top_level_types(source: str) -> List[str]:
+    """Names of the types declared at brace depth 0 (public or not)."""
+    names = []
+    depth = 0
+    tokens = code_tokens(source)
+    for i, token in enumerate(tokens):
+        if token.kind == "op":
+            if token.text == "{":
+                depth += 1
+            elif token.text == "}":
+                depth -= 1
+        elif (depth == 0 and token.kind == "ident" and token.text in TYPE_KEYWORDS
+              and i + 1 < len(tokens) and tokens[i + 1].kind == "ident"
+              and not (i > 0 and tokens[i - 1].text == ".")):
+            names.append(tokens[i + 1].text)
+    return names
+
+def declared_types(source: str) -> List[str]:
+    """
+    Names of all named member types, top-level ones (public or not) and
+    nested ones, as dotted names relative to the package ("Outer",
+    "Outer.Inner"). Local and anonymous classes inside method bodies are
+    skipped since they cannot be referenced by name from other files.
+    """
+    names = []
+    # Each open brace records the name of the type whose body it opens, or None.
+    braces = []
+    pending = None
+    tokens = code_tokens(source)
+    for i, token in enumerate(tokens):
+        if token.kind == "op":
+            if token.text == "{":
+                braces.append(pending)
+                pending = None
+            elif token.text == "}" and braces:
+                braces.pop()
+            elif token.text == ";":
+                pending = None
+        elif (token.kind == "ident" and token.text in TYPE_KEYWORDS
+              and i + 1 < len(tokens) and tokens[i + 1].kind == "ident"
+              and not (i > 0 and tokens[i - 1].text == ".")):
+            if braces and braces[-1] is None:
+                continue
+            outer = braces[-1] if braces else ""
+            pending = f"{outer}.{tokens[i + 1].text}" if outer else tokens[i + 1].text
+            names.append(pending)
+    return names
+
+def member_body_ranges(source: str) -> List[tuple]:
+    """
+    (start, end) character ranges of the contents of member bodies (methods,
+    constructors, initializers), i.e. the text between their braces. Bodies of
+    nested types are not included; their members are reported instead.
+    """
+    ranges = []
+    # Each open brace records whether it opens a type body.
+    braces = []
+    pending_type = False
+    body_start, body_depth = None, 0
+    tokens = code_tokens(source)
+    for i, token in enumerate(tokens):
+        if body_start is not None:
+            if token.kind == "op" and token.text == "{":
+                body_depth += 1
+            elif token.kind == "op" and token.text == "}":
+                body_depth -= 1
+                if body_depth == 0:
+                    ranges.append((body_start, token.start))
+                    body_start = None
+            continue
+        if token.kind == "op" and token.text == "{":
+            if not pending_type and braces and braces[-1]:
+                # Array initializers in field declarations and annotations are not bodies; keep them.
+                if not (i > 0 and tokens[i - 1].text in ("=", "]", "(", ",")):
+                    body_start, body_depth = token.start + 1, 1
+                    continue
+            braces.append(pending_type)
+            pending_type = False
+        elif token.kind == "op" and token.text == "}" and braces:
+            braces.pop()
+        elif token.kind == "op" and token.text == ";":
+            pending_type = False
+        elif (token.kind == "ident" and token.text in TYPE_KEYWORDS
+              and i + 1 < len(tokens) and tokens[i + 1].kind == "ident"
+              and not (i > 0 and tokens[i - 1].text == ".")):
+            pending_type = True
+    return ranges
+
+def skeleton(source: str, placeholder: str = " ... ") -> str:
+    """
+    The source with comments removed and every member body replaced by
+    placeholder: package, imports, type, field and method declarations only.
+    """
+    cuts = [(t.start, t.start + len(t.text), "") for t in tokenize(source) if t.kind == "comment"]
+    cuts += [(start, end, placeholder) for start, end in member_body_ranges(source)]
+    pieces, pos = [], 0
+    for start, end, replacement in sorted(cuts):
+        if start < pos:
+            continue  # comment inside an elided body
+        pieces.append(source[pos:start])
+        pieces.append(replacement)
+        pos = end
+    pieces.append(source[pos:])
+    lines = [line.rstrip() for line in "".join(pieces).splitlines()]
+    return "\n".join(line for line in lines if line.strip()) + "\n"
+
+
+class Member(NamedTuple):
+    kind: str           # field, method, constructor, initializer, type or enum_constants
+    name: str
+    start: int          # character offset where the member (with its comments and annotations) starts
+    end: int            # character offset just past the member
+    body_start: int     # offset just past the "{" of the body, or -1 if there is none
+    body_end: int       # offset of the "}" closing the body, or -1
+    params: str         # parameter list of methods/constructors, whitespace-normalized
+    annotations: tuple  # annotation names, e.g. ("Test", "Override")
+
+    @property
+    def arity(self) -> int:
+        if not self.params:
+            return 0
+        depth, count = 0, 1
+        for ch in self.params:
+            if ch in "<([":
+                depth += 1
+            elif ch in ">)]":
+                depth -= 1
+            elif ch == "," and depth == 0:
+                count += 1
+        return count
+
+def _match(tokens: List[Token], index: int) -> int:
+    """Index of the token closing the bracket opened at tokens[index]."""
+    opener = tokens[index].text
+    closer = OPENING[opener]
+    depth = 0
+    for i in range(index, len(tokens)):
+        if tokens[i].text == opener:
+            depth += 1
+        elif tokens[i].text == closer:
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens) - 1
+
+def _skip_annotation(tokens: List[Token], index: int):
+    """Skip the annotation starting at tokens[index] ("@"); returns (next index, annotation name)."""
+    i = index + 1
+    name = tokens[i].text if i < len(tokens) else ""
+    i += 1
+    while i + 1 < len(tokens) and tokens[i].text == "." and tokens[i + 1].kind == "ident":
+        name = tokens[i + 1].text
+        i += 2
+    if i < len(tokens) and tokens[i].text == "(":
+        i = _match(tokens, i) + 1
+    return i, name
+
+def type_body(source: str, type_name: str = ""):
+    """(tokens, open index, close index, keyword, name) of the body of the named (or first) top-level type, or None."""
+    tokens = code_tokens(source)
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token.text == "{":
+            depth += 1
+        elif token.text == "}":
+            depth -= 1
+        elif (depth == 0 and token.kind == "ident" and token.text in TYPE_KEYWORDS
+              and i + 1 < len(tokens) and tokens[i + 1].kind == "ident"
+              and not (i > 0 and tokens[i - 1].text == ".")
+              and (not type_name or tokens[i + 1].text == type_name)):
+            for j in range(i + 2, len(tokens)):
+                if tokens[j].text == "(":
+                    j = _match(tokens, j)  # record header
+                elif tokens[j].text == "{":
+                    return tokens, j, _match(tokens, j), token.text, tokens[i + 1].text
+    return None
+
+def _field_name(tokens: List[Token], start: int, end: int) -> str:
+    """
+    The first declarator name of the field declaration tokens[start:end + 1]:
+    the identifier before the first =, ; or , that is outside type arguments
+    (Map<K, V>) and annotation arguments.
+    """
+    depth = 0
+    k = start
+    while k <= end:
+        text = tokens[k].text
+        if text in OPENING:
+            k = _match(tokens, k) + 1
+            continue
+        if text == "<":
+            depth += 1
+        elif text == ">":
+            depth = max(depth - 1, 0)
+        elif text in ("=", ";", ",") and depth == 0 and k > start and tokens[k - 1].kind == "ident":
+            return tokens[k - 1].text
+        k += 1
+    return ""
+
+def members(source: str, type_name: str = "") -> List[Member]:
+    """
+    The members of the named (or first) top-level type, in source order.
+    Nested types are reported as single "type" members.
+    """
+    found = type_body(source, type_name)
+    if found is None:
+        return []
+    tokens, open_index, close_index, keyword, class_name = found
+    result = []
+    prev_end = tokens[open_index].start + 1
+    i = open_index + 1
+
+    if keyword == "enum":
+        j, depth = i, 0
+        while j < close_index and not (depth == 0 and tokens[j].text == ";"):
+            if tokens[j].text in OPENING:
+                depth += 1
+            elif tokens[j].text in CLOSING:
+                depth -= 1
+            j += 1
+        end_token = tokens[j] if j < close_index else tokens[j - 1]
+        end = end_token.start + len(end_token.text)
+        if j > i:
+            result.append(Member("enum_constants", "", prev_end, end, -1, -1, "", ()))
+            prev_end = end
+        i = j + 1 if j < close_index else j
+
+    while i < close_index:
+        if tokens[i].text == ";":
+            i += 1
+            continue
+        annotations, kind, name, params = [], None, "", ""
+        first_paren = None
+        saw_assign = False
+        body = None
+        j = i
+        while j < close_index:
+            token = tokens[j]
+            if token.text == "@" and j + 1 < close_index and tokens[j + 1].text != "interface":
+                j, annotation = _skip_annotation(tokens, j)
+                annotations.append(annotation)
+                continue
+            if token.text == "(" and not saw_assign:
+                if first_paren is None and kind is None:
+                    first_paren = j
+                    name = tokens[j - 1].text
+                    params = " ".join(t.text for t in tokens[j + 1:_match(tokens, j)])
+                j = _match(tokens, j) + 1
+                continue
+            if token.text in ("(", "[") or (token.text == "{" and saw_assign):
+                j = _match(tokens, j) + 1
+                continue
+            if token.text == "=" and first_paren is None:
+                saw_assign = True
+            elif (kind is None and token.kind == "ident" and token.text in TYPE_KEYWORDS
+                  and first_paren is None and not saw_assign and j + 1 < close_index
+                  and tokens[j + 1].kind == "ident" and not (j > 0 and tokens[j - 1].text == ".")):
+                kind, name = "type", tokens[j + 1].text
+            elif token.text == ";":
+                break
+            elif token.text == "{":
+                body = (j, _match(tokens, j))
+                j = body[1]
+                break
+            j += 1
+
+        if kind is None:
+            if first_paren is not None:
+                kind = "constructor" if name == class_name else "method"
+            elif body is not None:
+                kind = "initializer"
+            else:
+                kind = "field"
+                name = _field_name(tokens, i, j)
+        end_token = tokens[min(j, close_index - 1)] if j < close_index else tokens[close_index - 1]
+        end = end_token.start + len(end_token.text)
+        body_start = tokens[body[0]].start + 1 if body else -1
+        body_end = tokens[body[1]].start if body else -1
+        result.append(Member(kind, name, prev_end, end, body_start, body_end, params, tuple(annotations)))
+        prev_end = end
+        i = j + 1
+    return result
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Warm JVM test runner for validating candidate fixes.
+
+Running `gradle test --tests X_TEST` per candidate pays Gradle configuration
+and JVM startup every time, which dwarfs the test time of a QuixBugs program.
+This module keeps a pool of long-lived JVM worker processes instead. Each
+worker compiles a single candidate class in-process (javax.tools) against the
+already built project classes and runs the JUnit test class in a fresh class
+loader, so every candidate sees clean static state while the JVM, the JIT and
+the compiler stay warm.
+
+Results are structured: whether the candidate compiled (with diagnostics),
+and a pass/fail/ignored outcome per test method.
+
+The worker speaks a line protocol over stdin/stdout; fields are separated by
+tabs and escaped with backslashes:
+
+    COMPILE <source file> <output dir> <classpath>
+    RUN     <class dirs>  <test class> [<comma separated methods>]
+    QUIT
+
+Each command answers with zero or more DIAG/TEST lines followed by an END line.
+"""
+import hashlib
+import json
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+DEFAULT_TIMEOUT = 60.0        # seconds allowed for one compile or test run
+WORKER_START_TIMEOUT = 60.0
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "prompt_engineering_jvm"
+WORKER_CLASS = "JUnitWorker"
+
+WORKER_SOURCE = r"""
+import java.io.*;
+import java.net.*;
+import java.util.*;
+import javax.tools.*;
+import org.junit.runner.*;
+import org.junit.runner.manipulation.Filter;
+import org.junit.runner.notification.*;
+
+public class JUnitWorker {
+    private static PrintStream out;
+
+    static String esc(String s) {
+        if (s == null) return "";
+        return s.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "");
+    }
+
+    static String unesc(String s) {
+        StringBuilder b = new StringBuilder();
+        for (int i = 0; i < s.length(); i++) {
+            char c = s.charAt(i);
+            if (c == '\\' && i + 1 < s.length()) {
+                char n = s.charAt(++i);
+                b.append(n == 't' ? '\t' : n == 'n' ? '\n' : n);
+            } else {
+                b.append(c);
+            }
+        }
+        return b.toString();
+    }
+
+    public static void main(String[] args) throws Exception {
+        out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        // Anything the code under test prints must not corrupt the protocol stream.
+        System.setOut(System.err);
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        StandardJavaFileManager files = compiler == null ? null : compiler.getStandardFileManager(null, null, null);
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        out.println("READY");
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] f = line.split("\t", -1);
+            for (int i = 0; i < f.length; i++) f[i] = unesc(f[i]);
+            try {
+                if (f[0].equals("COMPILE")) compile(compiler, files, f[1], f[2], f[3]);
+                else if (f[0].equals("RUN")) run(f[1], f[2], f.length > 3 ? f[3] : "");
+                else if (f[0].equals("QUIT")) break;
+                else out.println("END\tERROR\t" + esc("unknown command " + f[0]));
+            } catch (Throwable t) {
+                StringWriter sw = new StringWriter();
+                t.printStackTrace(new PrintWriter(sw));
+                out.println("END\tERROR\t" + esc(sw.toString()));
+            }
+        }
+    }
+
+    static void compile(JavaCompiler compiler, StandardJavaFileManager files, String source, String outDir, String cp) {
+        if (compiler == null) {
+            out.println("END\tERROR\tno system Java compiler (is this a JRE?)");
+            return;
+        }
+        DiagnosticCollector<JavaFileObject> diags = new DiagnosticCollector<JavaFileObject>();
+        List<String> options = Arrays.asList("-d", outDir, "-cp", cp, "-encoding", "UTF-8", "-nowarn", "-g");
+        boolean ok = compiler.getTask(null, files, diags, options, null,
+                files.getJavaFileObjects(new File(source))).call();
+        for (Diagnostic<? extends JavaFileObject> d : diags.getDiagnostics()) {
+            out.println("DIAG\t" + d.getKind() + "\t" + d.getLineNumber() + "\t" + esc(d.getMessage(Locale.ROOT)));
+        }
+        out.println("END\t" + (ok ? "OK" : "COMPILE_ERROR"));
+    }
+
+    static void run(String classDirs, String testClass, String methods) throws Exception {
+        List<URL> urls = new ArrayList<URL>();
+        for (String dir : classDirs.split(File.pathSeparator)) {
+            if (!dir.isEmpty()) urls.add(new File(dir).toURI().toURL());
+        }
+        URLClassLoader loader = new URLClassLoader(urls.toArray(new URL[0]), ClassLoader.getSystemClassLoader());
+        try {
+            Class<?> cls = Class.forName(testClass, true, loader);
+            Request request = Request.aClass(cls);
+            if (!methods.isEmpty()) {
+                final Set<String> wanted = new HashSet<String>(Arrays.asList(methods.split(",")));
+                request = request.filterWith(new Filter() {
+                    public boolean shouldRun(Description d) {
+                        return d.getMethodName() == null || wanted.contains(d.getMethodName());
+                    }
+                    public String describe() { return "methods " + wanted; }
+                });
+            }
+            final Map<String, String> failures = new LinkedHashMap<String, String>();
+            final List<String> order = new ArrayList<String>();
+            final Set<String> ignored = new HashSet<String>();
+            JUnitCore core = new JUnitCore();
+            core.addListener(new RunListener() {
+                public void testStarted(Description d) { order.add(d.getMethodName()); }
+                public void testIgnored(Description d) { order.add(d.getMethodName()); ignored.add(d.getMethodName()); }
+                public void testFailure(Failure f) {
+                    String name = f.getDescription().getMethodName();
+                    if (name == null) name = "<class>";
+                    if (!order.contains(name)) order.add(name);
+                    failures.put(name, f.getTrace());
+                }
+            });
+            Result result = core.run(request);
+            for (String name : order) {
+                String status = ignored.contains(name) ? "IGNORED" : failures.containsKey(name) ? "FAIL" : "PASS";
+                out.println("TEST\t" + esc(name) + "\t" + status + "\t" + esc(failures.get(name)));
+            }
+            out.println("END\t" + (result.wasSuccessful() ? "PASS" : "FAIL") + "\t" + result.getRunCount()
+                    + "\t" + result.getFailureCount() + "\t" + result.getIgnoreCount());
+        } finally {
+            loader.close();
+        }
+    }
+}
+"""
+
+
+@dataclass
+class TestOutcome:
+    name: str
+    status: str          # "PASS", "FAIL" or "IGNORED"
+    message: str = ""
+
+
+@dataclass
+class ValidationResult:
+    """Structured outcome of validating one candidate."""
+    passed: bool
+    compiled: Optional[bool] = None
+    diagnostics: List[str] = field(default_factory=list)
+    tests: List[TestOutcome] = field(default_factory=list)
+    timed_out: bool = False
+    duration: float = 0.0
+    error: Optional[str] = None
+    stage: Optional[str] = None   # staged validators: the stage that decided the outcome
+
+    @property
+    def failed_tests(self) -> List[str]:
+        return [t.name for t in self.tests if t.status == "FAIL"]
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def escape_field(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "")
+
+def unescape_field(value: str) -> str:
+    out, i = [], 0
+    while i < len(value):
+        c = value[i]
+        if c == "\\" and i + 1 < len(value):
+            n = value[i + 1]
+            out.append("\t" if n == "t" else "\n" if n == "n" else n)
+            i += 2
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out)
+
+def build_worker(classpath: Sequence[str], javac: str = "javac", cache_dir: Path = DEFAULT_CACHE_DIR) -> Path:
+    """Compile the worker class once per (source, JUnit classpath) and return its class directory."""
+    digest = hashlib.sha256((WORKER_SOURCE + os.pathsep.join(classpath)).encode("utf-8")).hexdigest()[:16]
+    worker_dir = Path(cache_dir) / f"worker-{digest}"
+    if (worker_dir / f"{WORKER_CLASS}.class").exists():
+        return worker_dir
+    worker_dir.mkdir(parents=True, exist_ok=True)
+    source = worker_dir / f"{WORKER_CLASS}.java"
+    source.write_text(WORKER_SOURCE)
+    cmd = [javac, "-nowarn", "-cp", os.pathsep.join(classpath), "-d", str(worker_dir), str(source)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to compile {WORKER_CLASS}:\n{result.stderr}")
+    print(f"DEBUG: Compiled JVM worker into {worker_dir}")
+    return worker_dir
+
+GRADLE_CLASSPATH_INIT = """
+allprojects {
+    afterEvaluate { project ->
+        if (project.hasProperty('sourceSets')) {
+            project.tasks.register('printTestRuntimeClasspath') {
+                dependsOn 'testClasses'
+                doLast { println 'CLASSPATH=' + project.sourceSets.test.runtimeClasspath.asPath }
+            }
+        }
+    }
+}
+"""
+
+def resolve_gradle_classpath(project_root, gradle: str = "gradle", cache_dir: Path = DEFAULT_CACHE_DIR) -> dict:
+    """
+    Build the project once with Gradle and return its test runtime classpath.
+
+    Returns {"classes": [...project class dirs...], "jars": [...dependency jars...]}.
+    The result is cached per project directory.
+    """
+    project_root = Path(project_root).resolve()
+    cache_file = Path(cache_dir) / f"classpath-{hashlib.sha256(str(project_root).encode()).hexdigest()[:16]}.json"
+    if cache_file.exists():
+        cached = json.loads(cache_file.read_text())
+        if all(Path(p).exists() for p in cached["classes"] + cached["jars"]):
+            return cached
+
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    init_script = cache_file.with_suffix(".gradle")
+    init_script.write_text(GRADLE_CLASSPATH_INIT)
+    cmd = [gradle, "-q", "-I", str(init_script), "printTestRuntimeClasspath"]
+    print(f"Resolving test classpath with: {' '.join(cmd)}")
+    result = subprocess.run(cmd, capture_output=True, text=True, cwd=project_root)
+    line = next((l for l in result.stdout.splitlines() if l.startswith("CLASSPATH=")), None)
+    if result.returncode != 0 or line is None:
+        raise RuntimeError(f"Could not resolve Gradle classpath in {project_root}:\n{result.stderr}")
+
+    entries = [e for e in line[len("CLASSPATH="):].split(os.pathsep) if e]
+    classpath = {
+        "classes": [e for e in entries if not e.endswith(".jar")],
+        "jars": [e for e in entries if e.endswith(".jar")],
+    }
+    cache_file.write_text(json.dumps(classpath, indent=2))
+    return classpath
+
+
+class JVMWorker:
+    """One long-lived JVM running the JUnitWorker loop."""
+
+    def __init__(self, java: str, classpath: Sequence[str], log_file: Path, jvm_args: Sequence[str] = ()):
+        self.log = open(log_file, "ab")
+        self.process = subprocess.Popen(
+            [java, *jvm_args, "-cp", os.pathsep.join(classpath), WORKER_CLASS],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.log,
+            text=True, encoding="utf-8", bufsize=1,
+        )
+        self.lines = queue.Queue()
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+        ready = self._next_line(WORKER_START_TIMEOUT)
+        if ready != "READY":
+            self.kill()
+            raise RuntimeError(f"JVM worker failed to start (got {ready!r}); see {log_file}")
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.lines.put(line.rstrip("\n"))
+        self.lines.put(None)
+
+    def _next_line(self, timeout: float) -> Optional[str]:
+        return self.lines.get(timeout=timeout)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def request(self, *fields: str, timeout: float = DEFAULT_TIMEOUT) -> List[List[str]]:
+        """Send one command and return the parsed response lines, the END line last."""
+        self.process.stdin.write("\t".join(escape_field(f) for f in fields) + "\n")
+        self.process.stdin.flush()
+        deadline = time.monotonic() + timeout
+        response = []
+        while True:
+            line = self._next_line(max(0.0, deadline - time.monotonic()))
+            if line is None:
+                raise RuntimeError("JVM worker exited unexpectedly")
+            parts = [unescape_field(p) for p in line.split("\t")]
+            response.append(parts)
+            if parts[0] == "END":
+                return response
+
+    def kill(self):
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+        self.log.close()
+
+    def close(self):
+        if self.alive:
+            try:
+                self.process.stdin.write("QUIT\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
+
+
+class JVMWorkerPool:
+    """
+    Pool of warm JVM workers that compile and test candidates.
+
+    `jars` is the dependency classpath (JUnit, Hamcrest, ...) that is loaded
+    once by each worker; `class_dirs` are the compiled project classes (main
+    and test) that are loaded afresh for every run, behind the candidate's own
+    class directory so the candidate shadows the original class.
+
+    A worker that exceeds the timeout (e.g. a candidate with an infinite loop)
+    is killed and replaced.
+    """
+
+    def __init__(self, jars: Sequence[str], class_dirs: Sequence[str], size: Optional[int] = None,
+                 java: str = "java", javac: str = "javac", cache_dir: Path = DEFAULT_CACHE_DIR):
+        self.jars = list(jars)
+        self.class_dirs = [str(Path(d).resolve()) for d in class_dirs]
+        self.size = size or os.cpu_count() or 1
+        self.java = java
+        self.scratch = Path(tempfile.mkdtemp(prefix="jvm-candidates-"))
+        self.worker_classpath = [str(build_worker(self.jars, javac, cache_dir))] + self.jars
+        self._idle = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self._all = []
+
+    @classmethod
+    def for_gradle_project(cls, project_root, size: Optional[int] = None, **kwargs) -> "JVMWorkerPool":
+        classpath = resolve_gradle_classpath(project_root)
+        return cls(classpath["jars"], classpath["classes"], size=size, **kwargs)
+
+    def _start_worker(self) -> JVMWorker:
+        index = len(self._all)
+        worker = JVMWorker(self.java, self.worker_classpath, self.scratch / f"worker-{index}.log")
+        self._all.append(worker)
+        return worker
+
+    def _acquire(self) -> JVMWorker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._started < self.size:
+                self._started += 1
+                return self._start_worker()
+        return self._idle.get()
+
+    def _release(self, worker: JVMWorker):
+        if worker.alive:
+            self._idle.put(worker)
+        else:
+            with self._lock:
+                self._started -= 1
+
+    def compile(self, worker: JVMWorker, class_name: str, source_code: str, out_dir: Path,
+                timeout: float = DEFAULT_TIMEOUT):
+        """Compile one class into out_dir; returns (ok, diagnostics)."""
+        source_dir = out_dir / "src"
+        source_dir.mkdir(parents=True, exist_ok=True)
+        source_file = source_dir / f"{class_name.rsplit('.', 1)[-1]}.java"
+        source_file.write_text(source_code)
+        classes_dir = out_dir / "classes"
+        classes_dir.mkdir(exist_ok=True)
+        response = worker.request("COMPILE", str(source_file), str(classes_dir),
+                                  os.pathsep.join(self.class_dirs + self.jars), timeout=timeout)
+        status = response[-1][1]
+        if status == "ERROR":
+            raise RuntimeError(response[-1][2] if len(response[-1]) > 2 else "compile request failed")
+        diagnostics = [f"{kind} line {line_no}: {message}" for _, kind, line_no, message in
+                       (r for r in response if r[0] == "DIAG")]
+        return status == "OK", diagnostics
+
+    def check_compiles(self, class_name: str, source_code: str, timeout: float = DEFAULT_TIMEOUT):
+        """Compile-only check of a candidate in a warm worker; returns (ok, diagnostics)."""
+        out_dir = Path(tempfile.mkdtemp(dir=self.scratch, prefix="precheck-"))
+        worker = self._acquire()
+        try:
+            return self.compile(worker, class_name, source_code, out_dir, timeout)
+        except queue.Empty:
+            worker.kill()
+            return False, [f"compilation timed out after {timeout}s"]
+        finally:
+            self._release(worker)
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    def run_tests(self, worker: JVMWorker, test_class: str, candidate_dir: Optional[Path] = None,
+                  methods: Sequence[str] = (), timeout: float = DEFAULT_TIMEOUT):
+        """Run a JUnit class (optionally only some methods); returns (passed, [TestOutcome])."""
+        dirs = ([str(candidate_dir)] if candidate_dir else []) + self.class_dirs
+        response = worker.request("RUN", os.pathsep.join(dirs), test_class, ",".join(methods), timeout=timeout)
+        end = response[-1]
+        if end[1] == "ERROR":
+            raise RuntimeError(end[2] if len(end) > 2 else "test run failed")
+        tests = [TestOutcome(name=r[1], status=r[2], message=r[3] if len(r) > 3 else "")
+                 for r in response if r[0] == "TEST"]
+        return end[1] == "PASS", tests
+
+    def validate(self, class_name: str, source_code: str, test_class: str, methods: Sequence[str] = (),
+                 timeout: float = DEFAULT_TIMEOUT) -> ValidationResult:
+        """Compile a candidate for `class_name` and run `test_class` against it in a warm worker."""
+        start = time.perf_counter()
+        out_dir = Path(tempfile.mkdtemp(dir=self.scratch, prefix="candidate-"))
+        worker = self._acquire()
+        result = ValidationResult(passed=False)
+        try:
+            result.compiled, result.diagnostics = self.compile(worker, class_name, source_code, out_dir, timeout)
+            if result.compiled:
+                result.passed, result.tests = self.run_tests(worker, test_class, out_dir / "classes",
+                                                             methods, timeout)
+        except queue.Empty:
+            result.timed_out = True
+            result.error = f"timed out after {timeout}s"
+            worker.kill()
+        except RuntimeError as e:
+            result.error = str(e)
+            if not worker.alive:
+                worker.kill()
+        finally:
+            self._release(worker)
+            shutil.rmtree(out_dir, ignore_errors=True)
+        result.duration = time.perf_counter() - start
+        return result
+
+    def close(self):
+        for worker in self._all:
+            worker.close()
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Concurrent LLM dispatch for the prompt-engineering experiments.
+
+Instead of calling the model one prompt and one problem at a time, all
+(problem, strategy) prompts are submitted to an asyncio engine that keeps up to
+`concurrency` requests in flight, respects request-per-minute and
+token-per-minute limits, retries transient failures with exponential backoff
+and returns the results in the same order as the prompts were given.
+
+When a ResponseCache is passed, identical (model parameters, prompt) requests
+are answered from disk without touching the network or the rate limits.
+
+With stream=True responses are read chunk by chunk (`astream`). A
+stream_handler (e.g. fixed_code_stream.FixedCodeStream) sees every chunk and
+can end the request early, and on_result is called as soon as each request
+finishes, so callers can start validating a candidate while the other
+requests are still generating.
+
+The engine only relies on the LangChain chat model interface (`ainvoke`), so it
+works with `ChatOpenAI` pointed at the real API or at the local stub server in
+stub_chat_server.py.
+
+NOTE: ChatOpenAI has its own internal retry loop; construct it with
+`max_retries=0` so that retries and backoff are handled (and counted) here.
+"""
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from response_cache import ResponseCache, cache_key, model_params
+import tracing
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 1.0   # seconds before the first retry
+DEFAULT_BACKOFF_MAX = 60.0   # upper bound for a single backoff sleep
+# Rough characters-per-token ratio used when no tokenizer is supplied.
+CHARS_PER_TOKEN = 4
+# HTTP status codes that are worth retrying.
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+
+@dataclass
+class DispatchResult:
+    """Outcome of a single dispatched prompt."""
+    key: Any
+    text: str = ""
+    response: Any = None
+    usage: dict = field(default_factory=dict)
+    latency: float = 0.0
+    attempts: int = 0
+    error: Optional[str] = None
+    cached: bool = False
+    first_token_latency: Optional[float] = None
+    stopped_early: bool = False
+    sample: int = 0
+    skipped: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def estimate_tokens(prompt: Any) -> int:
+    """Cheap token estimate for a prompt string or a list of chat messages."""
+    if isinstance(prompt, str):
+        text = prompt
+    else:
+        text = "".join(str(getattr(m, "content", m)) for m in prompt)
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+def response_text(response: Any) -> str:
+    """Extract plain text from a LangChain response (AIMessage) or a raw string."""
+    return response.content.strip() if hasattr(response, "content") else str(response).strip()
+
+def response_usage(response: Any) -> dict:
+    """Return the token usage reported with a response, or an empty dict."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return dict(usage)
+    metadata = getattr(response, "response_metadata", None) or {}
+    token_usage = metadata.get("token_usage") or {}
+    if token_usage:
+        usage = {
+            "input_tokens": token_usage.get("prompt_tokens", 0),
+            "output_tokens": token_usage.get("completion_tokens", 0),
+            "total_tokens": token_usage.get("total_tokens", 0),
+        }
+        cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached:
+            usage["input_token_details"] = {"cache_read": cached}
+        return usage
+    return {}
+
+def cached_input_tokens(usage: dict) -> int:
+    """Prompt tokens the provider served from its prompt cache (0 if not reported)."""
+    return int((usage.get("input_token_details") or {}).get("cache_read") or 0)
+
+def chunk_text(chunk: Any) -> str:
+    """Text of one streamed chunk (AIMessageChunk or raw string)."""
+    content = chunk.content if hasattr(chunk, "content") else chunk
+    return content if isinstance(content, str) else str(content)
+
+def add_usage(total: dict, usage: dict) -> dict:
+    """Sum the token counts reported by streamed chunks (usually only the last one has any)."""
+    for name, value in usage.items():
+        if isinstance(value, (int, float)):
+            total[name] = total.get(name, 0) + value
+    return total
+
+def is_retryable(exc: BaseException) -> bool:
+    """Decide whether an exception raised by the model client is transient."""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(exc).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status in RETRYABLE_STATUS_CODES
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Read a Retry-After header from an HTTP error, if the server sent one."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def backoff_delay(attempt: int, base: float = DEFAULT_BACKOFF_BASE, cap: float = DEFAULT_BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter for the given (1-based) retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter on requests per minute and tokens per minute.
+
+    Either limit may be None to disable it. Both buckets start full and refill
+    continuously, so short bursts up to the per-minute allowance are allowed.
+    The buckets are guarded by a thread lock rather than an asyncio one, so one
+    limiter can be shared by dispatches running on different event loops (e.g.
+    follow-up requests sent from worker threads while a sweep is in flight).
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute or 0)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._request_allowance = min(float(self.requests_per_minute),
+                                          self._request_allowance + elapsed * self.requests_per_minute / 60.0)
+        if self.tokens_per_minute:
+            self._token_allowance = min(float(self.tokens_per_minute),
+                                        self._token_allowance + elapsed * self.tokens_per_minute / 60.0)
+
+    async def acquire(self, tokens: int = 0):
+        """Wait until one request and `tokens` tokens may be spent."""
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        if self.tokens_per_minute:
+            # A single request larger than the whole bucket would otherwise wait forever.
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._request_allowance < 1:
+                    wait = max(wait, (1 - self._request_allowance) * 60.0 / self.requests_per_minute)
+                if self.tokens_per_minute and self._token_allowance < tokens:
+                    wait = max(wait, (tokens - self._token_allowance) * 60.0 / self.tokens_per_minute)
+                if wait <= 0:
+                    if self.requests_per_minute:
+                        self._request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self._token_allowance -= tokens
+                    return
+            await asyncio.sleep(wait)
+
+    def adjust(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the real usage of a request is known."""
+        if self.tokens_per_minute and actual_tokens:
+            with self._lock:
+                self._token_allowance -= (actual_tokens - estimated_tokens)
+
+
+# ----------------------------
+# Dispatch Engine
+# ----------------------------
+
+def sample_salt(sample: int) -> str:
+    """Cache salt of the sample-th sample of a prompt; sample 0 shares the key of a single request."""
+    return f"sample-{sample}" if sample else ""
+
+def supports_n(llm) -> bool:
+    """Whether the model can return several samples from one request (OpenAI's `n`)."""
+    return hasattr(llm, "agenerate") and hasattr(llm, "n")
+
+def as_messages(prompt: Any) -> list:
+    if isinstance(prompt, str):
+        from langchain_core.messages import HumanMessage
+        return [HumanMessage(content=prompt)]
+    return list(prompt)
+
+async def _stream_response(llm, prompt, result: DispatchResult, handler, start: float):
+    """
+    Read a streamed response into result. If handler.feed(chunk) returns True
+    the stream is closed right away, which ends generation on the server side.
+    """
+    pieces, usage = [], {}
+    stream = llm.astream(prompt)
+    try:
+        async for chunk in stream:
+            text = chunk_text(chunk)
+            add_usage(usage, response_usage(chunk))
+            if text and result.first_token_latency is None:
+                result.first_token_latency = time.perf_counter() - start
+            pieces.append(text)
+            if handler is not None and handler.feed(text):
+                result.stopped_early = True
+                break
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    result.text = (handler.truncated_text() if result.stopped_early else "".join(pieces)).strip()
+    result.usage = usage
+
+async def _generate_n(llm, prompt, n: int):
+    """One request for n samples; returns (texts, usage of the whole request)."""
+    output = await llm.agenerate([as_messages(prompt)], n=n)
+    texts = [response_text(getattr(g, "message", None) or g.text) for g in output.generations[0]]
+    token_usage = (output.llm_output or {}).get("token_usage") or {}
+    usage = {"input_tokens": token_usage.get("prompt_tokens", 0),
+             "output_tokens": token_usage.get("completion_tokens", 0),
+             "total_tokens": token_usage.get("total_tokens", 0)} if token_usage else {}
+    return texts, usage
+
+async def _call_with_retries(key, make_call, result: DispatchResult, limiter: RateLimiter, estimated: int,
+                             max_retries: int, timeout: Optional[float]):
+    """Await make_call() with rate limiting, timeout and backoff; on failure result.error is set and None returned."""
+    while True:
+        result.attempts += 1
+        await limiter.acquire(estimated)
+        try:
+            call = make_call()
+            return await (asyncio.wait_for(call, timeout) if timeout else call)
+        except Exception as e:  # noqa: BLE001 - client errors are classified below
+            if result.attempts > max_retries or not is_retryable(e):
+                result.error = f"{type(e).__name__}: {e}"
+                print(f"DEBUG: Request {key!r} failed after {result.attempts} attempt(s): {result.error}")
+                return None
+            delay = retry_after_seconds(e)
+            if delay is None:  # Retry-After: 0 means retry now, not "fall back to backoff"
+                delay = backoff_delay(result.attempts)
+            print(f"DEBUG: Request {key!r} attempt {result.attempts} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+def _cached_result(cache: Optional[ResponseCache], key, prompt, params: dict, sample: int):
+    """(cache digest, DispatchResult of a cache hit or None)."""
+    if cache is None:
+        return None, None
+    digest = cache_key(prompt, params, sample_salt(sample))
+    hit = cache.get(digest)
+    if hit is None:
+        return digest, None
+    return digest, DispatchResult(key=key, text=hit["text"], usage=hit["usage"], cached=True, sample=sample)
+
+def _skipped(key, sample: int) -> DispatchResult:
+    return DispatchResult(key=key, error="skipped", skipped=True, sample=sample)
+
+async def _dispatch_one(llm, key, prompt, semaphore: asyncio.Semaphore, limiter: RateLimiter,
+                        max_retries: int, timeout: Optional[float],
+                        token_counter: Callable[[Any], int],
+                        cache: Optional[ResponseCache], params: dict,
+                        stream: bool = False, stream_handler: Optional[Callable[[Any], Any]] = None,
+                        on_result: Optional[Callable[[DispatchResult], None]] = None,
+                        sample: int = 0, skip: Optional[Callable[[Any, int], bool]] = None) -> DispatchResult:
+    digest, result = _cached_result(cache, key, prompt, params, sample)
+    if result is not None:
+        with tracing.span("llm_call", "llm", concurrent=True, key=str(key), sample=sample, cached=True,
+                          tokens=result.usage.get("total_tokens", 0)):
+            pass
+    else:
+        result = await _dispatch_request(llm, key, prompt, semaphore, limiter, max_retries, timeout,
+                                         token_counter, cache, params, stream, stream_handler, digest, sample, skip)
+    if on_result is not None:
+        on_result(result)
+    return result
+
+async def _dispatch_request(llm, key, prompt, semaphore, limiter, max_retries, timeout, token_counter,
+                            cache, params, stream, stream_handler, digest, sample, skip) -> DispatchResult:
+    estimated = token_counter(prompt)
+    async with semaphore:
+        # Checked once a slot is free: the key may have been settled while this request was queued.
+        if skip is not None and skip(key, sample):
+            return _skipped(key, sample)
+        result = DispatchResult(key=key, sample=sample)
+        start = time.perf_counter()
+
+        def make_call():
+            if stream:
+                result.first_token_latency, result.stopped_early = None, False
+                handler = stream_handler(key) if stream_handler is not None else None
+                return _stream_response(llm, prompt, result, handler, start)
+            return llm.ainvoke(prompt)
+
+        with tracing.span("llm_call", "llm", concurrent=True, key=str(key), sample=sample, cached=False) as span:
+            response = await _call_with_retries(key, make_call, result, limiter, estimated, max_retries, timeout)
+            if result.error is None:
+                if stream:
+                    if not result.usage.get("total_tokens"):
+                        # A stream cancelled before the final chunk carries no usage; estimate it.
+                        output_tokens = token_counter(result.text)
+                        result.usage = {"input_tokens": estimated, "output_tokens": output_tokens,
+                                        "total_tokens": estimated + output_tokens, "estimated": True}
+                else:
+                    result.response = response
+                    result.text = response_text(response)
+                    result.usage = response_usage(response)
+                limiter.adjust(estimated, result.usage.get("total_tokens", 0))
+                if cache is not None:
+                    cache.put(digest, result.text, result.usage, params)
+            else:
+                span.set(error=result.error)
+            span.set(tokens=result.usage.get("total_tokens", 0), bytes=len(result.text), attempts=result.attempts,
+                     stopped_early=result.stopped_early)
+        result.latency = time.perf_counter() - start
+    return result
+
+async def _dispatch_batch(llm, key, prompt, samples: int, semaphore, limiter, max_retries, timeout, token_counter,
+                          cache, params, on_result, skip) -> List[DispatchResult]:
+    """
+    All samples of one prompt from a single n>1 request. Samples found in the
+    cache are not requested again, and skip(key, sample) is asked for each of
+    the others (so a budget books every sample); n is the number it accepts.
+    The usage of the request is reported on its first new sample, so summing
+    over samples gives the real totals.
+    """
+    results, digests = [None] * samples, [None] * samples
+    for sample in range(samples):
+        digests[sample], results[sample] = _cached_result(cache, key, prompt, params, sample)
+    missing = [sample for sample in range(samples) if results[sample] is None]
+    if missing:
+        estimated = token_counter(prompt)
+        async with semaphore:
+            if skip is not None:
+                declined = [sample for sample in missing if skip(key, sample)]
+                for sample in declined:
+                    results[sample] = _skipped(key, sample)
+                missing = [sample for sample in missing if sample not in declined]
+            if missing:
+                request = DispatchResult(key=key)
+                start = time.perf_counter()
+                with tracing.span("llm_call", "llm", concurrent=True, key=str(key), samples=len(missing),
+                                  cached=False) as span:
+                    output = await _call_with_retries(key, lambda: _generate_n(llm, prompt, len(missing)), request,
+                                                      limiter, estimated, max_retries, timeout)
+                    texts, usage = output if output is not None else ([], {})
+                    span.set(tokens=usage.get("total_tokens", 0), bytes=sum(len(t) for t in texts),
+                             attempts=request.attempts)
+                    if request.error is not None:
+                        span.set(error=request.error)
+                latency = time.perf_counter() - start
+                limiter.adjust(estimated, usage.get("total_tokens", 0))
+                for i, sample in enumerate(missing):
+                    result = DispatchResult(key=key, sample=sample, attempts=request.attempts, latency=latency,
+                                            usage=usage if i == 0 else {})
+                    if i < len(texts):
+                        result.text = texts[i]
+                        if cache is not None:
+                            cache.put(digests[sample], result.text, result.usage, params)
+                    else:
+                        result.error = request.error or f"only {len(texts)} of {len(missing)} samples returned"
+                    results[sample] = result
+    if on_result is not None:
+        for result in results:
+            on_result(result)
+    return results
+
+async def dispatch_prompts(llm, prompts: Sequence[Tuple[Any, Any]],
+                           concurrency: int = DEFAULT_CONCURRENCY,
+                           requests_per_minute: Optional[float] = None,
+                           tokens_per_minute: Optional[float] = None,
+                           max_retries: int = DEFAULT_MAX_RETRIES,
+                           timeout: Optional[float] = None,
+                           token_counter: Callable[[Any], int] = estimate_tokens,
+                           cache: Optional[ResponseCache] = None,
+                           stream: bool = False,
+                           stream_handler: Optional[Callable[[Any], Any]] = None,
+                           on_result: Optional[Callable[[DispatchResult], None]] = None,
+                           samples: int = 1,
+                           skip: Optional[Callable[[Any, int], bool]] = None,
+                           limiter: Optional[RateLimiter] = None) -> List[DispatchResult]:
+    """
+    Send every (key, prompt) pair to the model concurrently.
+
+    A prompt may be a plain string or a list of chat messages. At most
+    `concurrency` requests are in flight at once; the optional rate limits are
+    shared by all requests. Pass a `limiter` (RateLimiter) instead to share
+    the limits with other dispatches. The returned list has one DispatchResult per input,
+    in input order. Failures are reported in DispatchResult.error rather than
+    raised, so one bad request does not abort the whole sweep.
+
+    If `cache` is given, responses are looked up there first and successful
+    responses are stored in it.
+
+    With `stream`, responses are streamed; `stream_handler(key)` may return an
+    object whose feed(chunk) returns True to stop that request early (and
+    truncated_text() gives the text to keep), or None. `on_result(result)` is
+    called in the event loop thread as soon as each request is finished.
+
+    With `samples` > 1 every prompt is sampled that many times and the list
+    holds `samples` results per input (DispatchResult.sample = 0..samples-1),
+    grouped by input. Models that support it get one n=samples request per
+    prompt; otherwise the samples are separate requests, queued sample by
+    sample across prompts, and a request whose `skip(key, sample)` returns True
+    by the time it would be sent is not sent at all (it comes back with skipped
+    set). An n>1 request asks skip() about every sample not found in the cache
+    and requests only the ones it accepts. Sample 0 is what pass@1 is measured
+    on, so a skip hook should only decline it when the request cannot be paid
+    for, not because another sample passed.
+    """
+    params = model_params(llm) if cache is not None else {}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    if limiter is None:
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    common = (semaphore, limiter, max_retries, timeout, token_counter, cache, params)
+    if samples > 1 and supports_n(llm) and not stream:
+        batches = await asyncio.gather(*[_dispatch_batch(llm, key, prompt, samples, *common, on_result, skip)
+                                         for key, prompt in prompts])
+        results = [result for batch in batches for result in batch]
+    else:
+        # Sample-major order: the first sample of every prompt is sent before any second one.
+        order = [(i, sample) for sample in range(max(1, samples)) for i in range(len(prompts))]
+        done = await asyncio.gather(*[
+            _dispatch_one(llm, prompts[i][0], prompts[i][1], *common, stream, stream_handler, on_result, sample, skip)
+            for i, sample in order])
+        by_position = dict(zip(order, done))
+        results = [by_position[(i, sample)] for i in range(len(prompts)) for sample in range(max(1, samples))]
+    if cache is not None:
+        stats = cache.stats()
+        print(f"DEBUG: Response cache: {stats['hits']} hit(s), {stats['misses']} miss(es)")
+    stopped = sum(1 for r in results if r.stopped_early)
+    if stopped:
+        print(f"DEBUG: {stopped} streamed response(s) stopped at the end of their code block")
+    skipped = sum(1 for r in results if r.skipped)
+    if skipped:
+        print(f"DEBUG: {skipped} request(s) not sent because skip() declined them (already solved or over budget)")
+    return results
+
+def run_coroutine(coro):
+    """
+    Run a coroutine to completion from synchronous code.
+
+    Jupyter/Colab already runs an event loop in the main thread, where
+    asyncio.run() is not allowed, so in that case the coroutine is run on a
+    private loop in a helper thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    outcome = {}
+
+    def runner():
+        try:
+            outcome["value"] = asyncio.run(coro)
+        except BaseException as e:  # re-raised in the calling thread
+            outcome["error"] = e
+
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+def run_dispatch(llm, prompts: Sequence[Tuple[Any, Any]], **kwargs) -> List[DispatchResult]:
+    """Synchronous wrapper around dispatch_prompts()."""
+    return run_coroutine(dispatch_prompts(llm, prompts, **kwargs))
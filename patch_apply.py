@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Tolerant application of model-written patches.
+
+In patch mode the model returns edits instead of the whole corrected class,
+either as SEARCH/REPLACE blocks
+
+    <<<<<<< SEARCH
+        return a - b;
+    =======
+        return a + b;
+    >>>>>>> REPLACE
+
+or as a unified diff (@@ -12,3 +12,3 @@ hunks, with or without line numbers).
+Models copy the code they were shown imperfectly, so every hunk is located in
+the original file in increasingly tolerant passes:
+
+1. exact      - the removed and context lines appear verbatim;
+2. whitespace - lines compared with indentation and inner runs of whitespace
+                normalized (the replacement is re-indented to match the file);
+3. fuzz N     - up to N leading/trailing context lines dropped, as GNU patch does.
+
+A hunk that matches at several places is ambiguous: with a unified diff the
+match closest to its line number wins if it is unique and within max_drift
+lines, otherwise the whole patch is rejected, as it is when a hunk matches
+nowhere or two hunks overlap. Hunks are located against the original text
+and applied together, so line drift between hunks does not matter.
+"""
+import argparse
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from java_source import COMPILATION_UNIT_STARTS, code_tokens
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+DEFAULT_MAX_DRIFT = 50
+DEFAULT_MAX_FUZZ = 2
+SEARCH_REPLACE_RE = re.compile(
+    r"^[ \t]*<{5,9}[ \t]*SEARCH[^\n]*\n(.*?)^[ \t]*={5,9}[ \t]*\n(.*?)^[ \t]*>{5,9}[ \t]*REPLACE[^\n]*$",
+    re.MULTILINE | re.DOTALL)
+HUNK_HEADER_RE = re.compile(r"^@@+[ \t]*(?:-(\d+)(?:,(\d+))?[ \t]+\+(\d+)(?:,(\d+))?)?[ \t]*@@+")
+FILE_HEADER_PREFIXES = ("--- ", "+++ ", "diff ", "index ", "Index: ")
+DIFF_LINE_PREFIXES = (" ", "+", "-", "\\")
+MARKDOWN_FENCE = "```"
+
+
+class PatchError(ValueError):
+    """The patch cannot be applied unambiguously."""
+
+
+@dataclass
+class Hunk:
+    old: List[str]                  # lines to find (context + removed)
+    new: List[str]                  # lines to put in their place (context + added)
+    old_start: Optional[int] = None  # 1-based line number claimed by a unified diff header
+
+    @property
+    def context(self) -> Tuple[int, int]:
+        """Lines shared at the start and at the end of old and new."""
+        before = 0
+        while before < min(len(self.old), len(self.new)) and self.old[before] == self.new[before]:
+            before += 1
+        after = 0
+        while (after < min(len(self.old), len(self.new)) - before
+               and self.old[-1 - after] == self.new[-1 - after]):
+            after += 1
+        return before, after
+
+
+@dataclass
+class HunkMatch:
+    index: int          # position of the hunk in the patch
+    line: int           # 1-based first line of the match in the original
+    level: str          # "exact", "whitespace" or "fuzz N"
+    removed: int
+    added: int
+
+
+@dataclass
+class PatchResult:
+    code: str
+    format: str                     # "search_replace" or "unified_diff"
+    matches: List[HunkMatch] = field(default_factory=list)
+
+    @property
+    def changed_lines(self) -> int:
+        return sum(max(m.removed, m.added) for m in self.matches)
+
+
+# ----------------------------
+# Parsing
+# ----------------------------
+
+def strip_fences(text: str) -> str:
+    """Drop markdown fence lines (```java ... ```) around or between the hunks."""
+    return "\n".join(line for line in text.splitlines() if not line.strip().startswith(MARKDOWN_FENCE))
+
+def parse_search_replace(text: str) -> List[Hunk]:
+    hunks = []
+    for match in SEARCH_REPLACE_RE.finditer(text):
+        hunks.append(Hunk(match.group(1).splitlines(), match.group(2).splitlines()))
+    return hunks
+
+def is_diff_line(line: str) -> bool:
+    return line.startswith(DIFF_LINE_PREFIXES) or bool(HUNK_HEADER_RE.match(line))
+
+def parse_unified_diff(text: str) -> List[Hunk]:
+    """
+    Hunks of a unified diff. Lenient about what models produce: headers
+    without line numbers, context lines that lost their leading space. A hunk
+    ends once the old/new line counts of its header are reached and a line
+    without a diff prefix follows (too small counts do not cut off +/- lines);
+    without counts it ends at a blank line followed by such a line, so an
+    explanation after the diff is not taken for context.
+    """
+    hunks, current, counts = [], None, None
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        header = HUNK_HEADER_RE.match(line)
+        if header:
+            current = Hunk([], [], int(header.group(1)) if header.group(1) else None)
+            counts = (int(header.group(2)), int(header.group(4))) if header.group(2) and header.group(4) else None
+            hunks.append(current)
+            continue
+        if current is None:
+            continue
+        if counts is not None:
+            ended = len(current.old) >= counts[0] and len(current.new) >= counts[1] and not is_diff_line(line)
+        else:
+            ended = not line.strip() and i + 1 < len(lines) and lines[i + 1].strip() and not is_diff_line(lines[i + 1])
+        if ended or line.startswith(FILE_HEADER_PREFIXES):
+            current = None
+        elif line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        elif line.startswith("-"):
+            current.old.append(line[1:])
+        elif line.startswith("+"):
+            current.new.append(line[1:])
+        else:
+            context = line[1:] if line.startswith(" ") else line
+            current.old.append(context)
+            current.new.append(context)
+    # Trailing blank lines after the last hunk are usually the end of the response, not context.
+    for hunk in hunks:
+        while hunk.old and hunk.new and not hunk.old[-1].strip() and not hunk.new[-1].strip():
+            hunk.old.pop()
+            hunk.new.pop()
+    return [h for h in hunks if h.old or h.new]
+
+def parse_patch(text: str) -> Tuple[str, List[Hunk]]:
+    """(format, hunks) of a response; format is "" when it holds no patch."""
+    text = strip_fences(text)
+    hunks = parse_search_replace(text)
+    if hunks:
+        return "search_replace", hunks
+    hunks = parse_unified_diff(text)
+    if hunks:
+        return "unified_diff", hunks
+    return "", []
+
+def looks_like_patch(text: str) -> bool:
+    return bool(parse_patch(text)[0])
+
+def looks_like_compilation_unit(text: str) -> bool:
+    tokens = code_tokens(strip_fences(text))
+    return bool(tokens) and tokens[0].text in COMPILATION_UNIT_STARTS
+
+
+# ----------------------------
+# Matching
+# ----------------------------
+
+def normalize(line: str) -> str:
+    return " ".join(line.split())
+
+def find_block(lines: Sequence[str], block: Sequence[str], normalized: bool) -> List[int]:
+    """Start indexes of every occurrence of block in lines."""
+    if not block:
+        return []
+    if normalized:
+        lines, block = [normalize(l) for l in lines], [normalize(l) for l in block]
+    first, size = block[0], len(block)
+    return [i for i in range(len(lines) - size + 1)
+            if lines[i] == first and list(lines[i:i + size]) == list(block)]
+
+def choose(starts: List[int], expected: Optional[int], max_drift: int) -> Optional[int]:
+    """The one acceptable match; PatchError if the hunk is ambiguous."""
+    if len(starts) == 1:
+        return starts[0]
+    if expected is None:
+        raise PatchError(f"matches {len(starts)} places (lines {', '.join(str(s + 1) for s in starts[:5])})")
+    ranked = sorted(starts, key=lambda s: abs(s - expected))
+    if abs(ranked[0] - expected) > max_drift or abs(ranked[1] - expected) == abs(ranked[0] - expected):
+        raise PatchError(f"matches {len(starts)} places, none unambiguously near line {expected + 1}")
+    return ranked[0]
+
+def locate(lines: Sequence[str], hunk: Hunk, max_drift: int, max_fuzz: int):
+    """(start, hunk trimmed to what matched, level) of one hunk in the original lines."""
+    expected = hunk.old_start - 1 if hunk.old_start is not None else None
+    if not hunk.old:
+        # Pure insertion: only a unified diff header (@@ -N,0 ...: after line N) says where.
+        if hunk.old_start is None or hunk.old_start > len(lines):
+            raise PatchError("inserts lines without saying where (empty SEARCH part)")
+        return hunk.old_start, hunk, "exact"
+    for level, normalized in (("exact", False), ("whitespace", True)):
+        starts = find_block(lines, hunk.old, normalized)
+        if starts:
+            return choose(starts, expected, max_drift), hunk, level
+    before, after = hunk.context
+    tried = set()
+    for fuzz in range(1, max_fuzz + 1):
+        # Drop context at one end first, so the context that still matches keeps the hunk unambiguous.
+        for cut_before, cut_after in ((0, min(fuzz, after)), (min(fuzz, before), 0), (min(fuzz, before), min(fuzz, after))):
+            if (cut_before, cut_after) in tried or not (cut_before or cut_after):
+                continue
+            tried.add((cut_before, cut_after))
+            trimmed = Hunk(hunk.old[cut_before:len(hunk.old) - cut_after],
+                           hunk.new[cut_before:len(hunk.new) - cut_after],
+                           hunk.old_start + cut_before if hunk.old_start is not None else None)
+            starts = find_block(lines, trimmed.old, True)
+            if starts:
+                return choose(starts, expected + cut_before if expected is not None else None, max_drift), trimmed, \
+                       f"fuzz {fuzz}"
+    raise PatchError("does not match the original code")
+
+def indent_of(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+def reindent(line: str, indents: dict) -> str:
+    if not line.strip():
+        return line
+    indent = indent_of(line)
+    known = [model for model in indents if indent.startswith(model)]
+    if not known:
+        return line
+    model = max(known, key=len)
+    return indents[model] + line[len(model):]
+
+def replacement(original: Sequence[str], start: int, hunk: Hunk) -> List[str]:
+    """The new lines; context lines are taken from the file, added lines re-indented to the file's indentation."""
+    before, after = hunk.context
+    end = start + len(hunk.old)
+    body = hunk.new[before:len(hunk.new) - after]
+    # Map every indentation the model used in the matched lines to the file's; deeper lines keep their extra indent.
+    indents = {}
+    for model_line, file_line in zip(hunk.old, original[start:end]):
+        if model_line.strip():
+            indents.setdefault(indent_of(model_line), indent_of(file_line))
+    if any(model != indented for model, indented in indents.items()):
+        body = [reindent(line, indents) for line in body]
+    return list(original[start:start + before]) + body + list(original[end - after:end] if after else [])
+
+# ----------------------------
+# Applying
+# ----------------------------
+
+def apply_hunks(source: str, hunks: Sequence[Hunk], patch_format: str = "search_replace",
+                max_drift: int = DEFAULT_MAX_DRIFT, max_fuzz: int = DEFAULT_MAX_FUZZ) -> PatchResult:
+    lines = source.splitlines()
+    located = []
+    for i, hunk in enumerate(hunks):
+        try:
+            start, matched, level = locate(lines, hunk, max_drift, max_fuzz)
+        except PatchError as e:
+            raise PatchError(f"hunk {i + 1} of {len(hunks)} {e}") from None
+        located.append((start, i, matched, level))
+    located.sort(key=lambda item: (item[0], item[1]))
+    for (start, i, matched, _), (next_start, j, _, _) in zip(located, located[1:]):
+        if start + len(matched.old) > next_start:
+            raise PatchError(f"hunks {i + 1} and {j + 1} overlap")
+
+    out, pos, result = [], 0, PatchResult("", patch_format)
+    for start, i, matched, level in located:
+        out.extend(lines[pos:start])
+        out.extend(replacement(lines, start, matched))
+        pos = start + len(matched.old)
+        before, after = matched.context
+        result.matches.append(HunkMatch(i, start + 1, level, len(matched.old) - before - after,
+                                        len(matched.new) - before - after))
+    out.extend(lines[pos:])
+    result.code = "\n".join(out) + ("\n" if source.endswith("\n") or not source else "")
+    result.matches.sort(key=lambda m: m.index)
+    return result
+
+def apply_patch(source: str, patch_text: str, max_drift: int = DEFAULT_MAX_DRIFT,
+                max_fuzz: int = DEFAULT_MAX_FUZZ) -> PatchResult:
+    """Apply SEARCH/REPLACE blocks or a unified diff to source; PatchError if that cannot be done unambiguously."""
+    patch_format, hunks = parse_patch(patch_text)
+    if not hunks:
+        raise PatchError("no SEARCH/REPLACE blocks or unified diff hunks found")
+    return apply_hunks(source, hunks, patch_format, max_drift, max_fuzz)
+
+def candidate_from_response(original: str, response_text: str, allow_full: bool = True) -> Tuple[str, Optional[PatchResult]]:
+    """
+    The candidate class for a patch-mode response: the patched original, or,
+    with allow_full, the response itself if the model returned a whole class
+    anyway. PatchError otherwise.
+    """
+    if looks_like_patch(response_text):
+        result = apply_patch(original, response_text)
+        return result.code, result
+    if allow_full and looks_like_compilation_unit(response_text):
+        print("DEBUG: Patch-mode response is a whole compilation unit; using it as is")
+        return strip_fences(response_text).strip() + "\n", None
+    raise PatchError("no SEARCH/REPLACE blocks or unified diff hunks found")
+
+def describe(result: PatchResult) -> str:
+    return (f"{len(result.matches)} hunk(s), {result.changed_lines} changed line(s): "
+            + ", ".join(f"line {m.line} ({m.level})" for m in result.matches))
+
+# ----------------------------
+# Main Script
+# ----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply a model-written SEARCH/REPLACE or unified-diff patch to a file")
+    parser.add_argument("--source", type=str, required=True, help="File the patch was written against")
+    parser.add_argument("--patch", type=str, required=True, help="Model response holding the patch")
+    parser.add_argument("--output", type=str, default=None, help="Where to write the result (default: stdout)")
+    parser.add_argument("--max_drift", type=int, default=DEFAULT_MAX_DRIFT,
+                        help="How far from its stated line a repeated hunk may match")
+    parser.add_argument("--max_fuzz", type=int, default=DEFAULT_MAX_FUZZ, help="Context lines a hunk may lose")
+    args = parser.parse_args()
+
+    try:
+        result = apply_patch(Path(args.source).read_text(), Path(args.patch).read_text(), args.max_drift, args.max_fuzz)
+    except PatchError as e:
+        raise SystemExit(f"Patch rejected: {e}")
+    print(f"DEBUG: Applied {result.format} patch: {describe(result)}")
+    if args.output:
+        Path(args.output).write_text(result.code)
+        print(f"Wrote patched file to {args.output}")
+    else:
+        print(result.code, end="")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Fast pre-validation of candidate fixes before any test run is scheduled.
+
+Many candidates fail for trivial reasons: markdown fences around the code,
+chain-of-thought prose left in front of it, unbalanced braces, a renamed
+class, or a call that does not compile ("cannot find symbol"). These are
+caught here in two cheap stages:
+
+1. parse  - a token-level check of the candidate (no JVM involved);
+2. compile - only the changed class is compiled against the cached project
+   classpath, either in a warm JVM worker (jvm_runner.JVMWorkerPool) or with
+   a single `javac` call.
+
+Rejected candidates carry the diagnostics that explain why.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from java_source import COMPILATION_UNIT_STARTS, check_brackets, code_tokens, package_name, top_level_types
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+MARKDOWN_FENCE = "```"
+CLASSPATH_CACHE_FILE = ".precheck_classpath.json"
+COMPILE_TIMEOUT = 120
+
+
+@dataclass
+class PrecheckResult:
+    ok: bool
+    stage: str                 # last stage that ran: "parse" or "compile"
+    diagnostics: List[str] = field(default_factory=list)
+    duration: float = 0.0
+
+
+# ----------------------------
+# Parse Stage
+# ----------------------------
+
+def parse_check(code: str, class_name: str = "") -> List[str]:
+    """
+    Return a list of problems that make `code` unusable as the new version of
+    `class_name` (fully qualified), without invoking the compiler.
+    """
+    problems = []
+    if not code.strip():
+        return ["empty candidate"]
+    # Only fence lines count: ``` inside a string literal or a comment is valid Java.
+    fence_lines = [number for number, line in enumerate(code.splitlines(), 1)
+                   if line.strip().startswith(MARKDOWN_FENCE)]
+    if fence_lines:
+        problems.append(f"line {fence_lines[0]}: candidate contains markdown code fences")
+
+    tokens = code_tokens(code)
+    first = tokens[0] if tokens else None
+    if first is not None and first.text not in COMPILATION_UNIT_STARTS:
+        problems.append(f"line {first.line}: unexpected text before the code starts ({first.text!r}); "
+                        f"leftover explanation?")
+    problems.extend(check_brackets(code))
+
+    types = top_level_types(code)
+    if class_name:
+        expected_package, _, simple_name = class_name.rpartition(".")
+        if simple_name not in types:
+            found = ", ".join(types) if types else "none"
+            problems.append(f"class {simple_name} is not declared (found: {found})")
+        declared_package = package_name(code)
+        if declared_package != expected_package:
+            problems.append(f"package is '{declared_package}', expected '{expected_package}'")
+
+    # Prose after the closing brace of the last type, e.g. "This fixes the bug because ...".
+    depth, last_close = 0, None
+    for i, token in enumerate(tokens):
+        if token.kind == "op" and token.text == "{":
+            depth += 1
+        elif token.kind == "op" and token.text == "}":
+            depth -= 1
+            if depth == 0:
+                last_close = i
+    trailing = [t for t in tokens[last_close + 1:] if t.text != ";"] if last_close is not None else []
+    if trailing:
+        problems.append(f"line {trailing[0].line}: unexpected text after the last closing brace "
+                        f"({trailing[0].text!r})")
+    return problems
+
+
+# ----------------------------
+# Compile Stage
+# ----------------------------
+
+def defects4j_compile_classpath(work_dir: Path) -> List[str]:
+    """Compile classpath of a compiled Defects4J checkout, cached in the checkout."""
+    work_dir = Path(work_dir)
+    cache_file = work_dir / CLASSPATH_CACHE_FILE
+    if cache_file.exists():
+        return json.loads(cache_file.read_text())
+    result = subprocess.run(["defects4j", "export", "-p", "cp.compile", "-w", str(work_dir)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"defects4j export failed in {work_dir}:\n{result.stderr}")
+    classpath = [entry for entry in result.stdout.strip().split(os.pathsep) if entry]
+    cache_file.write_text(json.dumps(classpath))
+    return classpath
+
+def javac_compile(class_name: str, code: str, classpath: Sequence[str], javac: str = "javac"):
+    """Compile a single class with javac into a scratch directory; returns (ok, diagnostics)."""
+    scratch = Path(tempfile.mkdtemp(prefix="precheck-"))
+    try:
+        source = scratch / f"{class_name.rsplit('.', 1)[-1]}.java"
+        source.write_text(code)
+        out_dir = scratch / "classes"
+        out_dir.mkdir()
+        cmd = [javac, "-nowarn", "-encoding", "UTF-8", "-d", str(out_dir),
+               "-cp", os.pathsep.join(classpath), str(source)]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=COMPILE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            return False, [f"javac timed out after {COMPILE_TIMEOUT}s"]
+        diagnostics = [line for line in result.stderr.splitlines() if line.strip()]
+        return result.returncode == 0, diagnostics
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def precheck_candidate(code: str, class_name: str, jvm_pool=None, classpath: Optional[Sequence[str]] = None,
+                       compile: bool = True) -> PrecheckResult:
+    """
+    Run the parse stage and, if it passes and a compiler is available
+    (`jvm_pool` or `classpath` for javac), the compile stage.
+    """
+    start = time.perf_counter()
+    problems = parse_check(code, class_name)
+    if problems:
+        return PrecheckResult(ok=False, stage="parse", diagnostics=problems, duration=time.perf_counter() - start)
+    if not compile or (jvm_pool is None and classpath is None):
+        return PrecheckResult(ok=True, stage="parse", duration=time.perf_counter() - start)
+
+    if jvm_pool is not None:
+        ok, diagnostics = jvm_pool.check_compiles(class_name, code)
+    else:
+        ok, diagnostics = javac_compile(class_name, code, classpath)
+    return PrecheckResult(ok=ok, stage="compile", diagnostics=diagnostics if not ok else [],
+                          duration=time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-check a candidate fix before running any tests")
+    parser.add_argument("--candidate", type=str, required=True, help="File containing the candidate class")
+    parser.add_argument("--class_name", type=str, required=True, help="Fully qualified name of the class it replaces")
+    parser.add_argument("--workdir", type=str, default=None,
+                        help="Compiled Defects4J checkout to compile against (parse stage only if omitted)")
+    args = parser.parse_args()
+
+    code = Path(args.candidate).read_text()
+    classpath = defects4j_compile_classpath(Path(args.workdir)) if args.workdir else None
+    result = precheck_candidate(code, args.class_name, classpath=classpath)
+    status = "OK" if result.ok else "REJECTED"
+    print(f"{status} after {result.stage} stage ({result.duration * 1000:.0f} ms)")
+    for line in result.diagnostics:
+        print(f"  {line}")
+    raise SystemExit(0 if result.ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,979 @@
+#!/usr/bin/env python3
+"""
+QuixBugs bug-fixing harness (scripted version of ECE1785_Results_QuixBugs_Dataset_Tests.ipynb).
+
+For every problem the zero-shot, few-shot and chain-of-thought prompts are sent
+to the model, each returned candidate is written over the Java program and the
+problem's JUnit test class is run with Gradle.
+
+All LLM requests of a sweep are dispatched concurrently up front (see
+llm_dispatch.py). Each candidate is then validated in its own workspace cloned
+from the QuixBugs tree (see workspace_pool.py), so several Gradle runs proceed
+in parallel and the original checkout is never overwritten. Alternatively
+(--validator jvm) candidates are compiled and tested in a pool of warm JVM
+workers (see jvm_runner.py), which skips Gradle and JVM startup entirely.
+Before any test run, candidates go through a parse/compile pre-check
+(precheck.py) so broken code is rejected in milliseconds. Every outcome is
+appended to the results store (results_store.py) as soon as it is known.
+With --journal every finished (problem, strategy) unit is also recorded in a
+run journal (run_journal.py); rerunning with the same journal skips the units
+that are already done and continues the interrupted run, provided the
+options are the same (--restart discards the journal).
+
+Each candidate is handed to validation as soon as its request finishes. With
+--stream responses are streamed and a chain-of-thought request is cancelled
+as soon as its ---END FIXED CODE--- marker arrives (fixed_code_stream.py).
+
+With --repair_iterations N a failing candidate is not simply dropped: its
+compiler diagnostics or failing tests are sent back to the model as a follow-up
+turn of the same conversation, up to N times (and --repair_max_tokens tokens).
+The retries are validated in the workspace (or warm JVM) that already built
+the candidate, so only the changed program is recompiled.
+
+Candidates are deduplicated by their normalized token stream: the outcome of
+every candidate is stored in a persistent validation cache (validation_cache.py)
+per (problem, normalized hash, test class), and a candidate equivalent to one
+already validated, in this run or an earlier one, is resolved from it without
+a build.
+"""
+import os
+import argparse
+import subprocess
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from langchain.prompts import PromptTemplate
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_openai import ChatOpenAI
+
+from budget_scheduler import BudgetScheduler, count_prompt_tokens
+from llm_dispatch import DEFAULT_CONCURRENCY, RateLimiter, run_dispatch
+from patch_apply import PatchError, candidate_from_response, describe
+from response_cache import DEFAULT_CACHE_DIR, ResponseCache, model_params
+from results_store import DEFAULT_RESULTS_DB, AttemptRecord, ResultsStore, UnitRecord, candidate_hash, new_run_id
+from jvm_runner import JVMWorkerPool, ValidationResult, resolve_gradle_classpath
+from fixed_code_stream import FixedCodeStream
+from precheck import precheck_candidate
+from run_journal import ConfigMismatch, RunJournal
+import tracing
+from validation_cache import DEFAULT_CACHE_DIR as DEFAULT_VALIDATION_CACHE_DIR, ValidationCache, file_digest
+from workspace_pool import WorkspacePool
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+QUIXBUGS_PATH = "/content/QuixBugs"
+DATASET = "quixbugs"
+OVER_BUDGET = "over budget"
+PATCH_REJECTED = "patch rejected"
+# Outcomes a feedback round can address (not LLM or test-runner errors).
+REPAIRABLE = ("rejected", "failed", "timeout")
+# Outcomes of samples that never produced a candidate to validate.
+NO_CANDIDATE = ("llm_error", "patch_rejected")
+FEEDBACK_MESSAGE_LINES = 8
+FEEDBACK_MAX_CHARS = 4000
+JAVAC_ERROR_RE = re.compile(r"\.java:\d+: error: ")
+TEST_FAILED_RE = re.compile(r" > .+ FAILED$")
+TESTS_FAILED_SUMMARY_RE = re.compile(r"\d+ tests? completed, \d+ failed")
+GRADLE_TIMEOUT = 900
+GRADLE_ERROR_LINES = 20
+PROBLEM_NAMES = [
+    "BITCOUNT", "BREADTH_FIRST_SEARCH", "BUCKETSORT", "DEPTH_FIRST_SEARCH", "DETECT_CYCLE",
+    "FIND_FIRST_IN_SORTED", "FIND_IN_SORTED", "FLATTEN", "GCD", "GET_FACTORS", "HANOI",
+    "IS_VALID_PARENTHESIZATION", "KHEAPSORT", "KNAPSACK", "KTH", "LCS_LENGTH", "LEVENSHTEIN",
+    "LIS", "LONGEST_COMMON_SUBSEQUENCE", "MAX_SUBLIST_SUM", "MERGESORT", "MINIMUM_SPANNING_TREE",
+    "NEXT_PALINDROME", "NEXT_PERMUTATION", "PASCAL", "POSSIBLE_CHANGE", "POWERSET", "QUICKSORT",
+    "REVERSE_LINKED_LIST", "RPN_EVAL", "SHORTEST_PATHS", "SHUNTING_YARD", "SIEVE", "SQRT",
+    "SUBSEQUENCES", "TOPOLOGICAL_ORDERING", "TO_BASE", "WRAP",
+]
+
+ZERO_SHOT_PROMPT = PromptTemplate(
+    template="""You are an expert Java developer.
+Below is a piece of code that has a bug (syntax or logical). Please fix it.
+
+CODE:
+{text}
+
+Provide ONLY the corrected code, starting from the package declaration, WITHOUT using any markdown formatting or triple backticks.""",
+    input_variables=["text"]
+)
+
+FEW_SHOT_PROMPT = PromptTemplate(
+    template="""You are an expert Java developer.
+Below is an example of a bug and its fix:
+
+EXAMPLE BUG:
+def add_numbers(a, b):
+    return a - b
+
+EXAMPLE FIX:
+def add_numbers(a, b):
+    return a + b
+
+Now, here is another buggy code snippet. Fix it using the same logic.
+
+CODE:
+{text}
+
+Provide ONLY the corrected code, starting from the package declaration, WITHOUT using any markdown formatting or triple backticks.""",
+    input_variables=["text"]
+)
+
+CHAIN_OF_THOUGHT_PROMPT = PromptTemplate(
+    template="""You are an expert Java developer.
+I will give you code with a bug. Think step by step about the bug,
+explain your reasoning, then provide a corrected version.
+
+CODE:
+{text}
+
+First, explain your reasoning (step-by-step), then clearly indicate the corrected code by using:
+
+---FIXED CODE---
+(Your fixed code starts here)
+---END FIXED CODE---
+
+Provide ONLY the corrected Java code between these markers, starting from the package declaration, WITHOUT using any markdown formatting or triple backticks.
+""",
+    input_variables=["text"]
+)
+
+PROMPT_STRATEGIES = [
+    ("Zero-Shot", ZERO_SHOT_PROMPT),
+    ("Few-Shot", FEW_SHOT_PROMPT),
+    ("Chain-of-Thought", CHAIN_OF_THOUGHT_PROMPT),
+]
+
+# Patch mode: the model returns only its edits (see patch_apply.py), which are applied to the buggy program.
+OUTPUT_MODES = ("full", "patch")
+PATCH_FORMAT_INSTRUCTIONS = """Do NOT return the whole program. Return ONLY your edits as one or more SEARCH/REPLACE blocks:
+
+<<<<<<< SEARCH
+(lines copied exactly from the code above, with one line of context so they occur only once)
+=======
+(the lines that replace them)
+>>>>>>> REPLACE
+
+WITHOUT using any markdown formatting or triple backticks."""
+
+ZERO_SHOT_PATCH_PROMPT = PromptTemplate(
+    template="""You are an expert Java developer.
+Below is a piece of code that has a bug (syntax or logical). Please fix it.
+
+CODE:
+{text}
+
+""" + PATCH_FORMAT_INSTRUCTIONS,
+    input_variables=["text"]
+)
+
+FEW_SHOT_PATCH_PROMPT = PromptTemplate(
+    template="""You are an expert Java developer.
+Below is an example of a bug and its fix:
+
+EXAMPLE BUG:
+def add_numbers(a, b):
+    return a - b
+
+EXAMPLE FIX:
+<<<<<<< SEARCH
+def add_numbers(a, b):
+    return a - b
+=======
+def add_numbers(a, b):
+    return a + b
+>>>>>>> REPLACE
+
+Now, here is another buggy code snippet. Fix it using the same logic.
+
+CODE:
+{text}
+
+""" + PATCH_FORMAT_INSTRUCTIONS,
+    input_variables=["text"]
+)
+
+CHAIN_OF_THOUGHT_PATCH_PROMPT = PromptTemplate(
+    template="""You are an expert Java developer.
+I will give you code with a bug. Think step by step about the bug,
+explain your reasoning, then provide your edits.
+
+CODE:
+{text}
+
+First, explain your reasoning (step-by-step), then clearly indicate your edits by using:
+
+---FIXED CODE---
+(Your SEARCH/REPLACE blocks start here)
+---END FIXED CODE---
+
+""" + PATCH_FORMAT_INSTRUCTIONS,
+    input_variables=["text"]
+)
+
+PATCH_PROMPT_STRATEGIES = [
+    ("Zero-Shot", ZERO_SHOT_PATCH_PROMPT),
+    ("Few-Shot", FEW_SHOT_PATCH_PROMPT),
+    ("Chain-of-Thought", CHAIN_OF_THOUGHT_PATCH_PROMPT),
+]
+
+# Follow-up turn of a repair round.
+REPAIR_PROMPT = """Your fix does not work yet.
+
+{feedback}
+
+Fix the code again. {instructions}"""
+REPAIR_INSTRUCTIONS = {
+    "full": "Return the complete corrected program in the same format as before, WITHOUT any markdown formatting.",
+    "patch": "Return SEARCH/REPLACE edits against your previous version in the same format as before, "
+             "WITHOUT any markdown formatting.",
+}
+
+
+@dataclass
+class UnitProgress:
+    """Validation state of the samples of one (problem, strategy) pair."""
+    samples: int
+    outcomes: dict = field(default_factory=dict)     # sample -> (ValidationResult or None, status)
+    futures: dict = field(default_factory=dict)      # sample -> Future of its validation
+    first_pass: tuple = None                         # (sample, seconds since the sweep started)
+    started: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def get_java_files(problem_name, quixbugs_path=QUIXBUGS_PATH):
+    java_main_path = os.path.join(quixbugs_path, "java_programs", f"{problem_name}.java")
+    java_test_path = os.path.join(quixbugs_path, "java_testcases", "junit", f"{problem_name}_TEST.java")
+
+    if not os.path.exists(java_main_path) or not os.path.exists(java_test_path):
+        raise FileNotFoundError(f"Files for {problem_name} not found.")
+
+    return java_main_path, java_test_path
+
+def extract_fixed_code(response_text):
+    """Extracts Java code from Chain-of-Thought response using markers."""
+    match = re.search(r"---FIXED CODE---\s*(.*?)\s*---END FIXED CODE---", response_text, re.DOTALL)
+    if match:
+        return match.group(1).strip()
+    print("[ERROR] extracting fixed code, returning non-extracted code fallback")
+    return response_text.strip()  # Fallback if markers are missing
+
+def uses_markers(prompt):
+    return "FIXED CODE" in str(prompt)
+
+def postprocess_response(prompt, response_text):
+    """If the prompt is Chain-of-Thought, extract only the Java code from the response."""
+    if uses_markers(prompt):
+        return extract_fixed_code(response_text)
+    return response_text
+
+def prompt_strategies(output_mode="full"):
+    """The (name, prompt) strategies for an output mode: whole programs or patches."""
+    return PATCH_PROMPT_STRATEGIES if output_mode == "patch" else PROMPT_STRATEGIES
+
+def apply_prompt(llm, prompt, code, output_mode="full"):
+    """Applies the LLM-based bug-fixing prompt to the Java code"""
+    response = llm.invoke(prompt.format(text=code))
+    response_text = response.content.strip() if hasattr(response, "content") else str(response).strip()
+    fixed_code = postprocess_response(prompt, response_text)
+    if output_mode == "patch":
+        fixed_code, _ = candidate_from_response(code, fixed_code)
+    return fixed_code
+
+def restore_leftover_backups(quixbugs_path=QUIXBUGS_PATH):
+    """
+    Put back java_programs/X.java from the X.java.bak an interrupted in-place
+    run (the notebook version) left behind, so candidates are never validated
+    against another candidate instead of the original buggy program.
+    """
+    restored = 0
+    for backup in sorted(Path(quixbugs_path, "java_programs").glob("*.java.bak")):
+        os.replace(backup, backup.with_suffix(""))
+        restored += 1
+    if restored:
+        print(f"DEBUG: Restored {restored} Java program(s) from .bak files left by an interrupted run")
+    return restored
+
+def generate_candidates(llm, problem_names, quixbugs_path=QUIXBUGS_PATH, concurrency=DEFAULT_CONCURRENCY,
+                        requests_per_minute=None, tokens_per_minute=None, cache=None, dispatch_results=None,
+                        units=None, stream=False, on_candidate=None, samples=1, skip=None, budget=None,
+                        output_mode="full", limiter=None):
+    """
+    Request a fix for every (problem, strategy) pair concurrently.
+
+    Returns a dict mapping (problem_name, prompt_name) to the extracted fixed
+    code, or to None if the request failed. If dispatch_results is a dict, the
+    DispatchResult of every request (usage, latency, ...) is stored in it too.
+    If units is given, only those (problem_name, prompt_name) pairs are requested.
+    With samples > 1 every pair is sampled that many times and both dicts map
+    it to a list with one entry per sample; skip(key, sample) stops the samples
+    of a pair that have not been sent yet.
+
+    on_candidate(key, fixed_code, dispatched) is called as soon as each request
+    finishes (from the dispatch thread). With stream, responses are streamed and
+    chain-of-thought requests stop at the end of their code block.
+
+    With a budget (budget_scheduler.BudgetScheduler) the requests are sent
+    cheapest and most informative first, and a request that would exceed a
+    token or cost budget is not sent (it comes back skipped).
+
+    With output_mode "patch" the model is asked for SEARCH/REPLACE edits,
+    which are applied to the buggy program (patch_apply.py); a patch that
+    cannot be applied unambiguously yields no candidate, and the failed
+    DispatchResult's error says why.
+
+    A limiter (llm_dispatch.RateLimiter) replaces the requests_per_minute and
+    tokens_per_minute limits, so they can be shared with other requests.
+    """
+    requests = []
+    buggy_programs = {}
+    for problem_name in problem_names:
+        prompts = [(prompt_name, prompt) for prompt_name, prompt in prompt_strategies(output_mode)
+                   if units is None or (problem_name, prompt_name) in units]
+        if not prompts:
+            continue
+        java_file, _ = get_java_files(problem_name, quixbugs_path)
+        with open(java_file, "r") as f:
+            buggy_code = f.read()
+        buggy_programs[problem_name] = buggy_code
+        for prompt_name, prompt in prompts:
+            requests.append(((problem_name, prompt_name), prompt.format(text=buggy_code)))
+            if budget is not None:
+                budget.add_unit((problem_name, prompt_name), requests[-1][1], DATASET, model_name(llm),
+                                group=problem_name)
+    if budget is not None:
+        requests = budget.order(requests)
+        skip_request = skip
+
+        def skip(key, sample):
+            return (skip_request is not None and skip_request(key, sample)) or not budget.reserve(key)
+
+    prompts = dict(prompt_strategies(output_mode))
+    candidates = {}
+
+    def stream_handler(key):
+        return FixedCodeStream() if uses_markers(prompts[key[1]]) else None
+
+    def collect(result):
+        problem_name, prompt_name = result.key
+        if budget is not None:
+            budget.settle(result)
+        if result.ok:
+            with tracing.span("extract", problem=problem_name, strategy=prompt_name, bytes=len(result.text)) as span:
+                fixed_code = postprocess_response(prompts[prompt_name], result.text)
+                if output_mode == "patch":
+                    try:
+                        fixed_code, patch = candidate_from_response(buggy_programs[problem_name], fixed_code)
+                        span.set(patched=patch is not None)
+                        if patch is not None:
+                            print(f"DEBUG: Applied {prompt_name} patch for {problem_name}: {describe(patch)}")
+                    except PatchError as e:
+                        print(f"[ERROR] {prompt_name} patch for {problem_name} rejected: {e}")
+                        result.error = f"{PATCH_REJECTED}: {e}"
+                        fixed_code = None
+        else:
+            if not result.skipped:
+                print(f"[ERROR] {prompt_name} request for {problem_name} failed: {result.error}")
+            fixed_code = None
+        if samples > 1:
+            candidates.setdefault(result.key, [None] * samples)[result.sample] = fixed_code
+            if dispatch_results is not None:
+                dispatch_results.setdefault(result.key, [None] * samples)[result.sample] = result
+        else:
+            candidates[result.key] = fixed_code
+            if dispatch_results is not None:
+                dispatch_results[result.key] = result
+        if on_candidate is not None:
+            on_candidate(result.key, fixed_code, result)
+
+    print(f"Dispatching {len(requests)} LLM requests (concurrency={concurrency}"
+          f"{f', {samples} samples each' if samples > 1 else ''}{', streaming' if stream else ''})...")
+    run_dispatch(llm, requests, concurrency=concurrency,
+                 requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                 cache=cache, stream=stream, stream_handler=stream_handler, on_result=collect,
+                 samples=samples, skip=skip, limiter=limiter)
+    return candidates
+
+def run_gradle_test(problem_name, quixbugs_path=QUIXBUGS_PATH):
+    """Runs Gradle tests and returns whether the fix was successful."""
+    passed, _ = run_gradle_test_output(problem_name, quixbugs_path)
+    return passed
+
+def run_gradle_test_output(problem_name, quixbugs_path=QUIXBUGS_PATH, timeout=GRADLE_TIMEOUT):
+    """
+    Runs Gradle tests; returns (successful, stdout and stderr). Raises
+    subprocess.TimeoutExpired if the run takes longer than timeout seconds.
+    """
+    test_class = f"java_testcases.junit.{problem_name}_TEST"
+    cmd = ["gradle", "test", "--tests", test_class]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, cwd=quixbugs_path, timeout=timeout)
+        print(result.stdout)
+        return "BUILD SUCCESSFUL" in result.stdout, result.stdout + result.stderr
+    except subprocess.TimeoutExpired:
+        raise
+    except Exception as e:
+        print(f"Error running Gradle: {e}")
+        return False, str(e)
+
+def gradle_failures(output, context=FEEDBACK_MESSAGE_LINES):
+    """The javac errors and failed tests in Gradle output, each with the indented lines explaining it."""
+    lines = output.splitlines()
+    failures = []
+    for i, line in enumerate(lines):
+        if JAVAC_ERROR_RE.search(line) or TEST_FAILED_RE.search(line):
+            failures.append(line.strip())
+            for follow in lines[i + 1:i + 1 + context]:
+                if not follow.startswith((" ", "\t")):
+                    break
+                failures.append(follow.rstrip())
+    return failures
+
+def validate_candidate(workspace, problem_name, fixed_code, timeout=GRADLE_TIMEOUT):
+    """
+    Writes the candidate into an isolated workspace and runs the problem's
+    Gradle test there. Only javac errors and failed tests count as the
+    candidate failing; any other unsuccessful build (Gradle itself broken, a
+    missing JDK, a timeout) is reported in the result's error or timed_out.
+    """
+    workspace.write_file(Path("java_programs") / f"{problem_name}.java", fixed_code)
+    try:
+        passed, output = run_gradle_test_output(problem_name, workspace.root, timeout)
+    except subprocess.TimeoutExpired:
+        return ValidationResult(passed=False, timed_out=True, error=f"Gradle timed out after {timeout}s")
+    result = ValidationResult(passed=passed)
+    if passed:
+        return result
+    result.diagnostics = gradle_failures(output)
+    if "compileJava FAILED" in output and JAVAC_ERROR_RE.search(output):
+        result.compiled = False
+    elif any(TEST_FAILED_RE.search(line) for line in output.splitlines()) or TESTS_FAILED_SUMMARY_RE.search(output):
+        result.compiled = True
+    else:
+        lines = [line for line in output.splitlines() if line.strip()]
+        result.error = "Gradle failed without a compile error or test failure:\n" + "\n".join(
+            lines[-GRADLE_ERROR_LINES:])
+    return result
+
+def validate_candidate_in_jvm(jvm_pool, problem_name, fixed_code):
+    """Compiles the candidate and runs its JUnit class in a warm JVM worker."""
+    return jvm_pool.validate(f"java_programs.{problem_name}", fixed_code, f"java_testcases.junit.{problem_name}_TEST")
+
+def make_validator(validator, quixbugs_path, validation_workers=None, pool_root=None):
+    """
+    Returns (validate, close, workers, session) for the chosen backend.
+
+    validate(problem_name, fixed_code) -> ValidationResult is safe to call from
+    several threads at once. `with session() as validate_in:` gives a validate
+    that keeps its build state between calls (one workspace, whose Gradle build
+    only recompiles what changed), for a candidate and its repairs.
+    """
+    if validator == "jvm":
+        jvm_pool = JVMWorkerPool.for_gradle_project(quixbugs_path, size=validation_workers)
+
+        def validate_in_jvm(problem_name, fixed_code):
+            with tracing.span("test", problem=problem_name, backend="jvm") as span:
+                result = validate_candidate_in_jvm(jvm_pool, problem_name, fixed_code)
+                span.set(passed=result.passed, compiled=result.compiled)
+                return result
+
+        @contextmanager
+        def jvm_session():
+            # The warm workers already hold the compiled project; each call compiles only the candidate.
+            yield validate_in_jvm
+
+        return validate_in_jvm, jvm_pool.close, jvm_pool.size, jvm_session
+
+    pool = WorkspacePool(quixbugs_path, size=validation_workers, pool_root=pool_root)
+
+    def validate_in(workspace, problem_name, fixed_code):
+        with tracing.span("test", problem=problem_name, backend="gradle") as span:
+            result = validate_candidate(workspace, problem_name, fixed_code)
+            span.set(passed=result.passed)
+            return result
+
+    def validate(problem_name, fixed_code):
+        with pool.workspace() as workspace:
+            return validate_in(workspace, problem_name, fixed_code)
+
+    @contextmanager
+    def session():
+        with pool.workspace() as workspace:
+            yield partial(validate_in, workspace)
+
+    return validate, pool.close, pool.size, session
+
+def make_prechecker(mode, validator, quixbugs_path):
+    """
+    Returns precheck(problem_name, fixed_code) -> PrecheckResult, or None when disabled.
+
+    With the jvm validator the compile stage is skipped here because the warm
+    worker compiles the candidate first anyway.
+    """
+    if mode == "off":
+        return None
+    classpath = None
+    if mode == "compile" and validator != "jvm":
+        resolved = resolve_gradle_classpath(quixbugs_path)
+        classpath = resolved["classes"] + resolved["jars"]
+
+    def precheck(problem_name, fixed_code):
+        with tracing.span("compile", problem=problem_name, mode=mode) as span:
+            result = precheck_candidate(fixed_code, f"java_programs.{problem_name}", classpath=classpath)
+            span.set(passed=result.ok, stage=result.stage)
+            return result
+
+    return precheck
+
+def repair_feedback(result):
+    """What went wrong with a candidate, in the words of the compiler or the failing tests."""
+    if result.compiled is False:
+        feedback = "It does not compile:\n" + "\n".join(result.diagnostics)
+    elif result.timed_out:
+        feedback = "The tests did not finish in time; the program probably does not terminate."
+    elif result.failed_tests:
+        feedback = "These tests fail:\n" + "\n".join(
+            f"- {t.name}: " + "\n  ".join(t.message.splitlines()[:FEEDBACK_MESSAGE_LINES])
+            for t in result.tests if t.status == "FAIL")
+    elif result.diagnostics:
+        feedback = "The tests fail:\n" + "\n".join(result.diagnostics)
+    else:
+        feedback = "The tests fail" + (f": {result.error}" if result.error else ".")
+    if len(feedback) > FEEDBACK_MAX_CHARS:
+        feedback = feedback[:FEEDBACK_MAX_CHARS] + "\n..."
+    return feedback
+
+def model_name(llm):
+    params = model_params(llm)
+    return str(params.get("model_name") or params.get("model") or type(llm).__name__)
+
+def test_selection(problem_name, quixbugs_path=QUIXBUGS_PATH):
+    """The validation-cache selection of a problem: its JUnit class and the digest of its source."""
+    _, test_file = get_java_files(problem_name, quixbugs_path)
+    return f"java_testcases.junit.{problem_name}_TEST@{file_digest(test_file)}"
+
+def attempt_record(problem_name, prompt_name, model, fixed_code, result, status, dispatched=None,
+                   precheck_duration=None, repair=0, validation_cached=None):
+    """Build the results-store row of one validated candidate."""
+    usage = dispatched.usage if dispatched is not None else {}
+    return AttemptRecord(
+        dataset=DATASET, problem=problem_name, strategy=prompt_name, model=model,
+        attempt=dispatched.sample + 1 if dispatched is not None else 1, repair=repair,
+        passed=result.passed, status=status, compiled=result.compiled, error=result.error,
+        candidate_hash=candidate_hash(fixed_code),
+        prompt_tokens=usage.get("input_tokens"), completion_tokens=usage.get("output_tokens"),
+        llm_latency=dispatched.latency if dispatched is not None else None,
+        cached=dispatched.cached if dispatched is not None else None,
+        precheck_duration=precheck_duration,
+        validation_duration=result.duration if status != "rejected" else None,
+        validation_cached=validation_cached,
+        tests=[(t.name, t.status, t.message) for t in result.tests],
+    )
+
+def automate_bug_fixing(llm, problem_names=PROBLEM_NAMES, quixbugs_path=QUIXBUGS_PATH,
+                        concurrency=DEFAULT_CONCURRENCY, requests_per_minute=None, tokens_per_minute=None,
+                        cache=None, validator="gradle", validation_workers=None, pool_root=None,
+                        precheck="compile", results_store=None, run_id=None, journal=None, stream=False,
+                        samples=1, budget=None, output_mode="full", repair_iterations=0, repair_max_tokens=None,
+                        validation_cache=None):
+    """
+    Runs all 3 prompts to fix bugs and tests them.
+
+    With output_mode "patch" the model returns edits instead of whole programs
+    (see generate_candidates); patches that cannot be applied are recorded as
+    "patch_rejected" without a test run.
+
+    Every validated candidate is appended to results_store (an in-memory store
+    if none is given) as soon as it finishes; the final table is rendered from
+    the stored rows of this run. If journal (a RunJournal) is given, finished
+    units are recorded in it, and units it already lists as done are neither
+    requested nor validated again; the run continues under the journal's run id.
+
+    Validation of a candidate starts as soon as its LLM request finishes, while
+    the remaining requests are still in flight. With stream, responses are
+    streamed and chain-of-thought requests stop at the end of their code block.
+
+    With samples = k > 1 every (problem, strategy) pair is sampled k times (one
+    n=k request where the model supports it) and the samples are validated
+    concurrently; once one passes, the pair's samples that are not requested
+    or validated yet are dropped. pass@1 (sample 1) and pass@k are recorded
+    per pair in the results store along with the time to the first pass.
+
+    With a budget (budget_scheduler.BudgetScheduler) requests that would exceed
+    it are not sent; their units are reported as over budget and, with a
+    journal, left open so a rerun with a larger budget picks them up.
+
+    With repair_iterations = n > 0 a candidate that does not compile or fails
+    its tests gets up to n follow-up turns in the same conversation, each
+    carrying the diagnostics or failing tests of the previous candidate, until
+    one passes or the repair requests of the candidate have used
+    repair_max_tokens tokens. The retries are validated in the same workspace
+    (or the warm JVM pool) and stored as attempts with repair = 1..n. Repair
+    requests share the sweep's rate limits and are booked against the budget
+    like the first requests; one the budget declines ends the repairs.
+
+    With a validation_cache (validation_cache.ValidationCache) a candidate
+    whose normalized form was validated before against the same test class is
+    resolved from the cache instead of being pre-checked and tested again.
+    """
+    results_store = results_store or ResultsStore(":memory:")
+    model = model_name(llm)
+    # One limiter for the sweep and its repair turns, which are sent from the validation threads.
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    config = {"problems": list(problem_names), "validator": validator, "precheck": precheck,
+              "model_params": model_params(llm), "samples": samples, "output_mode": output_mode,
+              "repair_iterations": repair_iterations, "repair_max_tokens": repair_max_tokens}
+    if journal is not None:
+        run_id = journal.start_run(run_id or new_run_id(), config)
+    run_id = results_store.start_run(DATASET, model, config, run_id)
+    print(f"Recording results of run {run_id} in {results_store.db_path}")
+    restore_leftover_backups(quixbugs_path)
+
+    outcomes = {}
+    pending = set()
+    for problem_name in problem_names:
+        for prompt_name, _ in PROMPT_STRATEGIES:
+            unit = (problem_name, prompt_name)
+            if journal is not None and journal.is_done(unit):
+                outcomes[unit] = ValidationResult(passed=bool((journal.result(unit) or {}).get("passed")))
+            else:
+                pending.add(unit)
+    if journal is not None:
+        interrupted = len(journal.interrupted() & pending)
+        print(f"DEBUG: {len(outcomes)} unit(s) already done, {len(pending)} to run"
+              + (f" ({interrupted} interrupted)" if interrupted else ""))
+
+    def mark_done(unit, result, status):
+        if journal is not None:
+            journal.mark_done(unit, {"passed": result.passed, "status": status})
+
+    run_precheck = make_prechecker(precheck, validator, quixbugs_path)
+    _, close_validator, workers, validation_session = make_validator(validator, quixbugs_path,
+                                                                     validation_workers, pool_root)
+    prompts = dict(prompt_strategies(output_mode))
+    progress = {unit: UnitProgress(samples) for unit in pending}
+    started = time.perf_counter()
+
+    def finish_unit(key):
+        unit = progress[key]
+        validated = [result for result, status in unit.outcomes.values()
+                     if result is not None and status not in NO_CANDIDATE]
+        first_result, first_status = unit.outcomes.get(0, (None, "skipped"))
+        if not validated and first_status == "over_budget":
+            outcomes[key] = ValidationResult(passed=False, error=OVER_BUDGET)
+            return
+        outcome = next((r for r in validated if r.passed), first_result or ValidationResult(passed=False))
+        outcomes[key] = outcome
+        results_store.record_unit(run_id, UnitRecord(
+            dataset=DATASET, problem=key[0], strategy=key[1], model=model, samples=samples,
+            validated=len(validated), passed=outcome.passed,
+            first_sample_passed=bool(first_result is not None and first_result.passed),
+            first_pass_attempt=unit.first_pass[0] + 1 if unit.first_pass else None,
+            time_to_first_pass=unit.first_pass[1] if unit.first_pass else None))
+        mark_done(key, outcome, "passed" if outcome.passed else first_status)
+
+    def settle(key, sample, result, status):
+        """
+        Record the outcome of one sample (result None: cancelled or skipped). The
+        first pass cancels the queued validations of the other samples (never
+        sample 1, which pass@1 is measured on); the last sample finishes the unit.
+        """
+        unit = progress[key]
+        cancel = []
+        with unit.lock:
+            unit.outcomes[sample] = (result, status)
+            if result is not None and result.passed and unit.first_pass is None:
+                unit.first_pass = (sample, time.perf_counter() - started)
+                cancel = [(s, f) for s, f in unit.futures.items() if s != 0 and s not in unit.outcomes]
+            finished = len(unit.outcomes) == unit.samples
+        for other, future in cancel:
+            if future.cancel():
+                settle(key, other, None, "cancelled")
+        if finished:
+            finish_unit(key)
+
+    selections = {}
+
+    def evaluate(problem_name, prompt_name, fixed_code, validate_in, repair, timings):
+        """Pre-check and test one candidate; returns (result, status)."""
+        if run_precheck is not None:
+            checked = run_precheck(problem_name, fixed_code)
+            timings["precheck"] = checked.duration
+            if not checked.ok:
+                print(f"{prompt_name} fix for {problem_name} rejected by {checked.stage} pre-check "
+                      f"in {checked.duration * 1000:.0f} ms:\n  " + "\n  ".join(checked.diagnostics))
+                return ValidationResult(passed=False, compiled=False, diagnostics=checked.diagnostics,
+                                        duration=checked.duration), "rejected"
+        print(f"\nTesting {prompt_name} Fix for {problem_name}" + (f" (repair {repair})..." if repair else "..."))
+        result = validate_in(problem_name, fixed_code)
+        status = "passed" if result.passed else "timeout" if result.timed_out else "error" if result.error else "failed"
+        return result, status
+
+    def check(problem_name, prompt_name, fixed_code, dispatched, validate_in, repair=0):
+        """Validate one candidate (or resolve it from the validation cache) and record it; returns (result, status)."""
+        timings = {}
+        validation_cached = None
+        if validation_cache is None:
+            result, status = evaluate(problem_name, prompt_name, fixed_code, validate_in, repair, timings)
+        else:
+            if problem_name not in selections:
+                selections[problem_name] = test_selection(problem_name, quixbugs_path)
+            result, status, validation_cached = validation_cache.resolve(
+                problem_name, fixed_code, selections[problem_name],
+                lambda: evaluate(problem_name, prompt_name, fixed_code, validate_in, repair, timings))
+            if validation_cached:
+                print(f"DEBUG: {prompt_name} fix for {problem_name} matches a validated candidate; "
+                      f"reusing its '{status}' outcome")
+        if result.passed:
+            print(f"\n✅ {prompt_name} Fix Worked! Bug Fixed in {problem_name}.java"
+                  + (f" after {repair} repair(s)" if repair else ""))
+        elif result.failed_tests:
+            print(f"{prompt_name} fix for {problem_name} failed: {', '.join(result.failed_tests)}")
+        results_store.record(run_id, attempt_record(problem_name, prompt_name, model, fixed_code, result, status,
+                                                    dispatched, timings.get("precheck"), repair, validation_cached))
+        return result, status
+
+    def repair(key, fixed_code, dispatched, result, status, validate_in):
+        """
+        Send the failure back to the model as the next turn of the candidate's
+        conversation and check the answer, up to repair_iterations times; returns
+        the last (result, status).
+        """
+        problem_name, prompt_name = key
+        prompt = prompts[prompt_name]
+        java_file, _ = get_java_files(problem_name, quixbugs_path)
+        with open(java_file, "r") as f:
+            messages = [HumanMessage(content=prompt.format(text=f.read())), AIMessage(content=dispatched.text)]
+        feedback = repair_feedback(result)
+        spent = 0
+        for iteration in range(1, repair_iterations + 1):
+            if progress[key].first_pass is not None:
+                break
+            messages.append(HumanMessage(content=REPAIR_PROMPT.format(
+                feedback=feedback, instructions=REPAIR_INSTRUCTIONS[output_mode])))
+            if repair_max_tokens is not None:
+                estimate = count_prompt_tokens(messages, model)
+                if spent + estimate > repair_max_tokens:
+                    print(f"DEBUG: No repair {iteration} of the {prompt_name} fix for {problem_name}: "
+                          f"{spent} + ~{estimate} tokens exceed {repair_max_tokens}")
+                    break
+            request_key = key + (dispatched.sample, iteration)
+            options = {}
+            if budget is not None:
+                budget.add_unit(request_key, messages, DATASET, model, group=problem_name)
+                options = {"skip": lambda k, sample: not budget.reserve(k), "on_result": budget.settle}
+            answer = run_dispatch(llm, [(request_key, list(messages))], concurrency=1, cache=cache, limiter=limiter,
+                                  **options)[0]
+            answer.sample = dispatched.sample
+            if answer.skipped:
+                print(f"DEBUG: No repair {iteration} of the {prompt_name} fix for {problem_name}: over budget")
+                break
+            spent += answer.usage.get("input_tokens", 0) + answer.usage.get("output_tokens", 0)
+            if not answer.ok:
+                print(f"[ERROR] Repair {iteration} request for {problem_name} ({prompt_name}) failed: {answer.error}")
+                break
+            messages.append(AIMessage(content=answer.text))
+            candidate = postprocess_response(prompt, answer.text)
+            if output_mode == "patch":
+                try:
+                    candidate, _ = candidate_from_response(fixed_code, candidate)
+                except PatchError as e:
+                    print(f"[ERROR] Repair {iteration} patch for {problem_name} ({prompt_name}) rejected: {e}")
+                    rejected = ValidationResult(passed=False, error=f"{PATCH_REJECTED}: {e}")
+                    results_store.record(run_id, attempt_record(*key, model, None, rejected, "patch_rejected",
+                                                                answer, repair=iteration))
+                    feedback = f"Your edits could not be applied: {e}"
+                    continue
+            fixed_code = candidate
+            result, status = check(problem_name, prompt_name, fixed_code, answer, validate_in, iteration)
+            if result.passed or status not in REPAIRABLE:
+                break
+            feedback = repair_feedback(result)
+        return result, status
+
+    def run_validation(problem_name, prompt_name, fixed_code, dispatched):
+        key = (problem_name, prompt_name)
+        with validation_session() as validate_in:
+            result, status = check(problem_name, prompt_name, fixed_code, dispatched, validate_in)
+            if repair_iterations and not result.passed and status in REPAIRABLE:
+                result, status = repair(key, fixed_code, dispatched, result, status, validate_in)
+        settle(key, dispatched.sample, result, status)
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+
+            def on_candidate(key, fixed_code, dispatched):
+                unit, sample = progress[key], dispatched.sample
+                with unit.lock:
+                    if not unit.started:
+                        unit.started = True
+                        if journal is not None:
+                            journal.mark_started(key)
+                if dispatched.skipped:
+                    over_budget = budget is not None and budget.take_denied(key)
+                    settle(key, sample, None, "over_budget" if over_budget else "skipped")
+                    return
+                if fixed_code is None:
+                    rejected = (dispatched.error or "").startswith(PATCH_REJECTED)
+                    status = "patch_rejected" if rejected else "llm_error"
+                    result = ValidationResult(passed=False, error=dispatched.error if rejected else "LLM request failed")
+                    results_store.record(run_id, attempt_record(*key, model, None, result, status, dispatched))
+                    settle(key, sample, result, status)
+                    return
+                with unit.lock:
+                    solved = unit.first_pass is not None and sample != 0
+                    if not solved:
+                        if not futures:
+                            print(f"DEBUG: First candidate handed to validation after "
+                                  f"{time.perf_counter() - started:.2f}s")
+                        unit.futures[sample] = executor.submit(run_validation, *key, fixed_code, dispatched)
+                        futures.append(unit.futures[sample])
+                if solved:
+                    settle(key, sample, None, "cancelled")
+
+            if pending:
+                generate_candidates(llm, problem_names, quixbugs_path, concurrency,
+                                    requests_per_minute, tokens_per_minute, cache, limiter=limiter,
+                                    units=pending, stream=stream, on_candidate=on_candidate, samples=samples,
+                                    skip=lambda key, sample: sample > 0 and progress[key].first_pass is not None,
+                                    budget=budget, output_mode=output_mode)
+        for future in futures:
+            if not future.cancelled() and future.exception() is not None:
+                raise future.exception()
+    finally:
+        close_validator()
+
+    def verdict(outcome):
+        if outcome.passed:
+            return "✅ Passed"
+        return "⏭ Over budget" if outcome.error == OVER_BUDGET else "❌ Failed"
+
+    results = [
+        [problem_name, prompt_name, verdict(outcomes[(problem_name, prompt_name)])]
+        for problem_name in problem_names
+        for prompt_name, _ in PROMPT_STRATEGIES
+    ]
+    strategies = [prompt_name for prompt_name, _ in PROMPT_STRATEGIES]
+    print("\nTest Results:")
+    print(results_store.results_table(DATASET, strategies, problem_names, run_id))
+    for row in results_store.pass_rates(("strategy",), DATASET, run_id):
+        print(f"{row['strategy']}: {row['passed']}/{row['attempts']} passed ({row['pass_rate']:.1%})")
+    if samples > 1:
+        for row in results_store.pass_at_k(("strategy",), DATASET, run_id):
+            time_to_pass = row["avg_time_to_first_pass"]
+            print(f"{row['strategy']}: pass@1 {row['pass_at_1']:.1%}, pass@{row['k']} {row['pass_at_k']:.1%}, "
+                  f"{row['validated']} sample(s) validated"
+                  + (f", first pass after {time_to_pass:.1f}s on average" if time_to_pass is not None else ""))
+    if validation_cache is not None:
+        stats = validation_cache.stats()
+        print(f"Validation cache: {stats['hits']} duplicate candidate(s) resolved without a build, "
+              f"{stats['misses']} validated ({stats['entries']} outcome(s) stored)")
+    if repair_iterations:
+        for row in results_store.pass_rates(("repair",), DATASET, run_id):
+            print(f"Repair round {row['repair']}: {row['passed']}/{row['attempts']} passed "
+                  f"({row['prompt_tokens']} prompt, {row['completion_tokens']} completion tokens)")
+    if budget is not None:
+        budget.print_report()
+    return results
+
+# ----------------------------
+# Main Script
+# ----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="QuixBugs automated bug fixing with prompt engineering")
+    parser.add_argument("--quixbugs_path", type=str, default=QUIXBUGS_PATH, help="Path to the QuixBugs checkout")
+    parser.add_argument("--problems", type=str, nargs="*", default=PROBLEM_NAMES, help="Problem names to run")
+    parser.add_argument("--model", type=str, default="gpt-4", help="OpenAI model name")
+    parser.add_argument("--base_url", type=str, default=None, help="Alternative API base URL (e.g. a local stub server)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Maximum in-flight LLM requests")
+    parser.add_argument("--rpm", type=float, default=None, help="Request-per-minute limit")
+    parser.add_argument("--tpm", type=float, default=None, help="Token-per-minute limit")
+    parser.add_argument("--cache_dir", type=str, default=DEFAULT_CACHE_DIR, help="LLM response cache directory")
+    parser.add_argument("--no_cache", action="store_true", help="Bypass cached responses (fresh responses are still stored)")
+    parser.add_argument("--validator", type=str, choices=["gradle", "jvm"], default="gradle",
+                        help="gradle: 'gradle test' per candidate in its own workspace; jvm: warm JVM worker pool")
+    parser.add_argument("--precheck", type=str, choices=["off", "parse", "compile"], default="compile",
+                        help="Reject candidates that do not parse / compile before running any tests")
+    parser.add_argument("--validation_workers", type=int, default=None,
+                        help="Parallel validations, one workspace or JVM each (default: CPU count)")
+    parser.add_argument("--pool_root", type=str, default=None,
+                        help="Persistent directory for the workspace pool (default: a temporary directory)")
+    parser.add_argument("--results_db", type=str, default=DEFAULT_RESULTS_DB,
+                        help="SQLite results store every validated candidate is appended to")
+    parser.add_argument("--update_readme", type=str, default=None,
+                        help="README whose QuixBugs table is regenerated from this run's stored results")
+    parser.add_argument("--journal", type=str, default=None,
+                        help="Run journal (JSONL); rerun with the same file to resume an interrupted sweep")
+    parser.add_argument("--restart", action="store_true", help="Discard the journal and start the sweep over")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="pass@k mode: candidates per problem and strategy; stops at the first passing one")
+    parser.add_argument("--temperature", type=float, default=None,
+                        help="Sampling temperature (use a non-zero one with --samples > 1)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream responses and stop chain-of-thought requests at the end of their code block")
+    parser.add_argument("--max_tokens", type=float, default=None,
+                        help="Token budget of the sweep; cheap units go first and requests beyond it are not sent")
+    parser.add_argument("--max_cost", type=float, default=None, help="Cost budget of the sweep in USD")
+    parser.add_argument("--output_mode", type=str, default="full", choices=OUTPUT_MODES,
+                        help="full: the model returns the whole corrected program; patch: only SEARCH/REPLACE edits")
+    parser.add_argument("--repair_iterations", type=int, default=0,
+                        help="Feedback rounds per failing candidate: its compiler errors or failing tests are sent "
+                             "back to the model in the same conversation")
+    parser.add_argument("--repair_max_tokens", type=int, default=None,
+                        help="Token cap of the feedback rounds of one candidate")
+    parser.add_argument("--validation_cache_dir", type=str, default=DEFAULT_VALIDATION_CACHE_DIR,
+                        help="Cache of validation outcomes per normalized candidate, shared across runs")
+    parser.add_argument("--no_validation_cache", action="store_true",
+                        help="Validate every candidate (outcomes are still stored)")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="Record per-stage spans and write them to TRACE.spans.jsonl and TRACE.trace.json")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable()
+
+    llm_options = {"temperature": args.temperature} if args.temperature is not None else {}
+    llm = ChatOpenAI(model_name=args.model, base_url=args.base_url, max_retries=0, stream_usage=args.stream,
+                     **llm_options)
+    cache = ResponseCache(args.cache_dir, bypass=args.no_cache)
+    validation_cache = ValidationCache(args.validation_cache_dir, bypass=args.no_validation_cache)
+    results_store = ResultsStore(args.results_db)
+    journal = RunJournal(args.journal) if args.journal else None
+    if journal is not None and args.restart:
+        journal.reset()
+    run_id = journal.run_id if journal is not None and journal.run_id else new_run_id()
+    budget = None
+    if args.max_tokens is not None or args.max_cost is not None:
+        budget = BudgetScheduler(int(args.max_tokens) if args.max_tokens is not None else None,
+                                 max_cost=args.max_cost)
+    try:
+        automate_bug_fixing(llm, args.problems, args.quixbugs_path, concurrency=args.concurrency,
+                            requests_per_minute=args.rpm, tokens_per_minute=args.tpm, cache=cache,
+                            validator=args.validator, validation_workers=args.validation_workers,
+                            pool_root=args.pool_root, precheck=args.precheck, results_store=results_store,
+                            run_id=run_id, journal=journal, stream=args.stream, samples=args.samples,
+                            budget=budget, output_mode=args.output_mode, repair_iterations=args.repair_iterations,
+                            repair_max_tokens=args.repair_max_tokens, validation_cache=validation_cache)
+    except ConfigMismatch as e:
+        raise SystemExit(f"[ERROR] {e}; rerun with --restart to discard the journal")
+    finally:
+        if args.trace:
+            tracing.print_summary()
+            tracing.export(args.trace)
+    if args.update_readme:
+        results_store.update_readme(Path(args.update_readme), DATASET,
+                                    [prompt_name for prompt_name, _ in PROMPT_STRATEGIES], run_id=run_id)
+
+if __name__ == "__main__":
+    main()
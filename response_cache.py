@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Persistent, content-addressed cache of LLM responses.
+
+Responses are keyed by the SHA-256 of the fully rendered prompt together with
+the model parameters that influence the completion (model name, temperature,
+max tokens, ...), so rerunning an experiment after changing only the
+validation step costs no tokens.
+
+The cache is a single SQLite database in WAL mode, which makes it safe to
+share between the threads of one process and between several worker
+processes. The total size of the stored responses is bounded; when it grows
+past `max_bytes` the least recently used entries are evicted.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+DEFAULT_CACHE_DIR = ".llm_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Eviction trims the cache down to this fraction of max_bytes so it does not run on every insert.
+EVICTION_LOW_WATER = 0.9
+# Chat model attributes that change the completion and therefore belong in the key.
+MODEL_PARAM_NAMES = ("model_name", "model", "temperature", "max_tokens", "top_p", "n",
+                     "frequency_penalty", "presence_penalty", "seed", "stop", "model_kwargs")
+# Endpoint attributes of a chat model (ChatOpenAI stores base_url as openai_api_base).
+BASE_URL_NAMES = ("openai_api_base", "base_url")
+# The endpoint a client talks to when no base URL is configured.
+DEFAULT_API_BASE = "https://api.openai.com/v1"
+
+
+def model_params(llm) -> dict:
+    """
+    Collect the completion-relevant parameters of a chat model for use in a cache key.
+
+    The base URL is always included (the real API when none is set), so a local
+    stub server and the real model of the same name never share entries.
+    """
+    params = {}
+    for name in MODEL_PARAM_NAMES:
+        value = getattr(llm, name, None)
+        if value is not None and value != {}:
+            params[name] = value
+    if "model_name" in params and "model" in params:
+        params.pop("model")
+    base_url = next((getattr(llm, name) for name in BASE_URL_NAMES if getattr(llm, name, None)), None)
+    params["base_url"] = str(base_url or os.environ.get("OPENAI_BASE_URL") or DEFAULT_API_BASE).rstrip("/")
+    return params
+
+def serialize_prompt(prompt: Any) -> Any:
+    """Turn a prompt string or a list of chat messages into a JSON-serializable value."""
+    if isinstance(prompt, str):
+        return prompt
+    return [{"role": getattr(m, "type", type(m).__name__), "content": getattr(m, "content", str(m))}
+            for m in prompt]
+
+def cache_key(prompt: Any, params: dict, salt: str = "") -> str:
+    """SHA-256 over the rendered prompt, the model parameters and an optional salt."""
+    payload = json.dumps({"prompt": serialize_prompt(prompt), "params": params, "salt": salt},
+                         sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of LLM responses stored in SQLite.
+
+    With `bypass=True` lookups always miss (forcing fresh requests) but new
+    responses are still written, which refreshes stale entries.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, bypass: bool = False):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / "responses.sqlite"
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " params TEXT NOT NULL,"
+                " text TEXT NOT NULL,"
+                " usage TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread (and therefore per process); SQLite handles the locking.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return {"text", "usage"} for a cached response, or None on a miss."""
+        if self.bypass:
+            self._count(False)
+            return None
+        conn = self._connect()
+        row = conn.execute("SELECT text, usage FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(False)
+            return None
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count(True)
+        return {"text": row[0], "usage": json.loads(row[1])}
+
+    def put(self, key: str, text: str, usage: Optional[dict] = None, params: Optional[dict] = None):
+        """Store a response and evict least recently used entries if over the size bound."""
+        usage_json = json.dumps(usage or {})
+        params_json = json.dumps(params or {}, sort_keys=True, default=str)
+        size = len(text.encode("utf-8")) + len(usage_json) + len(params_json)
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, params, text, usage, size, created, last_access)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, params_json, text, usage_json, size, now, now),
+        )
+        self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICTION_LOW_WATER
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            evicted = 0
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                if total <= target:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"DEBUG: Evicted {evicted} cached response(s) to stay under {self.max_bytes} bytes")
+
+    def clear(self):
+        self._connect().execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this instance plus the size of the shared cache."""
+        entries, total = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the LLM response cache")
+    parser.add_argument("--cache_dir", type=str, default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--clear", action="store_true", help="Delete all cached responses")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+        print(f"Cleared {cache.db_path}")
+    stats = cache.stats()
+    print(f"{stats['entries']} cached response(s), {stats['bytes']} bytes in {cache.db_path}")
+
+if __name__ == "__main__":
+    main()
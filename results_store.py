@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Append-only store of bug-fixing results.
+
+Every validated candidate becomes one row keyed by (dataset, problem,
+strategy, model, attempt) within a run, with its timings, token counts,
+candidate hash and per-test outcomes. Rows are written as soon as a candidate
+has been validated, so a run that dies keeps everything finished so far, and
+runs can be compared and aggregated afterwards.
+
+The store is a single SQLite database in WAL mode (like response_cache.py),
+so concurrent validation threads and batch processes can write to it. It
+answers grouped queries (pass rate per strategy, per model, ...) and renders
+the README result tables from the stored rows.
+
+With several samples per (problem, strategy) every sample is an attempt
+(attempt = sample number) and the unit as a whole gets one row in `units`:
+how many samples were validated, whether the first one passed (pass@1),
+whether any passed (pass@k) and how long it took until one did.
+
+A candidate repaired after compiler or test feedback is stored as further
+attempts of the same sample, numbered by `repair` (0 for the first answer).
+Attempts resolved from the validation cache (validation_cache.py) have
+`validation_cached` set.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+DEFAULT_RESULTS_DB = "results/results.sqlite"
+QUIXBUGS_README_HEADING = "# QuixBugs Full Results"
+GROUP_COLUMNS = ("dataset", "problem", "strategy", "model", "run_id", "status", "repair")
+PASSED_LABEL = "✅ Passed"
+FAILED_LABEL = "❌ Failed"
+
+# Columns added after the first release: name -> declaration, added to older databases on open.
+MIGRATIONS = {
+    "repair": "INTEGER NOT NULL DEFAULT 0",
+    "validation_cached": "INTEGER",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    model TEXT,
+    config TEXT NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    problem TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    model TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    repair INTEGER NOT NULL DEFAULT 0,
+    passed INTEGER NOT NULL,
+    compiled INTEGER,
+    status TEXT NOT NULL,
+    error TEXT,
+    candidate_hash TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    llm_latency REAL,
+    cached INTEGER,
+    precheck_duration REAL,
+    validation_duration REAL,
+    validation_cached INTEGER,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS test_outcomes (
+    attempt_id INTEGER NOT NULL REFERENCES attempts(id),
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message TEXT
+);
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    problem TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    model TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    validated INTEGER NOT NULL,
+    passed INTEGER NOT NULL,
+    first_sample_passed INTEGER NOT NULL,
+    first_pass_attempt INTEGER,
+    time_to_first_pass REAL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_run ON units(run_id);
+CREATE INDEX IF NOT EXISTS attempts_strategy ON attempts(dataset, strategy);
+CREATE INDEX IF NOT EXISTS attempts_model ON attempts(dataset, model);
+CREATE INDEX IF NOT EXISTS attempts_problem ON attempts(dataset, problem, strategy, created);
+CREATE INDEX IF NOT EXISTS attempts_run ON attempts(run_id);
+CREATE INDEX IF NOT EXISTS test_outcomes_attempt ON test_outcomes(attempt_id);
+"""
+
+
+@dataclass
+class AttemptRecord:
+    """One validated candidate."""
+    dataset: str
+    problem: str
+    strategy: str
+    model: str
+    passed: bool
+    status: str                          # passed, failed, rejected, llm_error, timeout, error
+    attempt: int = 1
+    repair: int = 0                      # feedback rounds before this candidate (0: the first answer)
+    compiled: Optional[bool] = None
+    error: Optional[str] = None
+    candidate_hash: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    llm_latency: Optional[float] = None
+    cached: Optional[bool] = None
+    precheck_duration: Optional[float] = None
+    validation_duration: Optional[float] = None
+    validation_cached: Optional[bool] = None
+    tests: List[tuple] = field(default_factory=list)    # (name, status, message)
+
+
+@dataclass
+class UnitRecord:
+    """All samples of one (problem, strategy) pair."""
+    dataset: str
+    problem: str
+    strategy: str
+    model: str
+    samples: int                         # samples requested (k)
+    validated: int                       # samples actually validated (the rest were cancelled or skipped)
+    passed: bool                         # any sample passed (pass@k)
+    first_sample_passed: bool            # sample 1 passed (pass@1); sample 1 is never cancelled
+    first_pass_attempt: Optional[int] = None
+    time_to_first_pass: Optional[float] = None   # seconds from the start of the sweep
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def candidate_hash(code: Optional[str]) -> Optional[str]:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest() if code is not None else None
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + os.urandom(3).hex()
+
+def display_width(text: str) -> int:
+    """Terminal/markdown display width: wide characters such as the status emojis count twice."""
+    return sum(2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1 for ch in text)
+
+def markdown_table(headers: Sequence[str], rows: Sequence[Sequence]) -> str:
+    """A padded GitHub markdown table in the README's style."""
+    headers = [str(h) for h in headers]
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max([display_width(h)] + [display_width(row[i]) for row in rows]) for i, h in enumerate(headers)]
+
+    def line(values):
+        return "| " + " | ".join(v + " " * (w - display_width(v)) for v, w in zip(values, widths)) + " |"
+
+    lines = [line(headers), "|" + "|".join("-" * (w + 2) for w in widths) + "|"]
+    lines += [line(row) for row in rows]
+    return "\n".join(lines)
+
+def replace_table_after_heading(text: str, heading: str, table: str) -> str:
+    """Replace the first markdown table following heading (a whole line) with table."""
+    lines = text.splitlines()
+    try:
+        start = next(i for i, line in enumerate(lines) if line.strip() == heading)
+    except StopIteration:
+        return text.rstrip("\n") + f"\n\n{heading}\n{table}\n"
+    first = start + 1
+    while first < len(lines) and not lines[first].startswith("|"):
+        if lines[first].startswith("#"):
+            break
+        first += 1
+    last = first
+    while last < len(lines) and lines[last].startswith("|"):
+        last += 1
+    new_lines = lines[:first] + table.splitlines() + lines[last:]
+    return "\n".join(new_lines) + ("\n" if text.endswith("\n") else "")
+
+
+class ResultsStore:
+    """SQLite-backed, append-only results table shared by threads and processes."""
+
+    def __init__(self, db_path=DEFAULT_RESULTS_DB):
+        self.db_path = str(db_path)
+        if self.db_path != ":memory:":
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._memory_conn = None
+        self._write_lock = threading.Lock()
+        self._connect().executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Add the columns newer versions write to a database created by an older one."""
+        conn = self._connect()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(attempts)")}
+        for name, declaration in MIGRATIONS.items():
+            if name not in columns:
+                conn.execute(f"ALTER TABLE attempts ADD COLUMN {name} {declaration}")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.db_path == ":memory:":
+            # A private in-memory database has to be shared by all threads through one connection.
+            if self._memory_conn is None:
+                self._memory_conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+            return self._memory_conn
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def start_run(self, dataset: str, model: str = "", config: Optional[dict] = None, run_id: str = None) -> str:
+        run_id = run_id or new_run_id()
+        with self._write_lock:
+            self._connect().execute(
+                "INSERT OR IGNORE INTO runs (run_id, dataset, model, config, started) VALUES (?, ?, ?, ?, ?)",
+                (run_id, dataset, model, json.dumps(config or {}, sort_keys=True, default=str), time.time()))
+        return run_id
+
+    def record(self, run_id: str, record: AttemptRecord) -> int:
+        """Append one attempt (and its test outcomes); returns the row id."""
+        row = asdict(record)
+        tests = row.pop("tests")
+        row["run_id"] = run_id
+        row["created"] = time.time()
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        with self._write_lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute(f"INSERT INTO attempts ({columns}) VALUES ({placeholders})",
+                                      tuple(row.values()))
+                attempt_id = cursor.lastrowid
+                conn.executemany("INSERT INTO test_outcomes (attempt_id, name, status, message) VALUES (?, ?, ?, ?)",
+                                 [(attempt_id, *test) for test in tests])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return attempt_id
+
+    def record_unit(self, run_id: str, record: UnitRecord) -> int:
+        row = asdict(record)
+        row["run_id"] = run_id
+        row["created"] = time.time()
+        with self._write_lock:
+            cursor = self._connect().execute(
+                f"INSERT INTO units ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})", tuple(row.values()))
+        return cursor.lastrowid
+
+    def pass_at_k(self, group_by: Sequence[str] = ("strategy",), dataset: str = None,
+                  run_id: str = None) -> List[dict]:
+        """pass@1, pass@k, samples validated and time to first pass per group of units."""
+        unknown = [c for c in group_by if c not in GROUP_COLUMNS or c == "status"]
+        if unknown:
+            raise ValueError(f"cannot group units by {unknown}")
+        where, params = self._filters(dataset, run_id)
+        columns = ", ".join(group_by)
+        query = (f"SELECT {columns}, COUNT(*), MAX(samples), SUM(first_sample_passed), SUM(passed), "
+                 f"SUM(validated), AVG(time_to_first_pass) FROM units {where} GROUP BY {columns} ORDER BY {columns}")
+        rows = []
+        for values in self._connect().execute(query, params):
+            group = dict(zip(group_by, values[:len(group_by)]))
+            units, samples, first_passed, passed, validated, time_to_pass = values[len(group_by):]
+            group.update({"units": units, "k": samples, "pass_at_1": first_passed / units if units else 0.0,
+                          "pass_at_k": passed / units if units else 0.0, "validated": validated,
+                          "avg_time_to_first_pass": time_to_pass})
+            rows.append(group)
+        return rows
+
+    def pass_rates(self, group_by: Sequence[str] = ("strategy",), dataset: str = None,
+                   run_id: str = None) -> List[dict]:
+        """Attempts, passes and pass rate per group, e.g. group_by=("model", "strategy")."""
+        unknown = [c for c in group_by if c not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"cannot group by {unknown}; choose from {GROUP_COLUMNS}")
+        where, params = self._filters(dataset, run_id)
+        columns = ", ".join(group_by)
+        query = (f"SELECT {columns}, COUNT(*), SUM(passed), SUM(COALESCE(prompt_tokens, 0)), "
+                 f"SUM(COALESCE(completion_tokens, 0)), AVG(validation_duration) "
+                 f"FROM attempts {where} GROUP BY {columns} ORDER BY {columns}")
+        rows = []
+        for values in self._connect().execute(query, params):
+            group = dict(zip(group_by, values[:len(group_by)]))
+            attempts, passed, prompt_tokens, completion_tokens, avg_validation = values[len(group_by):]
+            group.update({"attempts": attempts, "passed": passed, "pass_rate": passed / attempts if attempts else 0.0,
+                          "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "avg_validation_duration": avg_validation})
+            rows.append(group)
+        return rows
+
+    def latest(self, dataset: str, run_id: str = None) -> Dict[tuple, dict]:
+        """The most recent attempt per (problem, strategy) with whether any attempt of it passed."""
+        where, params = self._filters(dataset, run_id)
+        query = (f"SELECT problem, strategy, MAX(passed), MAX(created), COUNT(*) FROM attempts {where} "
+                 f"GROUP BY problem, strategy")
+        return {(problem, strategy): {"passed": bool(passed), "created": created, "attempts": attempts}
+                for problem, strategy, passed, created, attempts in self._connect().execute(query, params)}
+
+    def latest_run(self, dataset: str) -> Optional[str]:
+        row = self._connect().execute("SELECT run_id FROM runs WHERE dataset = ? ORDER BY started DESC LIMIT 1",
+                                      (dataset,)).fetchone()
+        return row[0] if row else None
+
+    def test_outcomes(self, attempt_id: int) -> List[tuple]:
+        return self._connect().execute("SELECT name, status, message FROM test_outcomes WHERE attempt_id = ?",
+                                       (attempt_id,)).fetchall()
+
+    def _filters(self, dataset: str = None, run_id: str = None):
+        clauses, params = [], []
+        if dataset:
+            clauses.append("dataset = ?")
+            params.append(dataset)
+        if run_id:
+            clauses.append("run_id = ?")
+            params.append(run_id)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def results_table(self, dataset: str, strategies: Sequence[str], problems: Sequence[str] = None,
+                      run_id: str = None) -> str:
+        """Problem / Approach / Test Result table (the README's QuixBugs layout) from the stored rows."""
+        latest = self.latest(dataset, run_id)
+        if problems is None:
+            problems = sorted({problem for problem, _ in latest})
+        rows = []
+        for problem in problems:
+            for strategy in strategies:
+                outcome = latest.get((problem, strategy))
+                if outcome is not None:
+                    rows.append([problem, strategy, PASSED_LABEL if outcome["passed"] else FAILED_LABEL])
+        return markdown_table(["Problem", "Approach", "Test Result"], rows)
+
+    def update_readme(self, readme: Path, dataset: str, strategies: Sequence[str],
+                      heading: str = QUIXBUGS_README_HEADING, run_id: str = None):
+        """Regenerate the results table under heading in the README from the stored rows."""
+        readme = Path(readme)
+        table = self.results_table(dataset, strategies, run_id=run_id)
+        readme.write_text(replace_table_after_heading(readme.read_text(), heading, table))
+        print(f"Updated '{heading}' table in {readme}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the results store or regenerate README tables from it")
+    parser.add_argument("--db", type=str, default=DEFAULT_RESULTS_DB)
+    parser.add_argument("--dataset", type=str, default="quixbugs")
+    parser.add_argument("--run_id", type=str, default=None, help="Restrict to one run (default: all runs)")
+    parser.add_argument("--group_by", type=str, default="strategy",
+                        help=f"Comma-separated columns to group pass rates by ({', '.join(GROUP_COLUMNS)})")
+    parser.add_argument("--update_readme", type=str, default=None, help="README to regenerate the results table in")
+    parser.add_argument("--strategies", type=str, nargs="*", default=["Zero-Shot", "Few-Shot", "Chain-of-Thought"])
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    group_by = [c.strip() for c in args.group_by.split(",") if c.strip()]
+    rows = store.pass_rates(group_by, args.dataset, args.run_id)
+    print(markdown_table(group_by + ["Attempts", "Passed", "Pass rate"],
+                         [[row[c] for c in group_by] + [row["attempts"], row["passed"], f"{row['pass_rate']:.1%}"]
+                          for row in rows]))
+    # Units have no status column; pass@k is only shown for the other groupings.
+    units = store.pass_at_k(group_by, args.dataset, args.run_id) if "status" not in group_by else []
+    if units:
+        print(markdown_table(group_by + ["Units", "k", "pass@1", "pass@k", "Validated", "Avg time to pass (s)"],
+                             [[row[c] for c in group_by] + [row["units"], row["k"], f"{row['pass_at_1']:.1%}",
+                                                            f"{row['pass_at_k']:.1%}", row["validated"],
+                                                            "-" if row["avg_time_to_first_pass"] is None
+                                                            else f"{row['avg_time_to_first_pass']:.1f}"]
+                              for row in units]))
+    if args.update_readme:
+        store.update_readme(Path(args.update_readme), args.dataset, args.strategies, run_id=args.run_id)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Append-only journal of the units of work of a run, so a crashed or interrupted
+run can be restarted and continue where it stopped.
+
+Each line of the journal is one JSON event:
+
+    {"event": "run", "run_id": ..., "config": {...}}
+    {"event": "started", "unit": ["GCD", "Few-Shot"], "time": ...}
+    {"event": "done", "unit": ["GCD", "Few-Shot"], "result": {...}, "time": ...}
+
+Events are appended with a single write of a complete line followed by fsync,
+so a crash can at worst leave a truncated last line, which is ignored when the
+journal is read back. A unit that has a "started" event but no "done" event
+was interrupted; callers clean up after it before running it again.
+
+A journal belongs to one run configuration: resuming it with a different one
+raises ConfigMismatch instead of mixing the results of both under one run id.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+
+class ConfigMismatch(ValueError):
+    """The journal was written by a run with a different configuration."""
+
+
+def unit_key(unit: Iterable) -> Tuple:
+    return tuple(unit)
+
+def normalize_config(config: Optional[dict]) -> Dict[str, Any]:
+    """The config as it reads back from the journal (tuples become lists, unknown types strings)."""
+    return json.loads(json.dumps(config or {}, default=str))
+
+
+class RunJournal:
+    """Completed and interrupted units of one run, persisted as JSONL."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.run_id: Optional[str] = None
+        self.config: Dict[str, Any] = {}
+        self.done: Dict[Tuple, Any] = {}
+        self.started: Set[Tuple] = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # truncated last line of a crashed run
+                kind = event.get("event")
+                if kind == "run":
+                    self.run_id = event.get("run_id")
+                    self.config = event.get("config") or {}
+                elif kind == "started":
+                    # A unit started again after it was done is being redone; the newer state wins.
+                    self.started.add(unit_key(event["unit"]))
+                    self.done.pop(unit_key(event["unit"]), None)
+                elif kind == "done":
+                    self.done[unit_key(event["unit"])] = event.get("result")
+        if self.done or self.started:
+            print(f"DEBUG: Resuming from journal {self.path}: {len(self.done)} unit(s) done, "
+                  f"{len(self.interrupted())} interrupted")
+
+    def _append(self, event: dict):
+        line = json.dumps(event, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def start_run(self, run_id: str, config: Optional[dict] = None) -> str:
+        """
+        Record the run id and config on first use; return the journal's
+        (possibly earlier) run id. ConfigMismatch if the journal's run had a
+        different config.
+        """
+        config = normalize_config(config)
+        if self.run_id is None:
+            self.run_id, self.config = run_id, config
+            self._append({"event": "run", "run_id": run_id, "config": self.config, "time": time.time()})
+        elif config != self.config:
+            changed = sorted(k for k in set(config) | set(self.config) if config.get(k) != self.config.get(k))
+            raise ConfigMismatch(f"{self.path} belongs to run {self.run_id} with a different config "
+                                 f"(changed: {', '.join(changed)})")
+        return self.run_id
+
+    def is_done(self, unit) -> bool:
+        return unit_key(unit) in self.done
+
+    def result(self, unit):
+        return self.done.get(unit_key(unit))
+
+    def interrupted(self) -> Set[Tuple]:
+        """Units that were started but never finished."""
+        return self.started - set(self.done)
+
+    def was_interrupted(self, unit) -> bool:
+        key = unit_key(unit)
+        return key in self.started and key not in self.done
+
+    def mark_started(self, unit):
+        self._append({"event": "started", "unit": list(unit), "time": time.time()})
+        self.started.add(unit_key(unit))
+        self.done.pop(unit_key(unit), None)
+
+    def mark_done(self, unit, result: Any = None):
+        self._append({"event": "done", "unit": list(unit), "result": result, "time": time.time()})
+        self.done[unit_key(unit)] = result
+
+    def reset(self):
+        """Delete the journal so the next run starts from scratch."""
+        self.path.unlink(missing_ok=True)
+        self.run_id, self.config = None, {}
+        self.done.clear()
+        self.started.clear()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Index of the Java classes in a checkout, built by walking the tree once.
+
+Defects4J projects disagree on where their sources live (src/main/java for
+Lang, src/java + src/test for Cli/Codec, src + test for Closure, source +
+tests for Chart, ...). Instead of probing hardcoded directories per class,
+SourceIndex parses every .java file once and maps each fully qualified class
+name to the file that declares it. Top-level classes that are not public
+(several per file) and nested classes are included, so "a.b.Outer.Inner" and
+"a.b.Outer$Inner" resolve to Outer.java. The source roots found along the way
+give the project layout.
+
+The index is cached in the checkout (SOURCE_INDEX_FILE) and in memory, so
+later lookups in the same checkout do not touch the tree at all.
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from java_source import declared_types, package_name
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+SOURCE_INDEX_FILE = ".source_index.json"
+INDEX_FORMAT_VERSION = 1
+SKIP_DIRS = {".git", ".svn", ".hg", ".gradle", ".idea", "build", "target", "node_modules", "__pycache__"}
+
+_loaded: Dict[str, "SourceIndex"] = {}
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def iter_java_files(root: Path):
+    """Yield every .java file under root, skipping VCS and build output directories."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+        for name in sorted(filenames):
+            if name.endswith(".java"):
+                yield Path(dirpath) / name
+
+def source_root(rel_path: Path, package: str) -> Optional[str]:
+    """The source root of a file (its path minus the package directories), or None if they do not match."""
+    package_parts = package.split(".") if package else []
+    parent_parts = rel_path.parent.parts
+    if package_parts and tuple(parent_parts[-len(package_parts):]) != tuple(package_parts):
+        return None
+    root_parts = parent_parts[:len(parent_parts) - len(package_parts)]
+    return str(Path(*root_parts)) if root_parts else "."
+
+def is_test_root(root: str) -> bool:
+    return any(part.lower() in ("test", "tests") for part in Path(root).parts)
+
+
+class SourceIndex:
+    """Fully qualified class name -> source file, for one checkout."""
+
+    def __init__(self, root: Path, classes: Dict[str, List[str]], roots: Dict[str, int]):
+        self.root = Path(root)
+        self.classes = classes          # FQCN -> relative paths, best candidate first
+        self.roots = roots              # source root -> number of files under it
+
+    @classmethod
+    def build(cls, root: Path) -> "SourceIndex":
+        root = Path(root).resolve()
+        start = time.perf_counter()
+        found = []
+        roots = Counter()
+        for path in iter_java_files(root):
+            try:
+                source = path.read_text(errors="replace")
+            except OSError as e:
+                print(f"DEBUG: Could not read {path}: {e}")
+                continue
+            rel_path = path.relative_to(root)
+            package = package_name(source)
+            file_root = source_root(rel_path, package)
+            if file_root is not None:
+                roots[file_root] += 1
+            names = declared_types(source) or [path.stem]
+            for name in names:
+                fqcn = f"{package}.{name}" if package else name
+                found.append((fqcn, file_root, str(rel_path)))
+
+        # When a name is declared more than once (fixtures, copies under resources, ...),
+        # prefer files under a proper source root, and among those the largest root.
+        def rank(entry):
+            fqcn, file_root, rel_path = entry
+            return (fqcn, file_root is None, -roots.get(file_root, 0), rel_path)
+
+        classes = {}
+        for fqcn, _, rel_path in sorted(found, key=rank):
+            classes.setdefault(fqcn, []).append(rel_path)
+        index = cls(root, classes, dict(roots.most_common()))
+        print(f"DEBUG: Indexed {len(classes)} classes in {sum(roots.values())} files under {root} "
+              f"in {time.perf_counter() - start:.2f}s (roots: {', '.join(index.roots) or 'none'})")
+        return index
+
+    @property
+    def layout(self) -> Dict[str, List[str]]:
+        """The detected source and test roots, largest first."""
+        return {
+            "source": [r for r in self.roots if not is_test_root(r)],
+            "test": [r for r in self.roots if is_test_root(r)],
+        }
+
+    def find(self, class_name: str) -> Optional[Path]:
+        """
+        Path of the file declaring class_name. Binary names (Outer$Inner) are
+        accepted; for names that are not indexed, such as anonymous classes
+        (Outer$1), the closest enclosing indexed class is used.
+        """
+        name = class_name.strip().replace("$", ".")
+        while name:
+            paths = self.classes.get(name)
+            if paths:
+                return self.root / paths[0]
+            name, _, _ = name.rpartition(".")
+        return None
+
+    def __contains__(self, class_name: str) -> bool:
+        return self.find(class_name) is not None
+
+    def __len__(self):
+        return len(self.classes)
+
+    def save(self, path: Path):
+        payload = {"format": INDEX_FORMAT_VERSION, "created": time.time(),
+                   "classes": self.classes, "roots": self.roots}
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, root: Path, path: Path) -> Optional["SourceIndex"]:
+        try:
+            payload = json.loads(path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if payload.get("format") != INDEX_FORMAT_VERSION:
+            return None
+        return cls(root, payload["classes"], payload["roots"])
+
+    @classmethod
+    def load_or_build(cls, root: Path, refresh: bool = False) -> "SourceIndex":
+        """The index of the checkout at root, from memory, from its index file, or built and saved."""
+        root = Path(root).resolve()
+        key = str(root)
+        if not refresh and key in _loaded:
+            return _loaded[key]
+        path = root / SOURCE_INDEX_FILE
+        index = None if refresh else cls.load(root, path)
+        if index is None:
+            index = cls.build(root)
+            index.save(path)
+        else:
+            print(f"DEBUG: Loaded source index for {root} ({len(index)} classes)")
+        _loaded[key] = index
+        return index
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the class-to-file index of a Java checkout")
+    parser.add_argument("--workdir", type=str, required=True, help="Checkout to index")
+    parser.add_argument("--refresh", action="store_true", help="Rebuild the index even if a cached one exists")
+    parser.add_argument("classes", nargs="*", help="Fully qualified class names to look up")
+    args = parser.parse_args()
+
+    index = SourceIndex.load_or_build(Path(args.workdir), args.refresh)
+    layout = index.layout
+    print(f"Source roots: {', '.join(layout['source']) or '-'}")
+    print(f"Test roots:   {', '.join(layout['test']) or '-'}")
+    for class_name in args.classes:
+        print(f"{class_name}: {index.find(class_name) or 'NOT FOUND'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Local stub of the OpenAI chat completions endpoint.
+
+Used to exercise the dispatch engine (and anything built on ChatOpenAI) without
+network access or API spend:
+
+    server, base_url = start_stub_server(latency=0.2)
+    llm = ChatOpenAI(model_name="gpt-4", base_url=base_url, api_key="stub", max_retries=0)
+
+The reply is produced by a `reply` callable that receives the list of request
+messages; by default it echoes the code found in the last user message between
+the FIXED CODE markers. `error_rate` makes a fraction of requests fail with
+HTTP `error_status` (429 by default, with Retry-After: 0) so that
+retry/backoff paths can be exercised. With `prompt_cache`
+the server mimics provider-side prompt caching: the longest run of leading
+messages it has already seen (at least CACHE_MIN_TOKENS, in CACHE_BLOCK_TOKENS
+steps) is reported as cached_tokens in the usage.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+CHARS_PER_TOKEN = 4
+# OpenAI caches prompts of 1024+ tokens, in 128-token increments of the longest previously seen prefix.
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+
+def default_reply(messages):
+    """Return the last user message wrapped in FIXED CODE markers."""
+    user_text = ""
+    for message in messages:
+        if message.get("role") == "user":
+            content = message.get("content", "")
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+            user_text = content
+    return f"The bug has been fixed.\n---FIXED CODE---\n{user_text}\n---END FIXED CODE---"
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    """Handles POST /v1/chat/completions with an OpenAI-compatible payload."""
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.record_request(request)
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            status = self.server.error_status
+            error_type = "rate_limit_error" if status == 429 else "server_error"
+            self._send_json(status, {"error": {"message": f"HTTP {status} (stub)", "type": error_type}},
+                            headers={"Retry-After": "0"})
+            return
+
+        time.sleep(self.server.latency)
+        messages = request.get("messages", [])
+        n = int(request.get("n") or 1)
+        replies = [self.server.reply(messages) for _ in range(n)]
+        prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in messages)
+        completion_tokens = sum(count_tokens(r) for r in replies)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if self.server.prompt_cache:
+            usage["prompt_tokens_details"] = {"cached_tokens": self.server.cached_prefix_tokens(messages)}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "stub")
+
+        if request.get("stream"):
+            self._stream(completion_id, model, replies, usage, request)
+            return
+
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}
+                for i, reply in enumerate(replies)
+            ],
+            "usage": usage,
+        })
+
+    def _stream(self, completion_id, model, replies, usage, request):
+        """Send the reply as server-sent events, a few characters per chunk."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        chunk_chars = self.server.stream_chunk_chars
+        try:
+            for index, reply in enumerate(replies):
+                for start in range(0, len(reply), chunk_chars):
+                    event = {
+                        "id": completion_id, "object": "chat.completion.chunk", "model": model,
+                        "choices": [{"index": index, "delta": {"content": reply[start:start + chunk_chars]},
+                                     "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if self.server.stream_delay:
+                        time.sleep(self.server.stream_delay)
+            final = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            if (request.get("stream_options") or {}).get("include_usage"):
+                final["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading (e.g. it cancelled the stream early).
+            self.server.record_cancelled()
+
+
+class StubChatServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, reply=None, error_rate=0.0, error_status=429,
+                 stream_chunk_chars=16, stream_delay=0.0, verbose=False, prompt_cache=False):
+        super().__init__(address, StubChatHandler)
+        self.latency = latency
+        self.reply = reply or default_reply
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_delay = stream_delay
+        self.verbose = verbose
+        self.prompt_cache = prompt_cache
+        self.requests = []
+        self.cancelled_streams = 0
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+
+    def record_request(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def record_cancelled(self):
+        with self._lock:
+            self.cancelled_streams += 1
+
+    def cached_prefix_tokens(self, messages) -> int:
+        """Tokens of the longest leading run of messages seen in an earlier request, as a provider would cache them."""
+        digest, tokens, cached, prefixes = hashlib.sha256(), 0, 0, []
+        with self._lock:
+            for message in messages:
+                digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+                tokens += count_tokens(str(message.get("content", "")))
+                key = digest.hexdigest()
+                if key in self._seen_prefixes:
+                    cached = tokens
+                prefixes.append(key)
+            self._seen_prefixes.update(prefixes)
+        if cached < CACHE_MIN_TOKENS:
+            return 0
+        return cached - cached % CACHE_BLOCK_TOKENS
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_stub_server(host="127.0.0.1", port=0, **kwargs):
+    """Start a StubChatServer on a background thread and return (server, base_url)."""
+    server = StubChatServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, server.base_url
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub chat server")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering each request")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error_status", type=int, default=429, help="HTTP status of those errors (e.g. 503)")
+    parser.add_argument("--prompt_cache", action="store_true", help="Report cached prompt tokens like a provider cache")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = StubChatServer((args.host, args.port), latency=args.latency,
+                            error_rate=args.error_rate, error_status=args.error_status, verbose=args.verbose, prompt_cache=args.prompt_cache)
+    print(f"Stub chat server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from checkout_cache import CheckoutCache
+
+FAKE_DEFECTS4J = Path(__file__).resolve().parent / "fake_defects4j"
+
+
+@pytest.fixture
+def d4j_log(tmp_path, monkeypatch):
+    log = tmp_path / "defects4j.log"
+    monkeypatch.setenv("FAKE_DEFECTS4J_LOG", str(log))
+    return log
+
+def calls(log: Path, command: str) -> list:
+    if not log.exists():
+        return []
+    return [line for line in log.read_text().splitlines() if line.startswith(command + " ")]
+
+def make_cache(tmp_path, **kwargs) -> CheckoutCache:
+    return CheckoutCache(tmp_path / "cache", link_mode="copy", defects4j=str(FAKE_DEFECTS4J), **kwargs)
+
+
+def test_manifest_reuse(tmp_path, d4j_log):
+    cache = make_cache(tmp_path)
+    first = cache.working_copy("Lang", "1b", tmp_path / "work1")
+    second = cache.working_copy("Lang", "1b", tmp_path / "work2")
+
+    assert len(calls(d4j_log, "checkout")) == 1
+    assert len(calls(d4j_log, "compile")) == 1
+    for work in (first, second):
+        assert (work / "target" / "classes" / "Lang.class").exists()
+        assert "1b" in (work / "src" / "main" / "java" / "Lang.java").read_text()
+
+def test_corrupted_tree_is_rebuilt(tmp_path, d4j_log):
+    cache = make_cache(tmp_path)
+    tree = cache.ensure("Lang", "1b")
+    (tree / "src" / "main" / "java" / "Lang.java").write_text("corrupted, and longer than the original file\n")
+
+    cache.ensure("Lang", "1b")
+
+    assert len(calls(d4j_log, "checkout")) == 2
+    assert "1b" in (tree / "src" / "main" / "java" / "Lang.java").read_text()
+
+def test_concurrent_ensure_builds_once(tmp_path, d4j_log, monkeypatch):
+    monkeypatch.setenv("FAKE_DEFECTS4J_DELAY", "0.5")
+    cache = make_cache(tmp_path)
+    errors = []
+
+    def worker(index):
+        try:
+            cache.working_copy("Lang", "1b", tmp_path / f"work{index}")
+        except Exception as e:  # surfaced by the assertion below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(calls(d4j_log, "checkout")) == 1
+    for i in range(4):
+        assert (tmp_path / f"work{i}" / "target" / "classes" / "Lang.class").exists()
+
+def test_least_recently_used_version_is_evicted(tmp_path, d4j_log):
+    cache = make_cache(tmp_path)
+    cache.ensure("Lang", "1b")
+    size = next(manifest["bytes"] for _, _, manifest in cache.entries())
+    cache.max_bytes = 2 * size
+
+    cache.ensure("Lang", "2b")
+    cache.ensure("Lang", "1b")  # now more recently used than 2b
+    cache.ensure("Lang", "3b")
+
+    cached = sorted(version for _, version, _ in cache.entries())
+    assert cached == ["1b", "3b"]
+    assert not cache.entry_dir("Lang", "2b").exists()
@@ -0,0 +1,30 @@
+import subprocess
+from pathlib import Path
+
+from bug_index import BugRecord
+from defects4j_validator import Defects4JValidator
+
+FAKE_DEFECTS4J = Path(__file__).resolve().parent / "fake_defects4j"
+CLASSES = {"Foo": "class Foo { int f() { return 1; } }\n", "Bar": "class Bar { int b() { return 2; } }\n"}
+
+
+def test_restored_sources_are_recompiled_for_the_next_candidate(tmp_path):
+    checkout = tmp_path / "checkout"
+    package = checkout / "src" / "main" / "java" / "org" / "example"
+    package.mkdir(parents=True)
+    for name, code in CLASSES.items():
+        (package / f"{name}.java").write_text("package org.example;\n" + code)
+    subprocess.run([str(FAKE_DEFECTS4J), "compile", "-w", str(checkout)], check=True)
+    bug = BugRecord(bug_id="1", modified=["org.example.Foo", "org.example.Bar"])
+    validator = Defects4JValidator("Fake", "1b", checkout, bug, size=1, pool_root=tmp_path / "pool",
+                                   baseline_dir=tmp_path / "baseline", stages=(), defects4j=str(FAKE_DEFECTS4J))
+    foo = "package org.example;\nclass Foo { int f() { return 10; } }\n"
+    bar = "package org.example;\nclass Bar { int b() { return 20; } }\n"
+
+    with validator:
+        assert validator.validate(foo, "org.example.Foo").passed
+        assert validator.validate(bar, "org.example.Bar").passed
+        classes = tmp_path / "pool" / "ws-0" / "target" / "classes" / "org" / "example"
+        # The workspace now holds candidate B's Bar and the buggy Foo, not candidate A's Foo.
+        assert (classes / "Bar.class").read_bytes().endswith(bar.encode())
+        assert (classes / "Foo.class").read_bytes().endswith(b"return 1; } }\n")
@@ -0,0 +1,52 @@
+from bug_index import BugRecord, TriggerTest
+from fault_localization import localization_file, localize
+
+FOO = """package org.example;
+
+class Foo {
+    int f(int x) {
+        return x + 1;
+    }
+}
+"""
+
+
+class FakeCoverage:
+    """Every test covers line 5 of Foo; the trigger test fails when `fails` is set."""
+    name = "fake"
+
+    def __init__(self, fails: bool):
+        self.fails = fails
+        self.runs = 0
+
+    def run(self, test):
+        self.runs += 1
+        return {"org.example.Foo": {5}}, self.fails and test.endswith("::testF")
+
+    def close(self):
+        pass
+
+def test_localization_without_a_failing_test_is_not_cached(tmp_path):
+    checkout = tmp_path / "checkout"
+    (checkout / "src" / "org" / "example").mkdir(parents=True)
+    (checkout / "src" / "org" / "example" / "Foo.java").write_text(FOO)
+    bug = BugRecord(bug_id="1", modified=["org.example.Foo"],
+                    trigger_tests=[TriggerTest("org.example.FooTest", "testF")])
+    runners = []
+
+    def make_runner(fails):
+        def make(work_dir, classes):
+            runners.append(FakeCoverage(fails))
+            return runners[-1]
+        return make
+
+    localize(bug, "Fake", "1b", checkout, make_runner(False), cache_dir=tmp_path / "cache")
+    assert not localization_file(tmp_path / "cache", "Fake", "1b").exists()
+
+    localized = localize(bug, "Fake", "1b", checkout, make_runner(True), cache_dir=tmp_path / "cache")
+    assert len(runners) == 2
+    assert localization_file(tmp_path / "cache", "Fake", "1b").exists()
+    assert localized.regions[0].file == "Foo.java"
+
+    localize(bug, "Fake", "1b", checkout, make_runner(True), cache_dir=tmp_path / "cache")
+    assert len(runners) == 2
@@ -0,0 +1,28 @@
+from java_source import members
+
+
+def names(source: str) -> list:
+    return [(m.kind, m.name) for m in members(source)]
+
+
+def test_field_names_ignore_commas_in_type_arguments():
+    source = """
+    class Cache {
+        private Map<String, List<Integer>> map;
+        private final Map<String, Map<Integer, String>> nested = new HashMap<>();
+        int a, b = 1;
+        Map<K, V>[] buckets;
+        void clear() { map.clear(); }
+    }
+    """
+    assert names(source) == [
+        ("field", "map"),
+        ("field", "nested"),
+        ("field", "a"),
+        ("field", "buckets"),
+        ("method", "clear"),
+    ]
+
+def test_field_names_ignore_annotation_arguments():
+    source = "class A { @SuppressWarnings(value = \"unchecked\") List<String> items = new ArrayList<>(); }"
+    assert names(source) == [("field", "items")]
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+import llm_dispatch
+from llm_dispatch import RETRYABLE_STATUS_CODES, run_dispatch
+from stub_chat_server import start_stub_server
+
+
+class StubHTTPError(Exception):
+    """HTTP error shaped like the openai client's (status_code, response.headers)."""
+
+    def __init__(self, error: urllib.error.HTTPError):
+        super().__init__(f"HTTP {error.code}")
+        self.status_code = error.code
+        self.response = SimpleNamespace(status_code=error.code, headers=dict(error.headers))
+
+
+class StubClient:
+    """
+    Minimal chat model for the stub server, using only the standard library
+    (the tests must not need langchain_openai). Exposes what the dispatch
+    engine uses of ChatOpenAI: ainvoke() returning content and token usage.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.model_name = "stub"
+
+    def _post(self, prompt: str) -> dict:
+        body = json.dumps({"model": self.model_name, "messages": [{"role": "user", "content": prompt}]})
+        request = urllib.request.Request(f"{self.base_url}/chat/completions", data=body.encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise StubHTTPError(e) from None
+
+    async def ainvoke(self, prompt):
+        payload = await asyncio.to_thread(self._post, prompt)
+        return SimpleNamespace(content=payload["choices"][0]["message"]["content"], usage_metadata=None,
+                               response_metadata={"token_usage": payload["usage"]})
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        server, base_url = start_stub_server(**kwargs)
+        servers.append(server)
+        return server, StubClient(base_url)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def echo(messages) -> str:
+    return messages[-1]["content"]
+
+
+def test_results_keep_input_order(stub):
+    def slow_echo(messages):
+        time.sleep(random.uniform(0, 0.05))
+        return echo(messages)
+
+    _, llm = stub(reply=slow_echo)
+    prompts = [(f"key{i}", f"prompt {i}") for i in range(20)]
+
+    results = run_dispatch(llm, prompts, concurrency=8)
+
+    assert [r.key for r in results] == [key for key, _ in prompts]
+    assert [r.text for r in results] == [prompt for _, prompt in prompts]
+    assert all(r.ok and r.usage["total_tokens"] > 0 for r in results)
+
+def test_concurrency_cap(stub):
+    lock = threading.Lock()
+    in_flight = {"now": 0, "peak": 0}
+
+    def counting_echo(messages):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        time.sleep(0.1)
+        with lock:
+            in_flight["now"] -= 1
+        return echo(messages)
+
+    _, llm = stub(reply=counting_echo)
+
+    results = run_dispatch(llm, [(i, f"prompt {i}") for i in range(9)], concurrency=3)
+
+    assert all(r.ok for r in results)
+    assert in_flight["peak"] == 3
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retryable_errors_are_retried_after_retry_after(stub, monkeypatch, status):
+    assert status in RETRYABLE_STATUS_CODES
+    server, llm = stub(reply=echo, error_rate=1.0, error_status=status)
+    record_request = server.record_request
+
+    def fail_twice(request):
+        record_request(request)
+        if len(server.requests) > 2:
+            server.error_rate = 0.0
+
+    server.record_request = fail_twice
+    # Retry-After: 0 must be honoured as "retry now", not replaced by the backoff.
+    monkeypatch.setattr(llm_dispatch, "backoff_delay", lambda attempt: pytest.fail("backoff used despite Retry-After"))
+
+    [result] = run_dispatch(llm, [("gcd", "prompt")], max_retries=3)
+
+    assert result.ok and result.text == "prompt"
+    assert result.attempts == 3
+    assert len(server.requests) == 3
+
+def test_retries_give_up_after_max_retries(stub):
+    server, llm = stub(reply=echo, error_rate=1.0)
+
+    [result] = run_dispatch(llm, [("gcd", "prompt")], max_retries=1)
+
+    assert not result.ok and "429" in result.error
+    assert result.attempts == 2 and len(server.requests) == 2
+
+def test_requests_per_minute_throttles_once_the_bucket_is_empty(stub):
+    # The bucket starts full (120 requests); the 121st waits 60 / 120 = 0.5s for a refill.
+    server, llm = stub(reply=lambda messages: "ok")
+    prompts = [(i, f"prompt {i}") for i in range(121)]
+
+    start = time.perf_counter()
+    results = run_dispatch(llm, prompts, concurrency=32, requests_per_minute=120)
+    elapsed = time.perf_counter() - start
+
+    assert all(r.ok for r in results) and len(server.requests) == 121
+    assert elapsed >= 0.45
+
+def test_tokens_per_minute_throttles_after_a_large_prompt(stub):
+    # The first prompt (60 estimated tokens) empties a 60 tokens/minute bucket,
+    # so the one-token prompt after it waits about a second for the refill.
+    server, llm = stub(reply=lambda messages: "ok")
+    prompts = [("large", "x" * 240), ("small", "y")]
+    finished = {}
+
+    start = time.perf_counter()
+    results = run_dispatch(llm, prompts, concurrency=2, tokens_per_minute=60,
+                           on_result=lambda r: finished.setdefault(r.key, time.perf_counter() - start))
+
+    assert all(r.ok for r in results) and len(server.requests) == 2
+    assert finished["large"] < 0.5
+    assert finished["small"] >= 0.9
@@ -0,0 +1,51 @@
+from patch_apply import apply_patch, parse_unified_diff
+
+GCD = """public class GCD {
+    public static int gcd(int a, int b) {
+        if (b == 0) {
+            return a;
+        } else {
+            return gcd(a % b, b);
+        }
+    }
+}
+"""
+FIXED = GCD.replace("gcd(a % b, b)", "gcd(b, a % b)")
+
+
+def test_hunk_counts_end_the_hunk_before_trailing_text():
+    response = """@@ -5,3 +5,3 @@
+         } else {
+-            return gcd(a % b, b);
++            return gcd(b, a % b);
+         }
+The arguments of the recursive call were swapped.
+"""
+    [hunk] = parse_unified_diff(response)
+    assert len(hunk.old) == 3 and len(hunk.new) == 3
+    assert apply_patch(GCD, response).code == FIXED
+
+def test_too_small_hunk_counts_keep_the_remaining_diff_lines():
+    response = """@@ -5,2 +5,2 @@
+         } else {
+-            return gcd(a % b, b);
++            return gcd(b, a % b);
+         }
+
+Done.
+"""
+    [hunk] = parse_unified_diff(response)
+    assert hunk.old[-1].strip() == "}" and hunk.new[-1].strip() == "}"
+    assert apply_patch(GCD, response).code == FIXED
+
+def test_hunk_without_counts_ends_at_blank_line_before_text():
+    response = """@@ @@
+-            return gcd(a % b, b);
++            return gcd(b, a % b);
+
+This swaps the arguments, so the remainder shrinks on every call.
+"""
+    [hunk] = parse_unified_diff(response)
+    assert hunk.old == ["            return gcd(a % b, b);"]
+    assert hunk.new == ["            return gcd(b, a % b);"]
+    assert apply_patch(GCD, response).code == FIXED
@@ -0,0 +1,17 @@
+from precheck import parse_check
+
+
+def test_fence_lines_are_rejected():
+    code = "```java\npublic class GCD {\n}\n```\n"
+    problems = parse_check(code, "GCD")
+    assert any("markdown code fences" in p for p in problems)
+
+def test_backticks_in_strings_and_comments_are_accepted():
+    code = """public class Render {
+    // Wraps code in ``` fences for the README.
+    static String fence(String code) {
+        return "```java\\n" + code + "\\n```";
+    }
+}
+"""
+    assert parse_check(code, "Render") == []
@@ -0,0 +1,123 @@
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+import quixbugs_harness
+from jvm_runner import ValidationResult
+from llm_dispatch import DispatchResult
+from results_store import ResultsStore
+
+KEY = ("GCD", "Zero-Shot")
+
+
+@pytest.fixture
+def quixbugs(tmp_path, monkeypatch):
+    (tmp_path / "java_programs").mkdir()
+    (tmp_path / "java_testcases" / "junit").mkdir(parents=True)
+    (tmp_path / "java_programs" / "GCD.java").write_text("package java_programs;\npublic class GCD {}\n")
+    (tmp_path / "java_testcases" / "junit" / "GCD_TEST.java").write_text("public class GCD_TEST {}\n")
+    monkeypatch.setattr(quixbugs_harness, "PROMPT_STRATEGIES", quixbugs_harness.PROMPT_STRATEGIES[:1])
+    return tmp_path
+
+class FakeValidator:
+    """Candidates starting with PASS pass; `gate` holds passing candidates until it is set."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.gate = threading.Event()
+        self.gate.set()
+        self.validated = []
+
+    def validate(self, problem_name, fixed_code):
+        self.validated.append(fixed_code)
+        passed = fixed_code.startswith("PASS")
+        if passed:
+            assert self.gate.wait(5)
+        return ValidationResult(passed=passed, compiled=True)
+
+    def make(self, *args, **kwargs):
+        @contextmanager
+        def session():
+            yield self.validate
+
+        return self.validate, lambda: None, self.workers, session
+
+def run(quixbugs, monkeypatch, validator, samples, dispatch):
+    """Run the sweep with `dispatch(on_candidate, skip)` standing in for the LLM requests."""
+    def generate_candidates(llm, problem_names, *args, on_candidate, skip, **kwargs):
+        dispatch(on_candidate, skip)
+
+    store = ResultsStore(":memory:")
+    units = []
+    record_unit = store.record_unit
+    store.record_unit = lambda run_id, record: units.append(record) or record_unit(run_id, record)
+    monkeypatch.setattr(quixbugs_harness, "generate_candidates", generate_candidates)
+    monkeypatch.setattr(quixbugs_harness, "make_validator", validator.make)
+    quixbugs_harness.automate_bug_fixing(SimpleNamespace(model_name="fake"), ["GCD"], str(quixbugs),
+                                         precheck="off", samples=samples, results_store=store)
+    return units
+
+def deliver(on_candidate, sample, code, **fields):
+    on_candidate(KEY, code, DispatchResult(key=KEY, text=code or "", sample=sample, **fields))
+
+
+def test_first_pass_cancels_queued_samples_but_not_sample_0(quixbugs, monkeypatch):
+    validator = FakeValidator(workers=1)
+    validator.gate.clear()
+
+    def dispatch(on_candidate, skip):
+        # Sample 1 passes while the single worker still has samples 0, 2 and 3 queued.
+        deliver(on_candidate, 1, "PASS 1")
+        for sample in (0, 2, 3):
+            deliver(on_candidate, sample, f"FAIL {sample}")
+        validator.gate.set()
+
+    [unit] = run(quixbugs, monkeypatch, validator, 4, dispatch)
+
+    assert validator.validated == ["PASS 1", "FAIL 0"]
+    assert unit.passed and not unit.first_sample_passed
+    assert unit.validated == 2 and unit.first_pass_attempt == 2
+
+def test_cancelled_samples_finish_the_unit_exactly_once(quixbugs, monkeypatch):
+    validator = FakeValidator(workers=1)
+    validator.gate.clear()
+
+    def dispatch(on_candidate, skip):
+        # Sample 0 is settled at once (request failed), so the unit is finished by
+        # the recursive settle of the last sample cancelled by the pass.
+        deliver(on_candidate, 0, None, error="RateLimitError")
+        deliver(on_candidate, 1, "PASS 1")
+        for sample in (2, 3):
+            deliver(on_candidate, sample, f"FAIL {sample}")
+        validator.gate.set()
+
+    units = run(quixbugs, monkeypatch, validator, 4, dispatch)
+
+    assert validator.validated == ["PASS 1"]
+    assert len(units) == 1
+    assert units[0].passed and units[0].validated == 1
+
+def test_samples_after_the_first_pass_are_dropped_except_sample_0(quixbugs, monkeypatch):
+    validator = FakeValidator(workers=1)
+
+    def dispatch(on_candidate, skip):
+        deliver(on_candidate, 1, "PASS 1")
+        deadline = time.monotonic() + 5
+        while not skip(KEY, 2):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert not skip(KEY, 0)
+        deliver(on_candidate, 2, "FAIL 2")   # was already in flight when sample 1 passed
+        deliver(on_candidate, 3, None, error="skipped", skipped=True)
+        deliver(on_candidate, 0, "FAIL 0")
+
+    units = run(quixbugs, monkeypatch, validator, 4, dispatch)
+
+    assert validator.validated == ["PASS 1", "FAIL 0"]
+    assert len(units) == 1
+    assert units[0].passed and units[0].validated == 2 and units[0].first_pass_attempt == 2
@@ -0,0 +1,13 @@
+from types import SimpleNamespace
+
+from response_cache import DEFAULT_API_BASE, cache_key, model_params
+
+
+def test_base_url_separates_cache_keys(monkeypatch):
+    monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+    real = SimpleNamespace(model_name="gpt-4", temperature=0, openai_api_base=None)
+    stub = SimpleNamespace(model_name="gpt-4", temperature=0, openai_api_base="http://127.0.0.1:8000/v1/")
+
+    assert model_params(real)["base_url"] == DEFAULT_API_BASE
+    assert model_params(stub)["base_url"] == "http://127.0.0.1:8000/v1"
+    assert cache_key("prompt", model_params(real)) != cache_key("prompt", model_params(stub))
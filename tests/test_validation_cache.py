@@ -0,0 +1,37 @@
+from jvm_runner import ValidationResult
+from precheck import parse_check
+from validation_cache import ValidationCache, normalized_hash
+
+CLEAN = """package java_programs;
+public class GCD {
+    public static int gcd(int a, int b) {
+        return b == 0 ? a : gcd(b, a % b);
+    }
+}
+"""
+FENCED = "```java\n" + CLEAN + "```\n"
+REFORMATTED = CLEAN.replace("    ", "\t").replace("{\n", "{ // fixed\n")
+
+
+def test_fenced_and_clean_twins_are_validated_separately(tmp_path):
+    cache = ValidationCache(tmp_path / "cache")
+    validated = []
+
+    def resolve(code):
+        def validate():
+            validated.append(code)
+            problems = parse_check(code, "java_programs.GCD")
+            if problems:
+                return ValidationResult(passed=False, compiled=False, diagnostics=problems), "rejected"
+            return ValidationResult(passed=True, compiled=True), "passed"
+
+        return cache.resolve("GCD", code, "GCD_TEST", validate)
+
+    assert normalized_hash(FENCED) != normalized_hash(CLEAN)
+    assert normalized_hash(REFORMATTED) == normalized_hash(CLEAN)
+
+    assert resolve(FENCED)[1:] == ("rejected", False)
+    assert resolve(CLEAN)[1:] == ("passed", False)
+    assert resolve(REFORMATTED)[1:] == ("passed", True)
+    assert resolve(FENCED)[1:] == ("rejected", True)
+    assert validated == [FENCED, CLEAN]
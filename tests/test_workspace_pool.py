@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+import workspace_pool
+from workspace_pool import WorkspacePool
+
+
+@pytest.fixture
+def source(tmp_path):
+    root = tmp_path / "source"
+    (root / "src").mkdir(parents=True)
+    (root / "src" / "Foo.java").write_text("class Foo {}\n")
+    return root
+
+def test_workspaces_are_cloned_outside_the_pool_lock(tmp_path, source, monkeypatch):
+    clone_tree = workspace_pool.clone_tree
+    lock = threading.Lock()
+    cloning = {"now": 0, "peak": 0}
+
+    def slow_clone_tree(*args, **kwargs):
+        with lock:
+            cloning["now"] += 1
+            cloning["peak"] = max(cloning["peak"], cloning["now"])
+        time.sleep(0.2)
+        with lock:
+            cloning["now"] -= 1
+        return clone_tree(*args, **kwargs)
+
+    monkeypatch.setattr(workspace_pool, "clone_tree", slow_clone_tree)
+    pool = WorkspacePool(source, size=3, pool_root=tmp_path / "pool", mode="copy")
+    acquired = []
+    threads = [threading.Thread(target=lambda: acquired.append(pool.acquire())) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cloning["peak"] == 3
+    assert sorted(ws.root.name for ws in acquired) == ["ws-0", "ws-1", "ws-2"]
+
+def test_failed_clone_gives_its_slot_back(tmp_path, source, monkeypatch):
+    clone_tree = workspace_pool.clone_tree
+    failures = [OSError("disk full")]
+
+    def flaky_clone_tree(source_root, root, *args, **kwargs):
+        clone_tree(source_root, root, *args, **kwargs)
+        if failures:
+            raise failures.pop()
+
+    monkeypatch.setattr(workspace_pool, "clone_tree", flaky_clone_tree)
+    pool = WorkspacePool(source, size=1, pool_root=tmp_path / "pool", mode="copy")
+
+    with pytest.raises(OSError):
+        pool.acquire()
+    workspace = pool.acquire(timeout=1)
+
+    assert workspace.root.name == "ws-0"
+    assert (workspace.root / "src" / "Foo.java").read_text() == "class Foo {}\n"
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Token-aware chunking of the combined Defects4J code for prompt series.
+
+The prompt series for every template are cut from the same combined code. The
+old approach created a TokenTextSplitter per template and re-tokenized the
+whole corpus each time. Here the tokenizer is loaded once per process and the
+corpus is encoded once (file by file, so per-file token counts come for free).
+Chunk boundaries are then computed once against the largest static part of
+all templates, so the same token spans fit every template and all series are
+rendered from them.
+
+Chunks end on a file boundary or a line break when one falls in the last
+SNAP_FRACTION of the chunk, so a line of code is not split across two prompts
+unless it has to be.
+"""
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+import tracing
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+DEFAULT_MODEL = "gpt-4o"
+FALLBACK_ENCODING = "o200k_base"
+DEFAULT_MAX_PROMPT_TOKENS = 30_000
+PART_SEPARATOR = "\n\n"
+TEXT_PLACEHOLDER = "{text}"
+SNAP_FRACTION = 0.05
+# Final marker added to the last chunk so that ChatGPT knows when the input is complete.
+FINAL_MARKER = "<<<END_OF_INPUT>>>"
+CONTINUATION_NOTICE = ("\n\nIMPORTANT: More input follows. "
+                       f"Do not generate the final solution until you receive the final marker '{FINAL_MARKER}'.")
+FINAL_SUFFIX = f"\n\n{FINAL_MARKER}"
+
+
+@dataclass
+class FileSpan:
+    name: str
+    start: int                  # token offsets into TokenizedCorpus.tokens
+    end: int
+
+    @property
+    def tokens(self) -> int:
+        return self.end - self.start
+
+
+@dataclass
+class ChunkSpan:
+    index: int
+    start: int
+    end: int
+    files: List[str] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return self.end - self.start
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str = DEFAULT_MODEL):
+    """tiktoken encoding for model_name, loaded once per process."""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+
+def encode(encoding, text: str) -> List[int]:
+    # Source code may legitimately contain strings like "<|endoftext|>"; encode them as plain text.
+    try:
+        return encoding.encode(text, disallowed_special=())
+    except TypeError:
+        return encoding.encode(text)
+
+def split_template(template: str) -> Tuple[str, str]:
+    """Split a prompt template into the static text before and after the {text} placeholder."""
+    head, placeholder, tail = template.partition(TEXT_PLACEHOLDER)
+    return (head, tail) if placeholder else (template, "")
+
+
+class TokenizedCorpus:
+    """The combined code, encoded once, with the token span of every file."""
+
+    def __init__(self, tokens: List[int], files: List[FileSpan], encoding):
+        self.tokens = tokens
+        self.files = files
+        self.encoding = encoding
+
+    @classmethod
+    def from_parts(cls, parts: Sequence[Tuple[str, str]], encoding=None, separator: str = PART_SEPARATOR):
+        """
+        Encode (name, text) parts joined by separator. The decoded corpus equals
+        separator.join(texts), i.e. the output of combine_relevant_files.
+        """
+        encoding = encoding or get_encoding()
+        with tracing.span("tokenize", files=len(parts)) as span:
+            separator_tokens = encode(encoding, separator) if separator else []
+            tokens, files = [], []
+            for i, (name, text) in enumerate(parts):
+                if i:
+                    tokens.extend(separator_tokens)
+                start = len(tokens)
+                tokens.extend(encode(encoding, text))
+                files.append(FileSpan(name, start, len(tokens)))
+                span.add("bytes", len(text))
+            span.set(tokens=len(tokens))
+        return cls(tokens, files, encoding)
+
+    @classmethod
+    def from_text(cls, text: str, encoding=None, name: str = "combined"):
+        return cls.from_parts([(name, text)], encoding)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def decode(self, start: int, end: int) -> str:
+        return self.encoding.decode(self.tokens[start:end])
+
+    def count(self, text: str) -> int:
+        return len(encode(self.encoding, text))
+
+    def _ends_line(self, index: int) -> bool:
+        return self.encoding.decode(self.tokens[index:index + 1]).endswith("\n")
+
+    def _break_point(self, start: int, end: int) -> int:
+        """Best chunk end in (start, end]: the last file boundary, else the last line break, in the snap window."""
+        window_start = max(start + 1, end - int((end - start) * SNAP_FRACTION))
+        file_starts = [f.start for f in self.files if window_start <= f.start <= end]
+        if file_starts:
+            return max(file_starts)
+        for i in range(end, window_start - 1, -1):
+            if self._ends_line(i - 1):
+                return i
+        return end
+
+    def chunk(self, budget: int) -> List[ChunkSpan]:
+        """Cut the corpus into spans of at most `budget` tokens."""
+        if budget <= 0:
+            raise ValueError(f"chunk budget must be positive, got {budget}")
+        chunks, start = [], 0
+        while start < len(self.tokens) or not chunks:
+            end = min(start + budget, len(self.tokens))
+            if end < len(self.tokens):
+                end = self._break_point(start, end)
+            files = [f.name for f in self.files if f.start < end and f.end > start]
+            chunks.append(ChunkSpan(len(chunks), start, end, files))
+            start = end
+        return chunks
+
+
+@dataclass
+class ChunkPlan:
+    """Shared chunk spans plus the static token cost of every template."""
+    corpus: TokenizedCorpus
+    chunks: List[ChunkSpan]
+    budget: int
+    max_prompt_tokens: int
+    static_tokens: Dict[str, int]
+
+    def render(self, template: str) -> List[str]:
+        """Render the prompt series of one template from the shared spans."""
+        head, tail = split_template(template)
+        prompts = []
+        for chunk in self.chunks:
+            suffix = FINAL_SUFFIX if chunk.index == len(self.chunks) - 1 else CONTINUATION_NOTICE
+            prompts.append(head + self.corpus.decode(chunk.start, chunk.end) + tail + suffix)
+        return prompts
+
+    def report(self) -> dict:
+        """Token counts per file and per chunk (prompt totals per template are estimates: static + chunk)."""
+        return {
+            "total_tokens": len(self.corpus),
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "chunk_budget": self.budget,
+            "template_static_tokens": self.static_tokens,
+            "files": [{"name": f.name, "tokens": f.tokens} for f in self.corpus.files],
+            "chunks": [
+                {
+                    "index": c.index + 1,
+                    "tokens": c.tokens,
+                    "files": c.files,
+                    "prompt_tokens": {name: static + c.tokens for name, static in self.static_tokens.items()},
+                }
+                for c in self.chunks
+            ],
+        }
+
+
+def template_static_tokens(templates: Dict[str, str], encoding=None) -> Dict[str, int]:
+    """Tokens each template adds around a chunk: its static text plus the longest chunk suffix."""
+    encoding = encoding or get_encoding()
+    suffix_tokens = max(len(encode(encoding, CONTINUATION_NOTICE)), len(encode(encoding, FINAL_SUFFIX)))
+    static_tokens = {}
+    for name, template in templates.items():
+        head, tail = split_template(template)
+        static_tokens[name] = len(encode(encoding, head)) + len(encode(encoding, tail)) + suffix_tokens
+    return static_tokens
+
+def plan_chunks(corpus: TokenizedCorpus, templates: Dict[str, str],
+                max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS) -> ChunkPlan:
+    """
+    Compute one set of chunk spans that fits every template: each prompt
+    (static template text + chunk + continuation notice or final marker) stays
+    within max_prompt_tokens.
+    """
+    static_tokens = template_static_tokens(templates, corpus.encoding)
+    budget = max_prompt_tokens - max(static_tokens.values(), default=0)
+    if budget <= 0:
+        raise ValueError(f"templates need {max(static_tokens.values())} tokens, "
+                         f"more than max_prompt_tokens={max_prompt_tokens}")
+    return ChunkPlan(corpus, corpus.chunk(budget), budget, max_prompt_tokens, static_tokens)
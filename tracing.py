@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Lightweight span instrumentation for the pipelines and the harness.
+
+Stages are wrapped in spans:
+
+    with tracing.span("checkout", project=project) as s:
+        ...
+        s.set(bytes=size, cache_hit=True)
+
+Each span records its start, duration, thread and free-form attributes
+(bytes, tokens, cache hits, ...). Tracing is off by default: span() then
+returns one shared no-op object, so instrumented code pays a function call
+and nothing else. After tracing.enable(), spans are collected in memory and
+can be exported as JSON lines (one span per line) and as a Chrome trace
+(chrome://tracing, https://ui.perfetto.dev).
+
+Spans of concurrent asyncio work (LLM requests) are created with
+concurrent=True and exported as async events, so overlapping requests on the
+event loop thread show up as separate tracks instead of a broken stack.
+"""
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+JSONL_SUFFIX = ".spans.jsonl"
+CHROME_SUFFIX = ".trace.json"
+# Numeric attributes that identify a span rather than measure it; summary() does not add them up.
+LABEL_ATTRS = {"sample"}
+
+
+class Span:
+    """One timed stage. Use as a context manager; attributes can be set while it runs."""
+
+    __slots__ = ("tracer", "name", "category", "attrs", "concurrent", "start_ns", "end_ns", "pid", "tid")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, attrs: dict, concurrent: bool):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+        self.concurrent = concurrent
+        self.start_ns = self.end_ns = 0
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+
+    def set(self, **attrs) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, name: str, amount=1) -> "Span":
+        """Accumulate a counter attribute (e.g. bytes copied over several files)."""
+        self.attrs[name] = self.attrs.get(name, 0) + amount
+        return self
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self)
+        return False
+
+    def to_dict(self, origin_ns: int) -> dict:
+        return {"name": self.name, "category": self.category, "start": (self.start_ns - origin_ns) / 1e9,
+                "duration": self.duration, "pid": self.pid, "tid": self.tid, "attrs": self.attrs}
+
+
+class NoopSpan:
+    """What span() returns while tracing is disabled."""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        return self
+
+    def add(self, name, amount=1):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracer:
+    """Collects finished spans of this process."""
+
+    def __init__(self):
+        self.origin_ns = time.perf_counter_ns()
+        self.origin_wall = time.time()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def span(self, name: str, category: str = "", concurrent: bool = False, **attrs) -> Span:
+        return Span(self, name, category, attrs, concurrent)
+
+    def record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finished(self) -> List[Span]:
+        with self._lock:
+            return sorted(self.spans, key=lambda s: s.start_ns)
+
+    def summary(self) -> Dict[str, dict]:
+        """Count, total/max duration and summed numeric attributes (booleans counted) per span name."""
+        totals = {}
+        for s in self.finished():
+            entry = totals.setdefault(s.name, {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += s.duration
+            entry["max"] = max(entry["max"], s.duration)
+            for key, value in s.attrs.items():
+                if key in LABEL_ATTRS:
+                    continue
+                if isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + int(value)
+                elif isinstance(value, (int, float)):
+                    entry[key] = entry.get(key, 0) + value
+        return totals
+
+    def write_jsonl(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            f.write(json.dumps({"trace_start": self.origin_wall, "pid": os.getpid()}) + "\n")
+            for s in self.finished():
+                f.write(json.dumps(s.to_dict(self.origin_ns), default=str) + "\n")
+
+    def chrome_events(self) -> List[dict]:
+        """
+        Trace events with wall-clock timestamps (microseconds since the epoch),
+        so traces of several processes line up when merged. Async event ids
+        carry the pid, so they stay unique in a merged trace.
+        """
+        events = []
+        origin_us = self.origin_wall * 1e6
+        for i, s in enumerate(self.finished()):
+            ts = origin_us + (s.start_ns - self.origin_ns) / 1e3
+            base = {"name": s.name, "cat": s.category or "stage", "pid": s.pid, "tid": s.tid}
+            args = {k: (v if isinstance(v, (int, float, str, bool)) or v is None else str(v)) for k, v in s.attrs.items()}
+            if s.concurrent:
+                event_id = f"{s.pid}.{i}"
+                events.append({**base, "ph": "b", "id": event_id, "ts": ts, "args": args})
+                events.append({**base, "ph": "e", "id": event_id, "ts": ts + (s.end_ns - s.start_ns) / 1e3})
+            else:
+                events.append({**base, "ph": "X", "ts": ts, "dur": (s.end_ns - s.start_ns) / 1e3, "args": args})
+        return events
+
+    def write_chrome_trace(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"traceEvents": self.chrome_events(), "displayTimeUnit": "ms"}, default=str))
+
+
+# ----------------------------
+# Module-level API
+# ----------------------------
+_tracer: Optional[Tracer] = None
+
+
+def enable() -> Tracer:
+    """Start collecting spans in this process (a fresh tracer each time)."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+def disable():
+    global _tracer
+    _tracer = None
+
+def enabled() -> bool:
+    return _tracer is not None
+
+def tracer() -> Optional[Tracer]:
+    return _tracer
+
+def span(name: str, category: str = "", concurrent: bool = False, **attrs):
+    """A Span of the active tracer, or the shared no-op span when tracing is off."""
+    if _tracer is None:
+        return NOOP_SPAN
+    return _tracer.span(name, category, concurrent, **attrs)
+
+def traced(name: str = None, category: str = ""):
+    """Decorator wrapping every call of a function in a span."""
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with _tracer.span(span_name, category, False):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def export(prefix) -> Optional[tuple]:
+    """Write <prefix>.spans.jsonl and <prefix>.trace.json; returns the two paths (None if tracing is off)."""
+    if _tracer is None:
+        return None
+    prefix = str(prefix)
+    jsonl, chrome = Path(prefix + JSONL_SUFFIX), Path(prefix + CHROME_SUFFIX)
+    _tracer.write_jsonl(jsonl)
+    _tracer.write_chrome_trace(chrome)
+    print(f"DEBUG: Wrote {len(_tracer.spans)} span(s) to {jsonl} and {chrome}")
+    return jsonl, chrome
+
+def print_summary():
+    """One DEBUG line per span name: count, total and max duration, summed attributes."""
+    if _tracer is None:
+        return
+    for name, entry in sorted(_tracer.summary().items(), key=lambda item: -item[1]["total"]):
+        extra = ", ".join(f"{k}={v:g}" if isinstance(v, float) else f"{k}={v}"
+                          for k, v in entry.items() if k not in ("count", "total", "max"))
+        print(f"DEBUG: [trace] {name}: {entry['count']} x, {entry['total']:.3f}s total, "
+              f"{entry['max']:.3f}s max" + (f"; {extra}" if extra else ""))
+
+def merge_chrome_traces(paths, output: Path):
+    """
+    Combine Chrome traces of several processes (e.g. one per batch worker) into
+    one file; their wall-clock timestamps put them on a common timeline.
+    """
+    events = []
+    for path in paths:
+        events.extend(json.loads(Path(path).read_text()).get("traceEvents", []))
+    Path(output).write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+    print(f"DEBUG: Merged {len(events)} event(s) from {len(paths)} trace(s) into {output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize span files or merge Chrome traces")
+    parser.add_argument("--summary", type=str, nargs="*", default=[], help="*.spans.jsonl files to summarize")
+    parser.add_argument("--merge", type=str, nargs="*", default=[], help="*.trace.json files to merge")
+    parser.add_argument("--output", type=str, default="merged.trace.json", help="Output of --merge")
+    args = parser.parse_args()
+
+    if args.summary:
+        merged = Tracer()
+        for path in args.summary:
+            with open(path) as f:
+                for line in f:
+                    data = json.loads(line)
+                    if "name" not in data:
+                        continue
+                    s = Span(merged, data["name"], data.get("category", ""), data.get("attrs", {}), False)
+                    s.start_ns = int(data["start"] * 1e9)
+                    s.end_ns = s.start_ns + int(data["duration"] * 1e9)
+                    merged.spans.append(s)
+        global _tracer
+        _tracer = merged
+        print_summary()
+    if args.merge:
+        merge_chrome_traces(args.merge, Path(args.output))
+
+if __name__ == "__main__":
+    main()
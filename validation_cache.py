@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of validation outcomes, keyed by normalized candidate.
+
+Many candidates differ from one another only in whitespace or comments
+(three strategies, several samples, reruns of a sweep), yet each used to be
+compiled and tested from scratch. A candidate is canonicalized into its Java
+token stream (comments and whitespace dropped, see normalize_candidate) and
+hashed; the outcome of validating it is
+stored per (bug, normalized hash, test selection), so an equivalent candidate
+is resolved without touching the build tools, in this run or a later one.
+
+Only deterministic outcomes are stored (passed, failed, rejected); timeouts
+and runner errors are always validated again. Concurrent validations of the
+same key within one process wait for the first one instead of running twice.
+
+Like response_cache.py, the cache is a single SQLite database in WAL mode,
+shared by threads and processes.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from java_source import code_tokens
+from jvm_runner import TestOutcome, ValidationResult
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+DEFAULT_CACHE_DIR = ".validation_cache"
+# Outcomes that depend only on the candidate and the tests, not on the machine or its load.
+CACHEABLE_STATUSES = ("passed", "failed", "rejected")
+# Bump when normalize_candidate changes, so old keys are not matched against the new canonical form.
+NORMALIZATION_VERSION = 2
+# Characters of Java's multi-character operators (==, >>>=, ->, ::, ...); only these can merge with a neighbour.
+OPERATOR_CHARS = set("=<>!&|+-*/%^~?:.")
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def normalize_candidate(code: str) -> str:
+    """
+    The candidate as one line of Java tokens: comments and whitespace are
+    dropped. Operator characters that touched stay together (`a--b` and
+    `a - -b` are different programs); every other token boundary becomes a
+    single space. Markdown fences are kept: the candidate is validated as
+    written, and a fenced one is rejected where its clean twin may pass.
+    """
+    tokens = code_tokens(code)
+    parts = []
+    previous = None
+    for token in tokens:
+        if previous is not None:
+            adjacent = previous.start + len(previous.text) == token.start
+            glued = adjacent and previous.text in OPERATOR_CHARS and token.text in OPERATOR_CHARS
+            parts.append("" if glued else " ")
+        parts.append(token.text)
+        previous = token
+    return "".join(parts)
+
+def normalized_hash(code: str) -> str:
+    """SHA-256 of the normalized candidate."""
+    return hashlib.sha256(f"{NORMALIZATION_VERSION}\n{normalize_candidate(code)}".encode("utf-8")).hexdigest()
+
+def file_digest(path) -> str:
+    """Short content digest of a file, for test selections that should change when the tests do."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()[:16]
+
+def result_to_json(result: ValidationResult) -> str:
+    return json.dumps(asdict(result))
+
+def result_from_json(payload: str) -> ValidationResult:
+    fields = json.loads(payload)
+    fields["tests"] = [TestOutcome(**t) for t in fields.get("tests", [])]
+    return ValidationResult(**fields)
+
+
+class ValidationCache:
+    """
+    Validation outcomes stored in SQLite, keyed by (bug, normalized candidate
+    hash, test selection).
+
+    With `bypass=True` lookups always miss (every candidate is validated) but
+    outcomes are still written, which refreshes stale entries.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, bypass: bool = False):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / "validations.sqlite"
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._key_locks = {}
+        self._key_locks_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS validations ("
+                " key TEXT PRIMARY KEY,"
+                " bug TEXT NOT NULL,"
+                " candidate_hash TEXT NOT NULL,"
+                " selection TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " result TEXT NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS validations_bug ON validations(bug)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread (and therefore per process); SQLite handles the locking.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def key(bug: str, candidate_hash: str, selection: str) -> str:
+        return hashlib.sha256(json.dumps([bug, candidate_hash, selection]).encode("utf-8")).hexdigest()
+
+    def _count(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._key_locks_lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, bug: str, candidate_hash: str, selection: str) -> Optional[Tuple[ValidationResult, str]]:
+        """(result, status) stored for an equivalent candidate, or None on a miss."""
+        if self.bypass:
+            self._count(False)
+            return None
+        key = self.key(bug, candidate_hash, selection)
+        conn = self._connect()
+        row = conn.execute("SELECT result, status FROM validations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(False)
+            return None
+        conn.execute("UPDATE validations SET hits = hits + 1, last_access = ? WHERE key = ?", (time.time(), key))
+        self._count(True)
+        return result_from_json(row[0]), row[1]
+
+    def put(self, bug: str, candidate_hash: str, selection: str, result: ValidationResult, status: str) -> bool:
+        """Store a deterministic outcome; returns whether it was stored."""
+        if status not in CACHEABLE_STATUSES or result.timed_out:
+            return False
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO validations (key, bug, candidate_hash, selection, status, result, created,"
+            " last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.key(bug, candidate_hash, selection), bug, candidate_hash, selection, status,
+             result_to_json(result), now, now),
+        )
+        return True
+
+    def resolve(self, bug: str, code: str, selection: str,
+                validate: Callable[[], Tuple[ValidationResult, str]]) -> Tuple[ValidationResult, str, bool]:
+        """
+        (result, status, cached) for a candidate: the stored outcome of an
+        equivalent candidate, or else validate()'s, which is stored if it is
+        deterministic. Concurrent calls for one key validate only once.
+        """
+        candidate_hash = normalized_hash(code)
+        with self._key_lock(self.key(bug, candidate_hash, selection)):
+            cached = self.get(bug, candidate_hash, selection)
+            if cached is not None:
+                result, status = cached
+                result.duration = 0.0
+                return result, status, True
+            result, status = validate()
+            self.put(bug, candidate_hash, selection, result, status)
+            return result, status, False
+
+    def clear(self, bug: str = None):
+        if bug is None:
+            self._connect().execute("DELETE FROM validations")
+        else:
+            self._connect().execute("DELETE FROM validations WHERE bug = ?", (bug,))
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this instance plus the size of the shared cache."""
+        entries, bugs = self._connect().execute(
+            "SELECT COUNT(*), COUNT(DISTINCT bug) FROM validations").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bugs": bugs,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the validation-result cache")
+    parser.add_argument("--cache_dir", type=str, default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--clear", action="store_true", help="Delete cached outcomes (of --bug only, if given)")
+    parser.add_argument("--bug", type=str, default=None, help="Bug or problem name, e.g. GCD or Lang-1b")
+    parser.add_argument("--hash", type=str, nargs="+", default=None,
+                        help="Print the normalized hash of these candidate files and whether they are cached")
+    args = parser.parse_args()
+
+    cache = ValidationCache(args.cache_dir)
+    if args.clear:
+        cache.clear(args.bug)
+        print(f"Cleared {cache.db_path}" + (f" for {args.bug}" if args.bug else ""))
+    for candidate in args.hash or []:
+        digest = normalized_hash(Path(candidate).read_text())
+        query = "SELECT bug, selection, status FROM validations WHERE candidate_hash = ?"
+        rows = cache._connect().execute(query, (digest,)).fetchall()
+        print(f"{candidate}: {digest}" + "".join(f"\n  {bug} [{selection}]: {status}" for bug, selection, status in rows))
+    stats = cache.stats()
+    print(f"{stats['entries']} cached outcome(s) of {stats['bugs']} bug(s) in {cache.db_path}")
+
+if __name__ == "__main__":
+    main()
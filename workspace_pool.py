@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Pool of isolated, cheaply cloned project trees for validating candidates.
+
+Each workspace is a copy of a source tree (e.g. the QuixBugs checkout) made
+with reflinks (copy-on-write) where the filesystem supports them, or with
+hardlinks otherwise. A candidate is written into a workspace with
+`Workspace.write_file`, which replaces the file atomically instead of writing
+through the link, so the shared source tree is never modified and a crash
+mid-validation cannot corrupt it.
+
+Workspaces are recycled: releasing one only re-links the files that were
+written, and build output directories (build/, .gradle/) are kept, so later
+validations in the same workspace get incremental builds. Restored files are
+touched (unless they share the source's inode), because a clone keeps the
+source's old mtime and an mtime-based build such as Ant's javac would
+otherwise keep the classes compiled from the candidate they replace.
+"""
+import filecmp
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Optional
+
+# ----------------------------
+# Configuration Constants
+# ----------------------------
+# Directories that are never cloned: VCS metadata and per-workspace build output.
+DEFAULT_EXCLUDES = (".git", "build", ".gradle", "__pycache__")
+# Files with these suffixes are leftovers of the old backup/restore flow.
+EXCLUDED_SUFFIXES = (".bak",)
+
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def reflink_supported(source_root: Path, target_dir: Path) -> bool:
+    """Check whether `cp --reflink=always` works between the two locations."""
+    probe = next((p for p in source_root.rglob("*") if p.is_file()), None)
+    if probe is None:
+        return False
+    target = target_dir / ".reflink_probe"
+    try:
+        result = subprocess.run(["cp", "--reflink=always", str(probe), str(target)],
+                                capture_output=True, text=True)
+        return result.returncode == 0
+    except OSError:
+        return False
+    finally:
+        if target.exists():
+            target.unlink()
+
+def iter_tree(source_root: Path, excludes: Iterable[str] = DEFAULT_EXCLUDES):
+    """Yield (relative_dir, file_names) for every directory of the tree, skipping excluded directories."""
+    excludes = set(excludes)
+    for dirpath, dirnames, filenames in os.walk(source_root):
+        dirnames[:] = [d for d in dirnames if d not in excludes]
+        rel_dir = Path(dirpath).relative_to(source_root)
+        yield rel_dir, [f for f in filenames if not f.endswith(EXCLUDED_SUFFIXES)]
+
+def clone_file(source: Path, target: Path, mode: str):
+    """Materialize `target` as a reflink, hardlink or copy of `source`."""
+    if mode == "hardlink":
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass  # e.g. across filesystems: fall back to a copy
+    elif mode == "reflink":
+        result = subprocess.run(["cp", "--reflink=always", "-p", str(source), str(target)],
+                                capture_output=True, text=True)
+        if result.returncode == 0:
+            return
+    shutil.copy2(source, target)
+
+def clone_tree(source_root: Path, target_root: Path, mode: str, excludes: Iterable[str] = DEFAULT_EXCLUDES) -> int:
+    """Clone every file of source_root into target_root; returns the number of files cloned."""
+    count = 0
+    for rel_dir, filenames in iter_tree(source_root, excludes):
+        (target_root / rel_dir).mkdir(parents=True, exist_ok=True)
+        for name in filenames:
+            target = target_root / rel_dir / name
+            if target.exists() or target.is_symlink():
+                target.unlink()
+            clone_file(source_root / rel_dir / name, target, mode)
+            count += 1
+    return count
+
+def restore_file(source: Path, target: Path, mode: str):
+    """Re-clone a rewritten file from its source, newer than anything built from the rewritten version."""
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    clone_file(source, target, mode)
+    if not os.path.samestat(source.stat(), target.stat()):
+        os.utime(target)
+
+def is_pristine(source: Path, target: Path, mode: str) -> bool:
+    """Cheap check that a cloned file still matches its source."""
+    try:
+        src_stat, dst_stat = source.stat(), target.stat()
+    except FileNotFoundError:
+        return False
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if mode == "hardlink":
+        if src_stat.st_ino == dst_stat.st_ino and src_stat.st_dev == dst_stat.st_dev:
+            return True
+        # Not linked (a copy fallback or a rewritten file): compare contents.
+        return filecmp.cmp(source, target, shallow=False)
+    # Reflinks and copies preserve the source mtime; any rewrite changes it.
+    return src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+
+class Workspace:
+    """One isolated clone of the source tree."""
+
+    def __init__(self, pool: "WorkspacePool", root: Path):
+        self.pool = pool
+        self.root = root
+        self.modified = set()
+
+    def path(self, rel_path) -> Path:
+        return self.root / rel_path
+
+    def write_file(self, rel_path, content: str):
+        """Atomically replace a file in this workspace without touching the shared source tree."""
+        target = self.root / rel_path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(tmp_name, target)
+        self.modified.add(Path(rel_path))
+
+    def reset(self):
+        """Bring every file written through write_file back to the source version."""
+        for rel_path in self.modified:
+            source = self.pool.source_root / rel_path
+            target = self.root / rel_path
+            if source.exists():
+                restore_file(source, target, self.pool.mode)
+            elif target.exists() or target.is_symlink():
+                target.unlink()
+        self.modified.clear()
+
+    def resync(self) -> int:
+        """Re-clone every file that no longer matches the source (used for workspaces left by a crashed run)."""
+        repaired = 0
+        for rel_dir, filenames in iter_tree(self.pool.source_root, self.pool.excludes):
+            (self.root / rel_dir).mkdir(parents=True, exist_ok=True)
+            for name in filenames:
+                source = self.pool.source_root / rel_dir / name
+                target = self.root / rel_dir / name
+                if not is_pristine(source, target, self.pool.mode):
+                    restore_file(source, target, self.pool.mode)
+                    repaired += 1
+        return repaired
+
+
+class WorkspacePool:
+    """
+    Fixed-size pool of Workspaces cloned from `source_root`.
+
+    `mode` is "reflink", "hardlink", "copy" or "auto" (reflink when supported,
+    otherwise `auto_fallback`, hardlink by default). Workspaces live under `pool_root` (a temporary
+    directory by default) and are created lazily the first time they are
+    needed; existing workspaces found under a persistent pool_root are
+    resynchronized with the source tree and reused.
+    """
+
+    def __init__(self, source_root, size: Optional[int] = None, pool_root=None, mode: str = "auto",
+                 excludes: Iterable[str] = DEFAULT_EXCLUDES, auto_fallback: str = "hardlink"):
+        self.source_root = Path(source_root).resolve()
+        self.size = size or os.cpu_count() or 1
+        self.excludes = tuple(excludes)
+        self._owns_pool_root = pool_root is None
+        self.pool_root = Path(pool_root or tempfile.mkdtemp(prefix="workspaces-")).resolve()
+        self.pool_root.mkdir(parents=True, exist_ok=True)
+        if mode == "auto":
+            mode = "reflink" if reflink_supported(self.source_root, self.pool_root) else auto_fallback
+        self.mode = mode
+        self._available = queue.LifoQueue()
+        # Indices of workspaces not created yet; a slot is reserved under the lock, cloned outside it.
+        self._unused_slots = list(range(self.size - 1, -1, -1))
+        self._lock = threading.Lock()
+        print(f"DEBUG: Workspace pool of {self.size} at {self.pool_root} (mode={self.mode})")
+
+    def _create(self, slot: int) -> Workspace:
+        root = self.pool_root / f"ws-{slot}"
+        workspace = Workspace(self, root)
+        if root.exists():
+            repaired = workspace.resync()
+            print(f"DEBUG: Reusing workspace {root} ({repaired} file(s) resynchronized)")
+        else:
+            try:
+                count = clone_tree(self.source_root, root, self.mode, self.excludes)
+            except BaseException:
+                shutil.rmtree(root, ignore_errors=True)
+                raise
+            print(f"DEBUG: Created workspace {root} ({count} file(s))")
+        return workspace
+
+    def acquire(self, timeout: Optional[float] = None) -> Workspace:
+        """Take a workspace from the pool, creating one if the pool is not full yet."""
+        try:
+            return self._available.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            slot = self._unused_slots.pop() if self._unused_slots else None
+        if slot is None:
+            return self._available.get(timeout=timeout)
+        # Cloning a large tree takes a while; other threads may take released workspaces meanwhile.
+        try:
+            return self._create(slot)
+        except BaseException:
+            with self._lock:
+                self._unused_slots.append(slot)
+            raise
+
+    def release(self, workspace: Workspace):
+        """Reset a workspace and return it to the pool."""
+        workspace.reset()
+        self._available.put(workspace)
+
+    @contextmanager
+    def workspace(self):
+        workspace = self.acquire()
+        try:
+            yield workspace
+        finally:
+            self.release(workspace)
+
+    def close(self):
+        """Remove the workspaces if the pool created its own temporary directory."""
+        if self._owns_pool_root:
+            shutil.rmtree(self.pool_root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()